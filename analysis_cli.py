@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+generate_patch_analysis.py 的命令行参数和 --server 客户端
+
+本模块只依赖标准库和轻量模块。--server 模式只需把参数转成一个请求发给常驻服务
+（见 analysis_server.py），generate_patch_analysis.py 作为脚本运行时在导入pandas/openpyxl
+之前先调用 run_thin_client()，客户端因此不承担分析模块的导入开销。
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import git_executor
+import report_formats
+import run_metrics
+from patch_id_store import DEFAULT_MAX_ENTRIES
+
+# 内存受限模式每块处理的源提交数
+BOUNDED_CHUNK_SIZE = 2000
+
+def parse_arguments():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description='分析两个Git分支之间的独有补丁差异',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""使用示例:
+  %(prog)s v6.15.8 openkylin-6.6-next
+  %(prog)s --source v6.15.8 --target openkylin-6.6-next
+  %(prog)s v6.15.8 openkylin-6.6-next --output my_analysis.xlsx
+  %(prog)s v6.15.8 openkylin-6.6-next --no-merge-base
+  %(prog)s v6.15.8 openkylin-6.6-next --low-memory --chunk-size 1000
+  %(prog)s v6.6.50 v6.6.8 --category RISC-V
+  %(prog)s v6.6.50 -t openkylin-6.6-next -t v6.1.100 -t partner-6.6
+  %(prog)s v6.6.50 v6.6.8 --server http://127.0.0.1:8765
+  %(prog)s v6.6.50 v6.6.8 --path kernel/sched --path include/linux/sched
+  %(prog)s v6.15.8 openkylin-6.6-next --metrics-json metrics.json --profile analysis.folded
+        """
+    )
+
+    # 位置参数（可选）
+    parser.add_argument('source', nargs='?', help='源分支（要分析其独有补丁的分支）')
+    parser.add_argument('target', nargs='?', help='目标分支（用于比较的基准分支）')
+
+    # 命名参数
+    parser.add_argument('-s', '--source', dest='source_named', help='源分支（要分析其独有补丁的分支）')
+    parser.add_argument('-t', '--target', dest='target_named', action='append',
+                        help='目标分支（用于比较的基准分支）；指定多次时与各目标分支一起比较，生成一份报告')
+    parser.add_argument('-o', '--output', help='输出文件名（默认: <源分支>-to-<目标分支>-diff.xlsx）')
+    parser.add_argument('--no-merge-base', action='store_true', help='不使用公共祖先优化，分析全部差异')
+    parser.add_argument('-j', '--jobs', type=int, default=git_executor.default_jobs(),
+                        help=f'所有阶段合计同时运行的git进程数（默认按CPU核数: {git_executor.default_jobs()}）')
+    parser.add_argument('--list-branches', action='store_true', help='列出所有可用的分支')
+    parser.add_argument('--no-upstream-match', action='store_true',
+                        help='不使用提交消息中的上游提交引用（commit <sha> upstream 等）快速匹配，全部通过patch-id比较')
+    parser.add_argument('--fuzzy', action='store_true',
+                        help='对独有补丁做近似重复检测（MinHash/LSH），报告上下文被调整的疑似等价backport')
+    parser.add_argument('--fuzzy-threshold', type=float, default=0.7,
+                        help='近似重复检测的相似度阈值（默认: 0.7）')
+    parser.add_argument('--rules', help='分类与补丁类型规则文件（TOML，默认: 脚本目录下的 patch_rules.toml）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量分析：记录本次结果，下次只处理两侧分支的新提交（变基或强推时自动完整分析）')
+    parser.add_argument('--state-file',
+                        help='增量分析的状态文件（默认: 缓存目录下的 analysis-state/<源分支>-to-<目标分支>.json）')
+    parser.add_argument('--no-maintainers', action='store_true',
+                        help='不按MAINTAINERS文件标注子系统和维护者')
+    parser.add_argument('--compact-category-sheets', action='store_true',
+                        help='分类工作表只包含关键列和指向独有补丁详情行的超链接，不重复完整提交信息')
+    parser.add_argument('--format', default='xlsx',
+                        help='输出格式，逗号分隔，可选 xlsx、parquet、jsonl、sqlite（默认: xlsx）')
+    parser.add_argument('--excel-engine', choices=['auto', 'xlsxwriter', 'openpyxl'], default='auto',
+                        help='Excel写入引擎（默认: auto，安装了xlsxwriter时优先使用）')
+    parser.add_argument('--cache-dir', help='持久化patch-id缓存目录（默认: .git/patch-analysis-cache）')
+    parser.add_argument('--no-cache', action='store_true', help='禁用持久化patch-id缓存')
+    parser.add_argument('--cache-max-entries', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help=f'持久化缓存的最大条目数，超出后淘汰最久未使用的条目（默认: {DEFAULT_MAX_ENTRIES}）')
+    parser.add_argument('--shared-cache', action='store_true',
+                        help='缓存目录位于多台主机共享的网络文件系统上（使用回滚日志代替WAL）')
+    parser.add_argument('--path', action='append', default=[],
+                        help='只分析改动了该路径的提交（git pathspec，交给git log筛选，可重复指定）')
+    parser.add_argument('--category', action='append', default=[],
+                        help='只分析属于该分类的提交：规则中的路径前缀交给git筛选，'
+                             '标题关键词命中的提交随后补充（可重复指定）')
+    parser.add_argument('--low-memory', action='store_true',
+                        help='内存受限模式：分块处理源提交，已完成的行暂存在临时文件中，峰值内存不随比较范围增长'
+                             '（不支持 --fuzzy 和 --incremental）')
+    parser.add_argument('--chunk-size', type=int, default=BOUNDED_CHUNK_SIZE,
+                        help=f'内存受限模式每块处理的源提交数（默认: {BOUNDED_CHUNK_SIZE}）')
+    parser.add_argument('--metrics-json', help='把本次分析的性能指标（各阶段耗时、git进程、缓存命中等）写入JSON文件')
+    parser.add_argument('--metrics-prom',
+                        help='把性能指标写成Prometheus textfile（供node_exporter的textfile collector采集）')
+    parser.add_argument('--profile',
+                        help='采集性能剖析数据写入该文件：.prof 为cProfile格式，.folded 为对所有线程采样的折叠栈')
+    parser.add_argument('--profile-format', choices=['cprofile', 'folded'],
+                        help='性能剖析格式（默认按 --profile 的扩展名判断）')
+    parser.add_argument('--server', metavar='ADDRESS',
+                        help='交给常驻分析服务执行（见 analysis_server.py），如 http://127.0.0.1:8765 或 unix:/路径')
+
+    args = parser.parse_args()
+
+    # 处理分支参数的优先级：命名参数 > 位置参数
+    source_branch = args.source_named or args.source
+    target_branches = args.target_named or ([args.target] if args.target else [])
+
+    return source_branch, list(dict.fromkeys(target_branches)), args
+
+def check_required_branches(source_branch, target_branches):
+    """源分支和目标分支都必须指定，否则打印用法并退出"""
+    if not source_branch or not target_branches:
+        print("❌ 错误: 必须指定源分支和目标分支")
+        print("\n使用方法:")
+        print("  python generate_patch_analysis.py <源分支> <目标分支>")
+        print("  python generate_patch_analysis.py --source <源分支> --target <目标分支>")
+        print("\n查看帮助: python generate_patch_analysis.py --help")
+        print("列出分支: python generate_patch_analysis.py --list-branches")
+        sys.exit(1)
+
+def default_output_file(source_branch, target_branches):
+    """未指定 --output 时的输出文件名"""
+    # 清理分支名称中的特殊字符，避免文件名问题
+    safe_source = re.sub(r'[^\w\-_.]', '_', source_branch)
+    safe_target = '+'.join(re.sub(r'[^\w\-_.]', '_', branch) for branch in target_branches)
+    return f"{safe_source}-to-{safe_target}-diff.xlsx"
+
+def check_option_conflicts(target_branches, args):
+    """检查互不兼容的选项，有冲突时打印错误并退出"""
+    if args.low_memory and (args.fuzzy or args.incremental or args.state_file):
+        print("❌ 错误: --low-memory 不支持 --fuzzy 和增量分析（--incremental/--state-file）")
+        sys.exit(1)
+
+    if len(target_branches) > 1 and (args.low_memory or args.fuzzy or args.incremental or args.state_file):
+        print("❌ 错误: 多个目标分支时不支持 --low-memory、--fuzzy 和增量分析（--incremental/--state-file）")
+        sys.exit(1)
+
+def run_remote_analysis(address, source_branch, target_branches, args, formats):
+    """把分析交给常驻服务执行：服务端的缓存和索引已经就绪，本进程只发送请求并打印结果
+
+    文件路径转换为绝对路径，由服务端直接写出；缓存和规则文件使用服务端启动时的设置。
+    """
+    if args.profile or args.rules or args.cache_dir or args.no_cache:
+        print("❌ 错误: --server 模式下缓存、规则文件和性能剖析由服务端决定，"
+              "不能使用 --cache-dir/--no-cache/--rules/--profile")
+        sys.exit(1)
+
+    payload = {
+        'source': source_branch,
+        'targets': target_branches,
+        'output': os.path.abspath(args.output),
+        'formats': formats,
+        'use_merge_base': not args.no_merge_base,
+        'use_upstream_match': not args.no_upstream_match,
+        'fuzzy_threshold': args.fuzzy_threshold if args.fuzzy else None,
+        'excel_engine': args.excel_engine,
+        'compact_category_sheets': args.compact_category_sheets,
+        'use_maintainers': not args.no_maintainers,
+        'state_file': os.path.abspath(args.state_file) if args.state_file else None,
+        'incremental': args.incremental,
+        'memory_bounded': args.low_memory,
+        'chunk_size': max(1, args.chunk_size),
+        'paths': args.path,
+        'categories': args.category
+    }
+    # 延迟导入：只有 --server 模式需要HTTP客户端
+    import analysis_server
+
+    print(f"🛰️  交给分析服务执行: {address}")
+    try:
+        result = analysis_server.request(address, 'POST', '/analyze', payload)
+    except (OSError, RuntimeError) as e:
+        print(f"❌ 分析服务请求失败: {e}")
+        sys.exit(1)
+    print(result['log'], end='')
+
+    labels = {'source': source_branch, 'target': ', '.join(target_branches)}
+    if args.metrics_json:
+        run_metrics.write_json(args.metrics_json, result['metrics'], labels)
+        print(f"📈 性能指标: {args.metrics_json}")
+    if args.metrics_prom:
+        run_metrics.write_prometheus(args.metrics_prom, result['metrics'], labels)
+        print(f"📈 Prometheus指标: {args.metrics_prom}")
+
+def run_thin_client():
+    """--server 模式的入口：解析参数并把分析交给常驻服务后退出，未指定 --server 时直接返回
+
+    版本是否存在由服务端检查，客户端不调用git。
+    """
+    source_branch, target_branches, args = parse_arguments()
+    if not args.server or args.list_branches:
+        return
+
+    check_required_branches(source_branch, target_branches)
+    if not args.output:
+        args.output = default_output_file(source_branch, target_branches)
+    try:
+        formats = report_formats.parse_formats(args.format)
+    except ValueError as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
+    check_option_conflicts(target_branches, args)
+    run_remote_analysis(args.server, source_branch, target_branches, args, formats)
+    sys.exit(0)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按路径或分类限定分析范围
+
+只关心一个子系统（例如 arch/riscv 或 kernel/sched）时，没有必要为整个版本范围
+计算patch-id、读取详情，最后再按关键词分类。--path 给出的路径和 --category 所选
+分类规则中的 path_prefixes 作为pathspec直接交给源分支的 git log 和目标分支的索引
+遍历，只有改动了这些路径的提交才进入后续阶段。
+
+分类也可以只靠标题关键词命中，这类提交不改动对应路径，git筛选不到；它们在git
+筛选之后按分类器的标题规则补充进来。两侧使用同样的规则，等价提交不会因此漏掉。
+"""
+
+class AnalysisScope:
+    """分析范围：pathspec列表和所选分类"""
+
+    def __init__(self, paths=(), categories=(), classifier=None):
+        self.paths = list(dict.fromkeys(paths))
+        self.categories = list(dict.fromkeys(categories))
+        self._classifier = classifier
+
+        pathspecs = list(self.paths)
+        for name in self.categories:
+            # 分类规则按前缀匹配且不区分大小写；git默认的pathspec中 * 也匹配 /
+            pathspecs.extend(f':(icase){prefix}*' for prefix in classifier.path_prefixes.get(name, []))
+        self.pathspecs = list(dict.fromkeys(pathspecs))
+
+    def matches_subject(self, subject):
+        """标题是否按关键词命中所选分类（不看修改的文件）"""
+        if not self.categories:
+            return False
+        return any(category in self.categories for category in self._classifier.categorize(subject, []))
+
+    def key(self):
+        return scope_key(self.paths, self.categories)
+
+    def describe(self):
+        parts = []
+        if self.paths:
+            parts.append(f"路径 {', '.join(self.paths)}")
+        if self.categories:
+            parts.append(f"分类 {', '.join(self.categories)}")
+        return '，'.join(parts)
+
+def scope_key(paths, categories):
+    """写入清单和增量状态的范围标识，未限定范围时为None"""
+    paths = [p for p in (paths or []) if p]
+    categories = [c for c in (categories or []) if c]
+    if not paths and not categories:
+        return None
+    return {'paths': list(dict.fromkeys(paths)), 'categories': list(dict.fromkeys(categories))}
+
+def build_scope(paths, categories, classifier):
+    """根据命令行参数创建分析范围，都为空时返回None；分类名无效时抛出ValueError"""
+    key = scope_key(paths, categories)
+    if key is None:
+        return None
+    names = classifier.category_names()
+    for name in key['categories']:
+        if name == classifier.default_category:
+            raise ValueError(f"默认分类“{name}”由其他分类都不匹配决定，无法用来限定范围")
+        if name not in names:
+            raise ValueError(f"未知的分类: {name}（可选: {', '.join(names)}）")
+    return AnalysisScope(key['paths'], key['categories'], classifier)
@@ -0,0 +1,705 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻分析服务
+
+每次运行 generate_patch_analysis.py 都要从头导入pandas/openpyxl、计算公共祖先、
+构建目标侧索引，哪怕只是想问一个问题。服务模式在一个进程中打开仓库，把下列数据
+常驻内存：
+- 每个提交的patch-id和上游引用（generate_patch_analysis 的进程内缓存，背后是持久化缓存）；
+- 按 (目标分支, 公共祖先) 建立的目标侧索引：{上游引用键: 目标提交} 和 {patch-id: 目标提交}；
+- 源提交范围、公共祖先和提交分类结果；
+- 分支和标签的引用快照。
+每个请求先比较引用快照；分支只是向前推进时只把新提交补进已有索引，被变基或强推时重建。
+
+通过本地HTTP（默认只监听127.0.0.1）或Unix socket提供JSON接口：
+  GET  /status                              服务状态、常驻索引和缓存规模
+  GET  /refs                                引用快照（分支、标签及标签指向的提交）
+  POST /unique   {source, target, ...}      两个版本之间的独有补丁
+  POST /contains {commit, target}           提交（或其等价补丁）是否已在目标分支中
+  POST /classify {range}                    对 A..B 范围内的提交分类
+  POST /analyze  {source, targets, output}  生成完整报告（generate_patch_analysis.py --server 使用）
+
+请求按到达顺序逐个处理，缓存和索引不需要额外加锁。/analyze 用 contextlib.redirect_stdout
+把报告生成期间的输出收集为本次请求的日志，这会替换整个进程的 sys.stdout，同样依赖于
+同一时刻只处理一个请求（见 make_server）。
+
+/analyze 的 output 和 state_file 由客户端指定、由服务端写出，只允许位于启动时配置的
+输出目录（--output-dir，默认为启动服务的目录）之内；监听非本机地址时必须显式指定
+--output-dir，否则拒绝 /analyze 请求。
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import ipaddress
+import json
+import os
+import re
+import socket
+import socketserver
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import analysis_scope
+import git_backend
+import git_executor
+import report_formats
+import run_metrics
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_ADDRESS = f'http://{DEFAULT_HOST}:{DEFAULT_PORT}'
+# 常驻的目标侧索引和源提交范围的数量上限，超出后淘汰最久未使用的
+MAX_WARM_INDEXES = 16
+MAX_WARM_RANGES = 64
+# 常驻的提交分类结果数量上限（按提交计），超出后淘汰最久未使用的
+MAX_WARM_CLASSIFICATIONS = 500000
+MAX_REQUEST_BYTES = 1 << 20
+
+# 请求中的版本表达式只允许这些字符，拼进git命令前不会被解释为选项或shell语法
+_REVISION = re.compile(r'^[\w./@{}^~+-]+$')
+
+class RequestError(Exception):
+    """请求参数有误，以 status 状态码返回给客户端"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _is_ancestor(ancestor, descendant):
+    return subprocess.run(['git', 'merge-base', '--is-ancestor', ancestor, descendant],
+                          capture_output=True).returncode == 0
+
+def read_refs():
+    """读取全部引用，返回 {引用名: 提交SHA}（附注标签取其指向的提交）"""
+    result = subprocess.run(['git', 'for-each-ref', '--format=%(refname)%00%(objectname)%00%(*objectname)'],
+                            capture_output=True, text=True)
+    run_metrics.add('git.processes')
+    refs = {}
+    for line in result.stdout.splitlines():
+        name, objectname, peeled = line.split('\0')
+        refs[name] = peeled or objectname
+    return refs
+
+class TargetIndex:
+    """目标分支在公共祖先之后的索引
+
+    keys 为 {目标提交自身及其引用的上游SHA: 目标提交}，patch_ids 为 {patch-id: 目标提交}。
+    分支向前推进时只补充新提交；旧tip不再是新tip的祖先（变基、强推）时重建。
+    """
+
+    def __init__(self, analysis, target, base, scope=None):
+        self.analysis = analysis
+        self.target = target
+        self.base = base
+        self.scope = scope
+        self.tip = None
+        self.commit_count = 0
+        self.keys = {}
+        self.patch_ids = {}
+        self.updated_at = None
+
+    def update(self, tip):
+        """把索引更新到 tip，返回新加入的提交数"""
+        if tip == self.tip:
+            return 0
+        if self.tip is not None and _is_ancestor(self.tip, tip):
+            revisions = f'{tip} ^{self.tip}' + (f' ^{self.base}' if self.base else '')
+        else:
+            self.commit_count = 0
+            self.keys = {}
+            self.patch_ids = {}
+            revisions = f'{self.base}..{tip}' if self.base else tip
+
+        if self.scope is not None:
+            commits = self.analysis.list_scoped_commits(revisions, self.scope)
+        else:
+            commits = [c.strip() for c in self.analysis.run_git_command(f'git rev-list {revisions}') if c.strip()]
+        references = self.analysis.get_upstream_references_batch(commits)
+        patch_ids = self.analysis.get_patch_ids_batch(commits)
+        # 从旧到新加入，同一个键对应多个目标提交时保留最早的一个
+        for commit in reversed(commits):
+            for key in (commit,) + references[commit]:
+                self.keys.setdefault(key, commit)
+            if patch_ids.get(commit):
+                self.patch_ids.setdefault(patch_ids[commit], commit)
+
+        self.commit_count += len(commits)
+        self.tip = tip
+        self.updated_at = datetime.now().isoformat(timespec='seconds')
+        return len(commits)
+
+    def lookup(self, commit_hash, references, patch_id, use_upstream_match=True):
+        """在索引中查找等价提交，返回 (匹配方式, 匹配依据, 目标提交) 或 None"""
+        if use_upstream_match:
+            for key in (commit_hash,) + tuple(references):
+                if key in self.keys:
+                    return '上游SHA', key, self.keys[key]
+        if patch_id and patch_id in self.patch_ids:
+            return 'patch-id', patch_id, self.patch_ids[patch_id]
+        return None
+
+    def describe(self):
+        return {
+            'target': self.target,
+            'merge_base': self.base,
+            'tip': self.tip,
+            'scope': self.scope.key() if self.scope is not None else None,
+            'commits': self.commit_count,
+            'upstream_keys': len(self.keys),
+            'patch_ids': len(self.patch_ids),
+            'updated_at': self.updated_at
+        }
+
+class AnalysisService:
+    """常驻的分析状态和各接口的实现"""
+
+    def __init__(self, jobs=None, cache_dir=None, use_cache=True, rules_file=None, output_dir=None):
+        # 延迟导入：只有服务端需要加载pandas等依赖，客户端保持轻量
+        import generate_patch_analysis as analysis
+
+        self.analysis = analysis
+        self.jobs = git_executor.configure(jobs).jobs
+        if use_cache:
+            analysis.init_patch_id_store(cache_dir)
+        if rules_file:
+            analysis.set_rules_file(rules_file)
+        # /analyze 只能写入该目录，为None时拒绝 /analyze
+        self.output_dir = os.path.realpath(output_dir) if output_dir else None
+        self.started_at = time.time()
+        self.requests = 0
+        self.refs = read_refs()
+        self.ref_changes = 0
+        self.merge_bases = {}
+        self.indexes = OrderedDict()
+        self.ranges = OrderedDict()
+        # {提交: (分类列表, 补丁类型)}
+        self.classifications = OrderedDict()
+
+    # 引用和版本解析
+
+    def refresh_refs(self):
+        """比较引用快照，返回发生变化的引用数；索引在下次使用时按新的tip增量更新"""
+        refs = read_refs()
+        changed = sum(1 for name in refs.keys() | self.refs.keys() if refs.get(name) != self.refs.get(name))
+        if changed:
+            print(f"🔄 {changed} 个引用发生变化")
+            self.ref_changes += changed
+        self.refs = refs
+        return changed
+
+    def resolve(self, revision, field='revision'):
+        if not isinstance(revision, str) or not _REVISION.match(revision) or revision.startswith('-'):
+            raise RequestError(f"无效的版本: {revision!r}（{field}）")
+        sha = git_backend.resolve(f'{revision}^{{commit}}')
+        if sha is None:
+            raise RequestError(f"版本不存在: {revision}（{field}）", 404)
+        return sha
+
+    def output_path(self, path, field):
+        """把请求中的输出路径解析到输出目录下，指向目录之外（包括经由符号链接）时拒绝"""
+        if not isinstance(path, str) or not path:
+            raise RequestError(f"无效的路径: {path!r}（{field}）")
+        resolved = os.path.realpath(os.path.join(self.output_dir, path))
+        if os.path.commonpath([resolved, self.output_dir]) != self.output_dir:
+            raise RequestError(f"{field} 须位于服务的输出目录 {self.output_dir} 之内: {path}", 403)
+        return resolved
+
+    def merge_base(self, first, second):
+        key = tuple(sorted((first, second)))
+        if key not in self.merge_bases:
+            result = subprocess.run(['git', 'merge-base', first, second], capture_output=True, text=True)
+            run_metrics.add('git.processes')
+            self.merge_bases[key] = result.stdout.strip() or None
+        return self.merge_bases[key]
+
+    def _scope(self, payload):
+        try:
+            return analysis_scope.build_scope(payload.get('paths'), payload.get('categories'),
+                                              self.analysis.get_classifier())
+        except ValueError as e:
+            raise RequestError(str(e))
+
+    @staticmethod
+    def _remember(cache, key, value, limit):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def target_index(self, target, tip, base, scope=None):
+        """取得（必要时建立或增量更新）目标侧索引"""
+        key = (target, base, json.dumps(scope.key() if scope is not None else None, sort_keys=True))
+        index = self.indexes.get(key)
+        if index is None:
+            print(f"📚 建立 {target} 的索引（公共祖先 {(base or '无')[:12]}）")
+            index = TargetIndex(self.analysis, target, base, scope)
+        added = index.update(tip)
+        if added:
+            print(f"📚 {target} 的索引加入 {added} 个提交，共 {index.commit_count} 个")
+        self._remember(self.indexes, key, index, MAX_WARM_INDEXES)
+        return index
+
+    def source_commits(self, revisions, scope=None):
+        """源提交范围（非合并提交，git log顺序），revisions 中只含完整SHA"""
+        key = (revisions, json.dumps(scope.key() if scope is not None else None, sort_keys=True))
+        commits = self.ranges.get(key)
+        if commits is None:
+            commits = self.analysis.get_source_commits(revisions, scope)
+        self._remember(self.ranges, key, commits, MAX_WARM_RANGES)
+        return commits
+
+    def classify_commits(self, commits):
+        """为提交分类，结果按提交缓存，返回 {完整SHA: (分类列表, 补丁类型)}"""
+        missing = []
+        for commit in commits:
+            if commit['full_hash'] in self.classifications:
+                self.classifications.move_to_end(commit['full_hash'])
+            else:
+                missing.append(commit)
+        if missing:
+            details = {}
+            for chunk in self.analysis.split_into_chunks([c['full_hash'] for c in missing]):
+                details.update(self.analysis.read_commit_details(chunk))
+            empty = self.analysis.EMPTY_DETAILS
+            results = self.analysis.get_classifier().classify_batch(
+                [(c['subject'], details.get(c['full_hash'], empty)['file_list']) for c in missing]
+            )
+            for commit, result in zip(missing, results):
+                self.classifications[commit['full_hash']] = result
+        classified = {c['full_hash']: self.classifications[c['full_hash']] for c in commits}
+        while len(self.classifications) > MAX_WARM_CLASSIFICATIONS:
+            self.classifications.popitem(last=False)
+        return classified
+
+    def after_request(self):
+        """每个请求之后把持久化缓存的命中记录写回，并在写入过新条目时执行容量上限"""
+        if self.analysis.patch_id_store is not None:
+            self.analysis.patch_id_store.flush()
+
+    # 接口
+
+    def status(self, payload):
+        analysis = self.analysis
+        return {
+            'repository': os.getcwd(),
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'requests': self.requests,
+            'jobs': self.jobs,
+            'refs': len(self.refs),
+            'ref_changes': self.ref_changes,
+            'indexes': [index.describe() for index in self.indexes.values()],
+            'cached': {
+                'ranges': len(self.ranges),
+                'merge_bases': len(self.merge_bases),
+                'patch_ids': len(analysis.patch_id_cache),
+                'upstream_refs': len(analysis.upstream_ref_cache),
+                'classifications': len(self.classifications)
+            },
+            'persistent_cache': analysis.patch_id_store.path if analysis.patch_id_store is not None else None
+        }
+
+    def list_refs(self, payload):
+        prefix = payload.get('prefix', '')
+        return {'refs': {name: sha for name, sha in self.refs.items() if name.startswith(prefix)}}
+
+    def unique(self, payload):
+        """source 相对 target 的独有补丁；summary_only 为真时只返回统计"""
+        source_tip = self.resolve(payload.get('source'), 'source')
+        target_tip = self.resolve(payload.get('target'), 'target')
+        use_upstream_match = payload.get('upstream_match', True)
+        scope = self._scope(payload)
+        base = self.merge_base(source_tip, target_tip) if payload.get('merge_base', True) else None
+
+        index = self.target_index(payload['target'], target_tip, base, scope)
+        commits = self.source_commits(f'{base}..{source_tip}' if base else f'{target_tip}..{source_tip}', scope)
+        hashes = [c['full_hash'] for c in commits]
+        references = self.analysis.get_upstream_references_batch(hashes) if use_upstream_match else {}
+        patch_ids = self.analysis.get_patch_ids_batch(hashes)
+
+        unique_commits = []
+        methods = {'上游SHA': 0, 'patch-id': 0}
+        for commit in commits:
+            match = index.lookup(commit['full_hash'], references.get(commit['full_hash'], ()),
+                                 patch_ids.get(commit['full_hash']), use_upstream_match)
+            if match:
+                methods[match[0]] += 1
+            else:
+                unique_commits.append(commit)
+
+        result = {
+            'source': payload['source'],
+            'target': payload['target'],
+            'source_tip': source_tip,
+            'target_tip': target_tip,
+            'merge_base': base,
+            'total_commits': len(commits),
+            'equivalent_count': len(commits) - len(unique_commits),
+            'upstream_match_count': methods['上游SHA'],
+            'patch_id_match_count': methods['patch-id'],
+            'unique_count': len(unique_commits)
+        }
+        if not payload.get('summary_only'):
+            classified = self.classify_commits(unique_commits) if payload.get('classify') else {}
+            result['unique'] = [self._commit_entry(c, classified.get(c['full_hash'])) for c in unique_commits]
+        return result
+
+    def contains(self, payload):
+        """commit 或其等价补丁是否已在 target 中"""
+        commit_hash = self.resolve(payload.get('commit'), 'commit')
+        target_tip = self.resolve(payload.get('target'), 'target')
+        result = {'commit': commit_hash, 'target': payload['target'], 'target_tip': target_tip}
+        if _is_ancestor(commit_hash, target_tip):
+            return dict(result, present=True, method=self.analysis.TARGET_STATUS_CONTAINED, evidence=commit_hash,
+                        target_commit=commit_hash)
+
+        base = self.merge_base(commit_hash, target_tip)
+        index = self.target_index(payload['target'], target_tip, base)
+        references = self.analysis.get_upstream_references_batch([commit_hash])[commit_hash]
+        patch_id = self.analysis.get_patch_ids_batch([commit_hash]).get(commit_hash)
+        match = index.lookup(commit_hash, references, patch_id, payload.get('upstream_match', True))
+        if match is None:
+            return dict(result, present=False, method=None, evidence=None, target_commit=None, merge_base=base)
+        method, evidence, target_commit = match
+        return dict(result, present=True, method=method, evidence=evidence, target_commit=target_commit,
+                    merge_base=base)
+
+    def classify(self, payload):
+        """对 range（A..B）内的非合并提交分类"""
+        revision_range = payload.get('range')
+        if not isinstance(revision_range, str) or revision_range.count('..') != 1 or '...' in revision_range:
+            raise RequestError("range 须为 A..B 形式")
+        start, end = revision_range.split('..')
+        revisions = f"{self.resolve(start, 'range')}..{self.resolve(end, 'range')}"
+        commits = self.source_commits(revisions, self._scope(payload))
+        classified = self.classify_commits(commits)
+
+        category_counts = {}
+        type_counts = {}
+        for categories, patch_type in classified.values():
+            for category in categories:
+                category_counts[category] = category_counts.get(category, 0) + 1
+            type_counts[patch_type] = type_counts.get(patch_type, 0) + 1
+        result = {
+            'range': revision_range,
+            'total_commits': len(commits),
+            'categories': dict(sorted(category_counts.items(), key=lambda item: -item[1])),
+            'types': dict(sorted(type_counts.items(), key=lambda item: -item[1]))
+        }
+        if not payload.get('summary_only'):
+            result['commits'] = [self._commit_entry(c, classified[c['full_hash']]) for c in commits]
+        return result
+
+    def analyze(self, payload):
+        """生成完整报告，参数与 generate_patch_analysis.py 的命令行选项对应，返回统计摘要、指标和输出
+
+        output 和 state_file 可以是相对输出目录的路径，都必须位于输出目录之内。
+        """
+        if self.output_dir is None:
+            raise RequestError("服务监听非本机地址且未指定 --output-dir，不接受 /analyze 请求", 403)
+        source = payload.get('source')
+        targets = payload.get('targets') or []
+        if not targets or not isinstance(targets, list):
+            raise RequestError("targets 须为非空列表")
+        self.resolve(source, 'source')
+        for target in targets:
+            self.resolve(target, 'targets')
+        if not payload.get('output'):
+            raise RequestError("缺少 output")
+        output = self.output_path(payload['output'], 'output')
+        try:
+            formats = report_formats.parse_formats(','.join(payload.get('formats') or ['xlsx']))
+        except ValueError as e:
+            raise RequestError(str(e))
+        scope = self._scope(payload)
+        state_file = self.output_path(payload['state_file'], 'state_file') if payload.get('state_file') else None
+        if payload.get('incremental') and not state_file and len(targets) == 1:
+            state_file = self.analysis.default_state_file(source, targets[0], output)
+
+        log = io.StringIO()
+        # 报告生成期间各线程的输出都写入本次请求的日志；redirect_stdout 作用于整个进程，
+        # 只有在服务器逐个处理请求时才不会混入其他请求的输出
+        with contextlib.redirect_stdout(log):
+            try:
+                if len(targets) > 1:
+                    summary = self.analysis.run_multi_target_analysis(
+                        source, targets, output, self.jobs, payload.get('use_merge_base', True),
+                        payload.get('use_upstream_match', True), payload.get('excel_engine', 'auto'),
+                        payload.get('compact_category_sheets', False), payload.get('use_maintainers', True),
+                        formats, scope
+                    )
+                else:
+                    summary = self.analysis.run_analysis(
+                        source, targets[0], output, self.jobs, payload.get('use_merge_base', True),
+                        payload.get('use_upstream_match', True), payload.get('fuzzy_threshold'),
+                        payload.get('excel_engine', 'auto'), payload.get('compact_category_sheets', False),
+                        payload.get('use_maintainers', True), formats, state_file,
+                        payload.get('memory_bounded', False), payload.get('chunk_size'), scope
+                    )
+            except ValueError as e:
+                raise RequestError(str(e))
+            metrics = run_metrics.snapshot()
+            run_metrics.print_summary(metrics)
+        return {'summary': summary, 'metrics': metrics, 'log': log.getvalue()}
+
+    @staticmethod
+    def _commit_entry(commit, classification=None):
+        entry = {
+            'commit': commit['full_hash'],
+            'short': commit['commit_hash'],
+            'author': commit['author'],
+            'date': commit['date'],
+            'subject': commit['subject']
+        }
+        if classification is not None:
+            entry['categories'], entry['type'] = classification
+        return entry
+
+ROUTES = {
+    ('GET', '/status'): AnalysisService.status,
+    ('GET', '/refs'): AnalysisService.list_refs,
+    ('POST', '/unique'): AnalysisService.unique,
+    ('POST', '/contains'): AnalysisService.contains,
+    ('POST', '/classify'): AnalysisService.classify,
+    ('POST', '/analyze'): AnalysisService.analyze,
+}
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = 'patch-analysis'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        handler = ROUTES.get((method, url.path))
+        if handler is None:
+            self._reply(404, {'error': f"未知的接口: {method} {url.path}"})
+            return
+
+        service = self.server.service
+        try:
+            self._handle(service, handler, method, url)
+        finally:
+            service.after_request()
+
+    def _handle(self, service, handler, method, url):
+        started = time.perf_counter()
+        try:
+            payload = dict(parse_qsl(url.query))
+            if method == 'POST':
+                length = int(self.headers.get('Content-Length') or 0)
+                if length > MAX_REQUEST_BYTES:
+                    raise RequestError("请求过大", 413)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not isinstance(body, dict):
+                    raise RequestError("请求体须为JSON对象")
+                payload.update(body)
+            service.requests += 1
+            if url.path != '/status':
+                service.refresh_refs()
+            result = handler(service, payload)
+        except RequestError as e:
+            self._reply(e.status, {'error': str(e)})
+            return
+        except json.JSONDecodeError as e:
+            self._reply(400, {'error': f"无法解析请求体: {e}"})
+            return
+        except Exception as e:
+            print(f"❌ 处理 {method} {url.path} 时出错: {e}")
+            self._reply(500, {'error': str(e)})
+            return
+        result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        self._reply(200, result)
+
+    def _reply(self, status, result):
+        body = json.dumps(result, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket 的客户端地址为空字符串
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        print(f"{datetime.now().isoformat(timespec='seconds')} {self.address_string()} {format % args}")
+
+class _UnixHTTPServer(socketserver.UnixStreamServer):
+    def __init__(self, path, handler):
+        super().__init__(path, handler)
+        # BaseHTTPRequestHandler 需要这两个属性
+        self.server_name = path
+        self.server_port = 0
+
+def _is_loopback(host):
+    """监听地址是否只接受本机连接"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """创建HTTP服务器（提供 socket_path 时监听Unix socket），请求由 service 处理
+
+    服务器必须逐个处理请求，不能换成 ThreadingHTTPServer 或 ThreadingMixIn：AnalysisService
+    的缓存和索引没有加锁，/analyze 还通过 redirect_stdout 替换进程级的 sys.stdout 来收集日志，
+    并发处理会让不同请求的日志相互交错。
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, _RequestHandler)
+    else:
+        server = HTTPServer((host, port), _RequestHandler)
+    server.service = service
+    return server
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self._socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self._socket_path)
+
+def request(address, method, path, payload=None, timeout=None):
+    """向分析服务发送请求并返回JSON结果，出错时抛出RuntimeError
+
+    address 为 http://主机:端口 或 unix:/socket路径。
+    """
+    if address.startswith('unix:'):
+        connection = _UnixHTTPConnection(address[len('unix:'):], timeout)
+    else:
+        url = urlsplit(address if '://' in address else f'http://{address}')
+        connection = http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT, timeout=timeout)
+    try:
+        body = None
+        headers = {}
+        if method == 'POST':
+            body = json.dumps(payload or {}, ensure_ascii=False).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif payload:
+            path = f'{path}?{urlencode(payload)}'
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        result = json.loads(response.read() or b'{}')
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError(result.get('error') or f"HTTP {response.status}")
+    return result
+
+def _parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='常驻分析服务：索引和缓存常驻内存，通过本地JSON接口回答查询',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""使用示例:
+  %(prog)s serve --warm v6.6.8..v6.6.50
+  %(prog)s serve --socket /tmp/patch-analysis.sock
+  %(prog)s query unique source=v6.6.50 target=v6.6.8 summary_only=true
+  %(prog)s query contains commit=abc1234 target=openkylin-6.6-next
+  %(prog)s query classify range=v6.6.8..v6.6.50 'categories=["RISC-V"]'
+  %(prog)s query status
+  curl -s -d '{"source": "v6.6.50", "target": "v6.6.8"}' http://127.0.0.1:8765/unique
+  generate_patch_analysis.py v6.6.50 v6.6.8 --server http://127.0.0.1:8765
+        """
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help='在当前仓库中启动服务')
+    serve.add_argument('--host', default=DEFAULT_HOST, help=f'监听地址（默认: {DEFAULT_HOST}，只接受本机连接）')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'监听端口（默认: {DEFAULT_PORT}）')
+    serve.add_argument('--socket', help='改为监听该Unix socket')
+    serve.add_argument('-j', '--jobs', type=int, default=git_executor.default_jobs(),
+                       help=f'git并发进程总数（默认按CPU核数: {git_executor.default_jobs()}）')
+    serve.add_argument('--cache-dir', help='持久化patch-id缓存目录（默认: .git/patch-analysis-cache）')
+    serve.add_argument('--no-cache', action='store_true', help='禁用持久化patch-id缓存')
+    serve.add_argument('--rules', help='分类与补丁类型规则文件（TOML）')
+    serve.add_argument('--output-dir',
+                       help='/analyze 只能在该目录内写出报告和状态文件（默认: 启动服务的目录；'
+                            '监听非本机地址时必须指定，否则拒绝 /analyze）')
+    serve.add_argument('--warm', action='append', default=[], metavar='TARGET..SOURCE',
+                       help='启动时预先建立该版本对的索引（可重复指定）')
+
+    query = subparsers.add_parser('query', help='向运行中的服务发送请求并打印JSON结果')
+    query.add_argument('endpoint', help='接口名：status、refs、unique、contains、classify')
+    query.add_argument('params', nargs='*', metavar='KEY=VALUE', help='请求参数，值按JSON解析，解析失败时作为字符串')
+    query.add_argument('--server', default=DEFAULT_ADDRESS, help=f'服务地址（默认: {DEFAULT_ADDRESS}，或 unix:/路径）')
+
+    args = parser.parse_args()
+
+    if args.command == 'query':
+        payload = {}
+        for param in args.params:
+            key, sep, value = param.partition('=')
+            if not sep:
+                parser.error(f"参数须为 KEY=VALUE 形式: {param}")
+            payload[key] = _parse_value(value)
+        method = 'GET' if args.endpoint in ('status', 'refs') else 'POST'
+        try:
+            result = request(args.server, method, f'/{args.endpoint}', payload)
+        except (OSError, RuntimeError) as e:
+            print(f"❌ 请求失败: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    print(f"🚀 启动分析服务: {os.getcwd()}")
+    output_dir = args.output_dir
+    if output_dir is None and (args.socket or _is_loopback(args.host)):
+        output_dir = os.getcwd()
+    if output_dir is None:
+        print(f"⚠️  监听非本机地址 {args.host} 且未指定 --output-dir，/analyze 已禁用")
+    service = AnalysisService(args.jobs, args.cache_dir, not args.no_cache, args.rules, output_dir)
+    for pair in args.warm:
+        target, sep, source = pair.partition('..')
+        if not sep:
+            parser.error(f"--warm 须为 TARGET..SOURCE 形式: {pair}")
+        started = time.perf_counter()
+        try:
+            result = service.unique({'source': source, 'target': target, 'summary_only': True})
+        except RequestError as e:
+            print(f"⚠️  无法预热 {pair}: {e}")
+            continue
+        print(f"🔥 已预热 {pair}: {result['total_commits']} 个源提交，独有 {result['unique_count']}"
+              f"（{time.perf_counter() - started:.1f}s）")
+
+    server = make_server(service, args.host, args.port, args.socket)
+    address = f'unix:{args.socket}' if args.socket else f'http://{args.host}:{args.port}'
+    print(f"✅ 服务已就绪: {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 服务已停止")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == "__main__":
+    main()
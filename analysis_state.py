@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量分析的状态文件
+
+记录上次分析时两侧分支的tip、公共祖先、目标侧索引（提交、上游引用键、patch-id）
+以及每个源提交的判定结果和独有补丁的详情。分支只是向前推进时，再次分析只需处理
+old_tip..new_tip 之间的新提交；分支被变基、强推或公共祖先变化时回退到完整分析。
+"""
+
+import json
+import os
+import re
+import subprocess
+
+STATE_FORMAT_VERSION = 1
+STATE_DIR_NAME = 'analysis-state'
+
+def default_state_path(cache_dir, source_branch, target_branch):
+    """状态文件的默认路径：缓存目录下按分支对命名"""
+    safe_source = re.sub(r'[^\w\-_.]', '_', source_branch)
+    safe_target = re.sub(r'[^\w\-_.]', '_', target_branch)
+    return os.path.join(cache_dir, STATE_DIR_NAME, f"{safe_source}-to-{safe_target}.json")
+
+def load_state(path):
+    """读取状态文件，不存在或格式不兼容时返回None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  无法读取增量状态 {path}: {e}，将执行完整分析")
+        return None
+    if state.get('version') != STATE_FORMAT_VERSION:
+        return None
+    return state
+
+def save_state(path, state):
+    """原子地写入状态文件"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    state = dict(state, version=STATE_FORMAT_VERSION)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+def _is_ancestor(ancestor, descendant):
+    return subprocess.run(['git', 'merge-base', '--is-ancestor', ancestor, descendant],
+                          capture_output=True).returncode == 0
+
+def check_resumable(state, source_branch, target_branch, source_tip, target_tip, merge_base,
+                    use_upstream_match, scope=None):
+    """判断能否在上次结果的基础上增量分析，返回 (是否可以, 原因)"""
+    if state is None:
+        return False, "没有上次的分析状态"
+    if state['source'] != source_branch or state['target'] != target_branch:
+        return False, "分支对与状态文件不一致"
+    if state['use_upstream_match'] != use_upstream_match:
+        return False, "上游SHA匹配选项发生变化"
+    if state.get('scope') != scope:
+        return False, "分析范围（--path/--category）发生变化"
+    if not merge_base or state['merge_base'] != merge_base:
+        return False, "公共祖先发生变化"
+    if not _is_ancestor(state['source_tip'], source_tip):
+        return False, f"{source_branch} 被变基或强制推送"
+    if not _is_ancestor(state['target_tip'], target_tip):
+        return False, f"{target_branch} 被变基或强制推送"
+    return True, ""
@@ -0,0 +1,788 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+
+生成一个结构类似内核的合成Git仓库：主线按合并窗口合入主题分支并打发布标签，
+stable分支从发布标签分出并backport主线提交（带或不带 "commit <sha> upstream"
+引用，部分改动了内容），厂商分支再从stable标签分出，另外夹带大diff和二进制文件。
+然后分阶段计时 generate_patch_analysis.py 的各个步骤、完整分析（冷/热缓存）
+以及 compare_adjacent_versions.py 的标签链比较，结果写成JSON，便于在不同提交之间对比。
+全程离线运行，只依赖git。
+
+使用示例:
+  python3 benchmark.py run --scale small --output bench_results.json
+  python3 benchmark.py run --repo /tmp/synthetic-linux --scale medium --repeat 3
+  python3 benchmark.py generate /tmp/synthetic-linux --scale large
+  python3 benchmark.py compare old.json new.json --threshold 10
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RESULT_FORMAT_VERSION = 1
+CONFIG_FILE_NAME = 'benchmark-config.json'
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 各规模的默认参数，命令行参数可以逐项覆盖
+SCALES = {
+    'small': {
+        'releases': 3, 'commits_per_release': 300, 'stable_branches': 2, 'stable_releases': 4,
+        'stable_only_commits': 5, 'backport_ratio': 0.25, 'vendor_commits': 150, 'vendor_backports': 200,
+    },
+    'medium': {
+        'releases': 4, 'commits_per_release': 2000, 'stable_branches': 2, 'stable_releases': 8,
+        'stable_only_commits': 10, 'backport_ratio': 0.25, 'vendor_commits': 800, 'vendor_backports': 1500,
+    },
+    'large': {
+        'releases': 6, 'commits_per_release': 10000, 'stable_branches': 3, 'stable_releases': 15,
+        'stable_only_commits': 20, 'backport_ratio': 0.2, 'vendor_commits': 4000, 'vendor_backports': 8000,
+    },
+}
+DEFAULT_CONFIG = dict(
+    SCALES['small'],
+    seed=1,
+    base_version='6.6',
+    topic_size=12,
+    upstream_ref_ratio=0.7,
+    modified_backport_ratio=0.1,
+    large_diff_ratio=0.005,
+    large_diff_lines=4000,
+    binary_ratio=0.005,
+)
+
+# 子系统: (标题前缀, 目录, 文件名, MAINTAINERS小节, 权重)
+SUBSYSTEMS = [
+    ('sched', 'kernel/sched', ['core', 'fair', 'rt', 'deadline'], 'SCHEDULER', 4),
+    ('mm', 'mm', ['slab', 'page_alloc', 'vmscan', 'memory'], 'MEMORY MANAGEMENT', 5),
+    ('net: ipv4', 'net/ipv4', ['tcp', 'udp', 'route'], 'NETWORKING [IPv4/IPv6]', 5),
+    ('ext4', 'fs/ext4', ['inode', 'extents', 'super'], 'EXT4 FILE SYSTEM', 3),
+    ('btrfs', 'fs/btrfs', ['inode', 'volumes', 'ctree'], 'BTRFS FILE SYSTEM', 3),
+    ('drm/amdgpu', 'drivers/gpu/drm/amd/amdgpu', ['amdgpu_device', 'gfx_v11_0', 'amdgpu_vm'],
+     'AMD GPU DRIVER', 8),
+    ('net: e1000e', 'drivers/net/ethernet/intel/e1000e', ['netdev', 'ich8lan'], 'INTEL ETHERNET DRIVERS', 4),
+    ('usb: xhci', 'drivers/usb/host', ['xhci', 'xhci-ring', 'xhci-mem'], 'USB XHCI DRIVER', 3),
+    ('riscv', 'arch/riscv/kernel', ['setup', 'traps', 'smpboot'], 'RISC-V ARCHITECTURE', 3),
+    ('arm64', 'arch/arm64/kernel', ['setup', 'traps', 'cpufeature'], 'ARM64 PORT (AARCH64 ARCHITECTURE)', 3),
+    ('x86/mm', 'arch/x86/mm', ['init', 'fault', 'tlb'], 'X86 MM', 3),
+    ('block', 'block', ['blk-core', 'blk-mq', 'bio'], 'BLOCK LAYER', 2),
+    ('bpf', 'kernel/bpf', ['verifier', 'syscall', 'core'], 'BPF [CORE]', 3),
+]
+FIRST_NAMES = ['Alex', 'Bo', 'Chen', 'Dana', 'Erik', 'Fang', 'Gita', 'Hiro', 'Ivan', 'Jun', 'Kai', 'Lena',
+               'Mei', 'Nils', 'Omar', 'Pia', 'Rui', 'Sven', 'Tao', 'Uma', 'Wei', 'Yuki', 'Zoe']
+LAST_NAMES = ['Andersen', 'Brown', 'Chang', 'Dubois', 'Evans', 'Fischer', 'Garcia', 'Huang', 'Ito',
+              'Jensen', 'Kim', 'Li', 'Moreau', 'Nakamura', 'Olsen', 'Petrov', 'Rossi', 'Schmidt',
+              'Tanaka', 'Wang', 'Zhang']
+FIX_WORDS = ['use-after-free', 'NULL pointer dereference', 'memory leak', 'race', 'deadlock',
+             'overflow', 'refcount leak', 'off-by-one', 'uninitialized variable', 'warning']
+FEATURE_WORDS = ['support for', 'tracepoint for', 'tunable for', 'helper for', 'statistics for']
+CLEANUP_WORDS = ['remove unused', 'simplify', 'convert to guard() in', 'rename', 'constify']
+NOUNS = ['queue', 'buffer', 'state', 'context', 'table', 'handler', 'descriptor', 'request', 'entry', 'cache']
+
+# 每个文件的可修改行数；可修改行之间隔着固定的函数体，距离大于diff上下文（3行），
+# 因此一个提交的diff只取决于被修改的那一行，backport到任何分支都得到同样的patch-id
+SLOTS_PER_FILE = 24
+START_TIME = 1698624000  # 2023-10-30，与 v6.6 的发布时间相近
+
+def build_config(scale='small', overrides=None):
+    """按规模得到生成参数，overrides 中不为None的值覆盖默认值"""
+    config = dict(DEFAULT_CONFIG)
+    config.update(SCALES[scale])
+    config['scale'] = scale
+    for key, value in (overrides or {}).items():
+        if value is not None:
+            config[key] = value
+    return config
+
+class _FastImport:
+    """向 git fast-import 写入提交和标签"""
+
+    def __init__(self, repo_path, marks_file, import_marks=False):
+        cmd = ['git', 'fast-import', '--quiet', '--done', f'--export-marks={marks_file}']
+        if import_marks:
+            cmd.append(f'--import-marks={marks_file}')
+        self.proc = subprocess.Popen(cmd, cwd=repo_path, stdin=subprocess.PIPE)
+        self.out = self.proc.stdin
+
+    def _data(self, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        self.out.write(b'data %d\n' % len(payload))
+        self.out.write(payload)
+        self.out.write(b'\n')
+
+    def commit(self, ref, mark, author, timestamp, message, parents, files):
+        ident = f'{author} {timestamp} +0000'
+        self.out.write(f'commit {ref}\nmark :{mark}\nauthor {ident}\ncommitter {ident}\n'.encode('utf-8'))
+        self._data(message)
+        if parents:
+            self.out.write(f'from :{parents[0]}\n'.encode())
+            for parent in parents[1:]:
+                self.out.write(f'merge :{parent}\n'.encode())
+        for path, content in files.items():
+            self.out.write(f'M 100644 inline {path}\n'.encode('utf-8'))
+            self._data(content)
+        self.out.write(b'\n')
+
+    def tag(self, name, mark, tagger, timestamp, message):
+        self.out.write(f'tag {name}\nfrom :{mark}\ntagger {tagger} {timestamp} +0000\n'.encode('utf-8'))
+        self._data(message)
+
+    def close(self):
+        self.out.write(b'done\n')
+        self.out.close()
+        if self.proc.wait() != 0:
+            raise RuntimeError('git fast-import 执行失败')
+
+class SyntheticKernelRepo:
+    """合成仓库的生成器
+
+    文件内容由“可修改行”的取值决定：每个提交修改一个从未被修改过的可修改行，
+    各分支只记录自己修改过的行，渲染文件时叠加在初始内容上。
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.rng = random.Random(config['seed'])
+        self.mark = 0
+        self.timestamp = START_TIME
+        self.marks_file = os.path.join(path, '.git', 'benchmark-marks')
+        self.stats = {'mainline_commits': 0, 'merge_commits': 0, 'backports': 0, 'backports_with_ref': 0,
+                      'modified_backports': 0, 'stable_only_commits': 0, 'vendor_commits': 0,
+                      'large_diffs': 0, 'binary_files': 0, 'tags': []}
+
+        expected = (config['releases'] * config['commits_per_release']
+                    + config['stable_branches'] * config['stable_releases'] * config['stable_only_commits']
+                    + config['vendor_commits'])
+        total_weight = sum(s[4] for s in SUBSYSTEMS)
+        self.files = {}        # 路径 -> 可修改行编号列表
+        self.slot_file = []    # 可修改行编号 -> 路径
+        self.free_slots = []   # 每个子系统尚未使用的可修改行
+        for prefix, directory, stems, _, weight in SUBSYSTEMS:
+            file_count = expected * weight * 3 // (total_weight * 2 * SLOTS_PER_FILE) + 1
+            slots = []
+            for index in range(file_count):
+                stem = stems[index % len(stems)]
+                suffix = '' if index < len(stems) else f'_{index // len(stems)}'
+                path = f'{directory}/{stem}{suffix}.c'
+                first = len(self.slot_file)
+                self.files[path] = list(range(first, first + SLOTS_PER_FILE))
+                self.slot_file.extend([path] * SLOTS_PER_FILE)
+                slots.extend(self.files[path])
+            self.rng.shuffle(slots)
+            self.free_slots.append(slots)
+        self.authors = [f'{first} {last} <{first.lower()}.{last.lower()}@example.org>'
+                        for first in FIRST_NAMES for last in LAST_NAMES]
+
+    # ---- 内容 ----
+
+    def _render(self, path, values):
+        symbol = os.path.splitext(os.path.basename(path))[0].replace('-', '_')
+        lines = ['// SPDX-License-Identifier: GPL-2.0', '/*', f' * {path}', ' *',
+                 ' * Synthetic source file generated by benchmark.py', ' */', '#include <linux/kernel.h>', '']
+        for slot in self.files[path]:
+            lines.extend([
+                f'static int {symbol}_{slot}_limit = {values.get(slot, 0)};',
+                f'static int {symbol}_{slot}_init(void)',
+                '{',
+                f'\tpr_debug("{symbol}: init {slot}\\n");',
+                f'\treturn {symbol}_{slot}_limit;',
+                '}',
+                '',
+            ])
+        return '\n'.join(lines) + '\n'
+
+    def _maintainers(self):
+        sections = [('THE REST', 'Linus Torvalds <torvalds@example.org>', 'Buried alive in reporters',
+                     ['*', '*/'])]
+        for _, directory, _, section, _ in SUBSYSTEMS:
+            slug = section.split()[0].lower()
+            sections.append((section, f'{section.title()} Maintainer <{slug}@example.org>', 'Maintained',
+                             [f'{directory}/']))
+        text = ['List of maintainers', '===================', '',
+                'Descriptions of section entries and preferred order', '---------------------------------------------------', '',
+                '\tM: *Mail* patches to: FullName <address@domain>', '\tF: *Files* and directories wildcard patterns', '',
+                'Maintainers List', '----------------', '']
+        for name, maintainer, status, patterns in sorted(sections[1:]) + sections[:1]:
+            text.append(name)
+            text.append(f'M:\t{maintainer}')
+            text.append(f'S:\t{status}')
+            text.extend(f'F:\t{pattern}' for pattern in patterns)
+            text.append('')
+        return '\n'.join(text)
+
+    def _large_file(self, number):
+        lines = [f'/* Synthetic generated register header {number} */', f'#ifndef _GEN_{number}_SH_MASK_H',
+                 f'#define _GEN_{number}_SH_MASK_H']
+        for index in range(self.config['large_diff_lines']):
+            lines.append(f'#define GEN{number}_REG_{index:05d}__FIELD_MASK 0x{self.rng.getrandbits(32):08x}L')
+        lines.append('#endif')
+        return '\n'.join(lines) + '\n'
+
+    # ---- 提交 ----
+
+    def _next(self):
+        self.mark += 1
+        self.timestamp += self.rng.randint(60, 3600)
+        return self.mark, self.timestamp
+
+    def _new_change(self):
+        """在主线、stable或厂商分支上新写的一个提交"""
+        index = self.rng.choices(range(len(SUBSYSTEMS)), weights=[s[4] for s in SUBSYSTEMS])[0]
+        if not self.free_slots[index]:
+            index = max(range(len(SUBSYSTEMS)), key=lambda i: len(self.free_slots[i]))
+        slot = self.free_slots[index].pop()
+        prefix = SUBSYSTEMS[index][0]
+        symbol = os.path.splitext(os.path.basename(self.slot_file[slot]))[0].replace('-', '_')
+        noun = self.rng.choice(NOUNS)
+
+        kind = self.rng.random()
+        if kind < 0.55:
+            subject = f'{prefix}: fix {self.rng.choice(FIX_WORDS)} in {symbol}_{slot}_init()'
+            trailer = f'\nFixes: {self.rng.getrandbits(48):012x} ("{prefix}: rework {noun} handling")'
+        elif kind < 0.8:
+            subject = f'{prefix}: add {self.rng.choice(FEATURE_WORDS)} {noun} {slot}'
+            trailer = ''
+        else:
+            subject = f'{prefix}: {self.rng.choice(CLEANUP_WORDS)} {symbol} {noun} {slot}'
+            trailer = ''
+        author = self.rng.choice(self.authors)
+        body = (f'The {noun} limit used by {symbol}_{slot}_init() does not match the\n'
+                f'value expected by callers. Update it.\n{trailer}\n\nSigned-off-by: {author}\n')
+
+        extra = {}
+        if self.rng.random() < self.config['large_diff_ratio']:
+            self.stats['large_diffs'] += 1
+            number = self.rng.getrandbits(40)
+            extra[f'drivers/gpu/drm/amd/include/asic_reg/gen/gen_{number:010x}_sh_mask.h'] = self._large_file(number)
+        if self.rng.random() < self.config['binary_ratio']:
+            self.stats['binary_files'] += 1
+            extra[f'firmware/synthetic/fw_{self.rng.getrandbits(40):010x}.bin'] = self.rng.randbytes(
+                self.rng.randint(4096, 65536))
+        return {'slot': slot, 'value': self.rng.randint(1, 10 ** 6), 'subject': subject, 'body': body,
+                'author': author, 'extra': extra}
+
+    def _apply(self, fast_import, ref, parents, values, change, message=None, value=None):
+        values[change['slot']] = change['value'] if value is None else value
+        path = self.slot_file[change['slot']]
+        files = {path: self._render(path, values)}
+        files.update(change['extra'])
+        mark, timestamp = self._next()
+        fast_import.commit(ref, mark, change['author'], timestamp,
+                           message or f"{change['subject']}\n\n{change['body']}", parents, files)
+        return mark
+
+    def _backport(self, fast_import, ref, parent, values, change, upstream_sha, style):
+        """把主线提交backport到stable或厂商分支，按比例带上游引用或修改内容"""
+        self.stats['backports'] += 1
+        message = f"{change['subject']}\n\n{change['body']}"
+        if self.rng.random() < self.config['upstream_ref_ratio']:
+            self.stats['backports_with_ref'] += 1
+            if style == 'stable':
+                message = f"{change['subject']}\n\ncommit {upstream_sha} upstream.\n\n{change['body']}"
+            else:
+                message = f"{change['subject']}\n\n{change['body']}(cherry picked from commit {upstream_sha})\n"
+        value = None
+        if self.rng.random() < self.config['modified_backport_ratio']:
+            # 解决冲突时改动了内容，patch-id不再相同
+            self.stats['modified_backports'] += 1
+            value = change['value'] + 1
+        return self._apply(fast_import, ref, [parent], values, change, message, value)
+
+    def _tag(self, fast_import, name, mark):
+        fast_import.tag(name, mark, 'Linus Torvalds <torvalds@example.org>', self.timestamp, f'Linux {name[1:]}\n')
+        self.stats['tags'].append(name)
+
+    def _read_marks(self):
+        shas = {}
+        with open(self.marks_file, encoding='utf-8') as f:
+            for line in f:
+                mark, sha = line.split()
+                shas[int(mark[1:])] = sha
+        return shas
+
+    def generate(self):
+        """生成仓库，返回统计信息"""
+        config = self.config
+        major, minor = (int(part) for part in config['base_version'].split('.'))
+
+        # 第一遍：主线（导出mark以便第二遍在backport消息中引用真实SHA）
+        fast_import = _FastImport(self.path, self.marks_file)
+        files = {path: self._render(path, {}) for path in self.files}
+        files['MAINTAINERS'] = self._maintainers()
+        files['Makefile'] = f'VERSION = {major}\nPATCHLEVEL = {minor}\n'
+        mark, timestamp = self._next()
+        fast_import.commit('refs/heads/master', mark, 'Linus Torvalds <torvalds@example.org>', timestamp,
+                           f'Linux {major}.{minor}\n', [], files)
+        tip = mark
+        self._tag(fast_import, f'v{major}.{minor}', tip)
+
+        mainline_values = {}
+        release_points = [(f'{major}.{minor}', tip, {})]
+        mainline_changes = []  # 每个发布窗口的 [(mark, change)]
+        for release in range(1, config['releases'] + 1):
+            window = []
+            remaining = config['commits_per_release']
+            while remaining > 0:
+                # 每个主题分支从当前主线分出，随后以合并提交并入
+                size = min(remaining, self.rng.randint(1, config['topic_size'] * 2 - 1))
+                remaining -= size
+                topic_tip = tip
+                touched = {}
+                for _ in range(size):
+                    change = self._new_change()
+                    topic_tip = self._apply(fast_import, 'refs/heads/topic', [topic_tip], mainline_values, change)
+                    touched[self.slot_file[change['slot']]] = True
+                    touched.update(dict.fromkeys(change['extra']))
+                    window.append((topic_tip, change))
+                    self.stats['mainline_commits'] += 1
+                merged = {path: self._render(path, mainline_values) for path in touched if path in self.files}
+                for _, change in window[-size:]:
+                    merged.update(change['extra'])
+                mark, timestamp = self._next()
+                maintainer = self.rng.choice(self.authors)
+                fast_import.commit('refs/heads/master', mark, 'Linus Torvalds <torvalds@example.org>', timestamp,
+                                   f"Merge tag 'topic-{mark}' of git://git.example.org/pub/scm/linux\n\n"
+                                   f"Pull updates from {maintainer.split(' <')[0]}.\n", [tip, topic_tip], merged)
+                tip = mark
+                self.stats['merge_commits'] += 1
+            mainline_changes.append(window)
+            version_name = f'{major}.{minor + release}'
+            mark, timestamp = self._next()
+            fast_import.commit('refs/heads/master', mark, 'Linus Torvalds <torvalds@example.org>', timestamp,
+                               f'Linux {version_name}\n', [tip],
+                               {'Makefile': f'VERSION = {major}\nPATCHLEVEL = {minor + release}\n'})
+            tip = mark
+            self._tag(fast_import, f'v{version_name}', tip)
+            release_points.append((version_name, tip, dict(mainline_values)))
+        fast_import.close()
+        shas = self._read_marks()
+
+        # 第二遍：stable分支和厂商分支
+        fast_import = _FastImport(self.path, self.marks_file, import_marks=True)
+        vendor_base = None
+        for branch in range(min(config['stable_branches'], len(release_points) - 1)):
+            version_name, base_mark, base_values = release_points[branch]
+            values = dict(base_values)
+            ref = f'refs/heads/linux-{version_name}.y'
+            # 之后所有窗口的主线提交都可能被backport，按上游顺序应用
+            candidates = [item for window in mainline_changes[branch:] for item in window]
+            count = min(len(candidates), int(config['commits_per_release'] * config['backport_ratio']))
+            picked = sorted(self.rng.sample(range(len(candidates)), count))
+            per_release = max(1, -(-count // config['stable_releases']))
+            tip = base_mark
+            applied = 0
+            for point in range(1, config['stable_releases'] + 1):
+                for index in picked[applied:applied + per_release]:
+                    upstream_mark, change = candidates[index]
+                    tip = self._backport(fast_import, ref, tip, values, change, shas[upstream_mark], 'stable')
+                applied += per_release
+                for _ in range(config['stable_only_commits']):
+                    tip = self._apply(fast_import, ref, [tip], values, self._new_change())
+                    self.stats['stable_only_commits'] += 1
+                mark, timestamp = self._next()
+                fast_import.commit(ref, mark, 'Greg Kroah-Hartman <gregkh@example.org>', timestamp,
+                                   f'Linux {version_name}.{point}\n', [tip],
+                                   {'Makefile': f'VERSION = {major}\nPATCHLEVEL = {version_name.split(".")[1]}\n'
+                                                f'SUBLEVEL = {point}\n'})
+                tip = mark
+                self._tag(fast_import, f'v{version_name}.{point}', tip)
+            if vendor_base is None:
+                vendor_base = (tip, values, {c['slot'] for _, c in (candidates[i] for i in picked)})
+
+        if vendor_base is not None:
+            tip, values, backported = vendor_base
+            values = dict(values)
+            ref = 'refs/heads/vendor'
+            candidates = [item for window in mainline_changes for item in window
+                          if item[1]['slot'] not in backported]
+            picked = set(self.rng.sample(range(len(candidates)), min(len(candidates), config['vendor_backports'])))
+            plan = [('backport', index) for index in sorted(picked)] + [('own', None)] * config['vendor_commits']
+            # 厂商补丁穿插在backport之间，backport之间保持上游顺序
+            own_positions = set(self.rng.sample(range(len(plan)), config['vendor_commits']))
+            backports = iter(item for item in plan if item[0] == 'backport')
+            for position in range(len(plan)):
+                if position in own_positions:
+                    tip = self._apply(fast_import, ref, [tip], values, self._new_change())
+                    self.stats['vendor_commits'] += 1
+                else:
+                    upstream_mark, change = candidates[next(backports)[1]]
+                    tip = self._backport(fast_import, ref, tip, values, change, shas[upstream_mark], 'vendor')
+        fast_import.close()
+
+        subprocess.run(['git', 'symbolic-ref', 'HEAD', 'refs/heads/master'], cwd=self.path, check=True)
+        subprocess.run(['git', 'update-ref', '-d', 'refs/heads/topic'], cwd=self.path, check=True)
+        os.remove(self.marks_file)
+        return self.stats
+
+def generate_repo(path, config):
+    """在path生成合成仓库（path须不存在或为空目录），返回统计信息"""
+    os.makedirs(path, exist_ok=True)
+    if os.listdir(path):
+        raise RuntimeError(f'{path} 不是空目录')
+    subprocess.run(['git', 'init', '-q', path], check=True)
+    stats = SyntheticKernelRepo(path, config).generate()
+    with open(os.path.join(path, '.git', CONFIG_FILE_NAME), 'w', encoding='utf-8') as f:
+        json.dump({'config': config, 'stats': stats}, f, ensure_ascii=False, indent=2)
+    return stats
+
+def prepare_repo(path, config):
+    """复用参数相同的已有合成仓库，否则重新生成，返回 (统计信息, 生成耗时)"""
+    config_path = os.path.join(path, '.git', CONFIG_FILE_NAME)
+    if os.path.exists(config_path):
+        with open(config_path, encoding='utf-8') as f:
+            existing = json.load(f)
+        if existing['config'] == config:
+            print(f"♻️  复用已有的合成仓库: {path}")
+            return existing['stats'], None
+        print(f"🔄 生成参数已变化，重新生成: {path}")
+        shutil.rmtree(path)
+    elif os.path.isdir(path) and os.listdir(path):
+        raise RuntimeError(f'{path} 已存在且不是本工具生成的仓库')
+
+    print(f"🏗️  生成合成仓库: {path}")
+    start = time.perf_counter()
+    stats = generate_repo(path, config)
+    return stats, time.perf_counter() - start
+
+def _cpu_seconds():
+    """本进程及已回收子进程（git）的CPU时间之和"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def _measure(results, name, func, count=None):
+    """执行func并记录耗时，count 从返回值得到处理的条目数；分析脚本的输出被丢弃"""
+    wall_start, cpu_start = time.perf_counter(), _cpu_seconds()
+    with contextlib.redirect_stdout(io.StringIO()):
+        value = func()
+    seconds = time.perf_counter() - wall_start
+    items = count(value) if count else None
+    results[name] = {
+        'seconds': seconds,
+        'cpu_seconds': _cpu_seconds() - cpu_start,
+        'items': items,
+        'items_per_second': items / seconds if items and seconds > 0 else None
+    }
+    return value
+
+def _reset_analysis_caches(analysis):
+    """清空分析模块的进程内缓存，保证每轮计时从同样的状态开始"""
+    import maintainers_index
+    with analysis.cache_lock:
+        analysis.patch_id_cache.clear()
+        analysis.upstream_ref_cache.clear()
+    maintainers_index._loaded_indexes.clear()
+
+def time_analysis_stages(analysis, source, target, work_dir):
+    """按 run_analysis 的步骤依次计时各阶段（不做流水线重叠，便于单独观察每个阶段）"""
+    results = {}
+    _reset_analysis_caches(analysis)
+    merge_base = _measure(results, 'merge_base', lambda: analysis.find_merge_base(target, source))
+
+    def build_index():
+        target_commits = analysis.get_target_commits(target, merge_base)
+        keys = analysis.build_upstream_keys(target_commits)
+        return target_commits, keys, analysis.build_target_branch_patch_index(target, merge_base, target_commits)
+    target_commits, target_keys, target_index = _measure(results, 'index_build', build_index,
+                                                         lambda value: len(value[0]))
+
+    def check_uniqueness():
+        parsed = analysis.get_source_commits(f'{merge_base}..{source}')
+        matches = analysis.match_upstream_keys(parsed, target_keys)
+        remaining = [c for c in parsed if c['full_hash'] not in matches]
+        return parsed, analysis.check_unique_commits_parallel(remaining, target_index)[0]
+    parsed, unique_commits = _measure(results, 'uniqueness', check_uniqueness, lambda value: len(value[0]))
+
+    details = _measure(results, 'details', lambda: analysis.get_commit_details_batch(unique_commits), len)
+
+    def classify():
+        maintainers = analysis.load_maintainers_index(source)
+        batch = [(c['subject'], details[c['commit_hash']]['file_list']) for c in unique_commits]
+        classifications = analysis.get_classifier().classify_batch(batch)
+        return [analysis.build_analysis_record(commit, details[commit['commit_hash']], categories, patch_type,
+                                               maintainers)
+                for commit, (categories, patch_type) in zip(unique_commits, classifications)]
+    records = _measure(results, 'classification', classify, len)
+
+    def write_excel():
+        df, category_map = analysis.build_commit_fact_table(records)
+        groups = category_map.groupby(category_map, sort=False).groups
+        excel_data = {analysis.DETAIL_SHEET_NAME: df}
+        for category, rows in groups.items():
+            excel_data[f'{category}独有补丁'[:31]] = analysis.category_sheet_view(df, category, rows)
+        analysis.create_formatted_excel(os.path.join(work_dir, 'stages.xlsx'), excel_data)
+        return records
+    _measure(results, 'excel_write', write_excel, len)
+    return results
+
+def time_end_to_end(analysis, source, target, work_dir, jobs):
+    """完整运行 run_analysis：无持久化缓存、首次填充缓存、缓存已热三种情况"""
+    results = {}
+    summary = {}
+
+    def run(name):
+        _reset_analysis_caches(analysis)
+        output = os.path.join(work_dir, f'{name}.xlsx')
+        summary.update(_measure(results, name, lambda: analysis.run_analysis(source, target, output, jobs),
+                                lambda value: value['total_commits']))
+
+    store = analysis.patch_id_store
+    analysis.patch_id_store = None
+    run('cold')
+    cache_dir = os.path.join(work_dir, 'cache')
+    with contextlib.redirect_stdout(io.StringIO()):
+        analysis.init_patch_id_store(cache_dir)
+    try:
+        run('cache_populate')
+        run('cache_warm')
+    finally:
+        analysis.patch_id_store.close()
+        analysis.patch_id_store = store
+    return results, summary
+
+def time_sweep(repo_path, work_dir, jobs, chain):
+    """以子进程运行 compare_adjacent_versions.py 比较全部相邻stable标签"""
+    output_dir = os.path.join(work_dir, 'sweep-chain' if chain else 'sweep')
+    cmd = [sys.executable, os.path.join(repo_path, 'compare_adjacent_versions.py'), '--min-version', 'v0.0.0',
+           '--output-dir', output_dir, '--no-cache', '--force', '--jobs', str(jobs)]
+    if chain:
+        cmd.append('--chain')
+    start, cpu_start = time.perf_counter(), _cpu_seconds()
+    result = subprocess.run(cmd, cwd=repo_path, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f'compare_adjacent_versions.py 失败: {result.stderr.strip()[-500:]}')
+    with open(os.path.join(output_dir, 'manifest.json'), encoding='utf-8') as f:
+        pairs = len(json.load(f))
+    return {'seconds': seconds, 'cpu_seconds': _cpu_seconds() - cpu_start, 'items': pairs,
+            'items_per_second': pairs / seconds if seconds > 0 else None}
+
+def _link_tool(repo_path):
+    """compare_adjacent_versions.py 从当前目录调用分析脚本，把工具文件链接到合成仓库的工作区"""
+    names = [name for name in os.listdir(TOOL_DIR) if name.endswith('.py') or name == 'patch_rules.toml']
+    for name in names:
+        target = os.path.join(repo_path, name)
+        if os.path.lexists(target):
+            os.remove(target)
+        os.symlink(os.path.join(TOOL_DIR, name), target)
+    exclude_path = os.path.join(repo_path, '.git', 'info', 'exclude')
+    with open(exclude_path, 'a+', encoding='utf-8') as f:
+        f.seek(0)
+        excluded = set(f.read().splitlines())
+        f.write(''.join(f'/{name}\n' for name in names if f'/{name}' not in excluded))
+
+def _git_output(args, cwd):
+    result = subprocess.run(['git'] + args, cwd=cwd, capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def _aggregate(runs):
+    """多轮结果取中位数，并保留每轮的耗时"""
+    merged = {}
+    for name in runs[0]:
+        samples = [run[name] for run in runs]
+        seconds = statistics.median(s['seconds'] for s in samples)
+        items = samples[0]['items']
+        merged[name] = {
+            'seconds': seconds,
+            'cpu_seconds': statistics.median(s['cpu_seconds'] for s in samples),
+            'items': items,
+            'items_per_second': items / seconds if items and seconds > 0 else None,
+            'runs': [s['seconds'] for s in samples]
+        }
+    return merged
+
+def run_benchmark(config, repo_path=None, keep_repo=False, jobs=None, repeat=1, sweep=True):
+    """生成（或复用）合成仓库并运行全部计时，返回结果字典"""
+    temp_root = tempfile.mkdtemp(prefix='patch-analysis-bench-')
+    repo_path = os.path.abspath(repo_path or os.path.join(temp_root, 'repo'))
+    work_dir = os.path.join(temp_root, 'work')
+    os.makedirs(work_dir)
+    original_cwd = os.getcwd()
+    try:
+        repo_stats, generate_seconds = prepare_repo(repo_path, config)
+        _link_tool(repo_path)
+        os.chdir(repo_path)
+
+        sys.path.insert(0, TOOL_DIR)
+        import generate_patch_analysis as analysis
+        import git_executor
+        jobs = git_executor.configure(jobs).jobs
+        source, target = 'vendor', 'master'
+
+        stage_runs, end_to_end_runs, sweep_runs = [], [], []
+        summary = {}
+        for round_index in range(1, repeat + 1):
+            print(f"⏱️  第 {round_index}/{repeat} 轮: 分阶段计时 {source} vs {target}...")
+            stage_runs.append(time_analysis_stages(analysis, source, target, work_dir))
+            print(f"⏱️  第 {round_index}/{repeat} 轮: 完整分析...")
+            end_to_end, summary = time_end_to_end(analysis, source, target, work_dir, jobs)
+            end_to_end_runs.append(end_to_end)
+            if sweep:
+                print(f"⏱️  第 {round_index}/{repeat} 轮: 相邻版本比较...")
+                sweep_runs.append({'subprocess': time_sweep(repo_path, work_dir, jobs, False),
+                                   'chain': time_sweep(repo_path, work_dir, jobs, True)})
+
+        measurements = {}
+        for prefix, runs in (('stage', stage_runs), ('end_to_end', end_to_end_runs), ('sweep', sweep_runs)):
+            if runs:
+                for name, value in _aggregate(runs).items():
+                    measurements[f'{prefix}.{name}'] = value
+
+        return {
+            'format_version': RESULT_FORMAT_VERSION,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'tool': {'commit': _git_output(['rev-parse', 'HEAD'], TOOL_DIR),
+                     'dirty': bool(_git_output(['status', '--porcelain', '--untracked-files=no'], TOOL_DIR))},
+            'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                            'cpu_count': os.cpu_count(), 'git': _git_output(['--version'], repo_path)},
+            'config': config,
+            'jobs': jobs,
+            'repeat': repeat,
+            'repository': {
+                'source': source,
+                'target': target,
+                'generate_seconds': generate_seconds,
+                'commits': int(_git_output(['rev-list', '--all', '--count'], repo_path) or 0),
+                'stats': repo_stats
+            },
+            'analysis_summary': {key: summary.get(key) for key in (
+                'total_commits', 'equivalent_count', 'unique_count', 'upstream_match_count', 'patch_id_match_count'
+            )},
+            'measurements': measurements,
+            'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        }
+    finally:
+        os.chdir(original_cwd)
+        if keep_repo:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            print(f"📁 合成仓库保留在: {repo_path}")
+        else:
+            shutil.rmtree(temp_root, ignore_errors=True)
+
+def print_results(results):
+    print(f"\n📊 基准测试结果（git并发进程: {results['jobs']}，{results['repeat']} 轮取中位数）")
+    repository = results['repository']
+    print(f"📦 合成仓库: {repository['commits']} 个提交，{len(repository['stats']['tags'])} 个标签")
+    for name, value in results['measurements'].items():
+        rate = f"{value['items_per_second']:.0f} 项/秒" if value['items_per_second'] else ''
+        print(f"  {name:<28} {value['seconds']:9.3f}s  CPU {value['cpu_seconds']:9.3f}s  {rate}")
+
+def compare_results(old_path, new_path, threshold=10.0):
+    """对比两次结果的各项耗时，返回变慢超过阈值（百分比）的项目数"""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    if old.get('config') != new.get('config'):
+        print("⚠️  两次结果的仓库生成参数不同，耗时不能直接比较")
+
+    print(f"📊 {old['tool']['commit'][:12] if old['tool']['commit'] else '?'} → "
+          f"{new['tool']['commit'][:12] if new['tool']['commit'] else '?'}")
+    regressions = 0
+    for name, value in new['measurements'].items():
+        before = old['measurements'].get(name)
+        if before is None:
+            print(f"  {name:<28} {'':>9}   → {value['seconds']:9.3f}s  (新增)")
+            continue
+        change = (value['seconds'] - before['seconds']) / before['seconds'] * 100 if before['seconds'] else 0.0
+        marker = ''
+        if change > threshold:
+            marker = '  ⚠️ 变慢'
+            regressions += 1
+        elif change < -threshold:
+            marker = '  ✅ 变快'
+        print(f"  {name:<28} {before['seconds']:9.3f}s → {value['seconds']:9.3f}s  {change:+7.1f}%{marker}")
+    return regressions
+
+def _add_config_arguments(parser):
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help='仓库规模（默认: small）')
+    parser.add_argument('--seed', type=int, help='随机种子（默认: 1）')
+    parser.add_argument('--releases', type=int, help='主线发布（合并窗口）数量')
+    parser.add_argument('--commits-per-release', type=int, help='每个合并窗口的主线提交数')
+    parser.add_argument('--stable-branches', type=int, help='stable分支数量')
+    parser.add_argument('--stable-releases', type=int, help='每个stable分支的小版本数')
+    parser.add_argument('--stable-only-commits', type=int, help='每个stable小版本独有的提交数')
+    parser.add_argument('--backport-ratio', type=float, help='每个stable分支backport的提交数占一个窗口提交数的比例')
+    parser.add_argument('--upstream-ref-ratio', type=float, help='backport消息中带上游提交引用的比例')
+    parser.add_argument('--modified-backport-ratio', type=float, help='backport时内容被改动（patch-id不同）的比例')
+    parser.add_argument('--vendor-commits', type=int, help='厂商分支独有的提交数')
+    parser.add_argument('--vendor-backports', type=int, help='厂商分支从主线backport的提交数')
+    parser.add_argument('--large-diff-ratio', type=float, help='附带大文件（数千行diff）的提交比例')
+    parser.add_argument('--binary-ratio', type=float, help='附带二进制文件的提交比例')
+
+def _config_from_args(args):
+    keys = ['seed', 'releases', 'commits_per_release', 'stable_branches', 'stable_releases',
+            'stable_only_commits', 'backport_ratio', 'upstream_ref_ratio', 'modified_backport_ratio',
+            'vendor_commits', 'vendor_backports', 'large_diff_ratio', 'binary_ratio']
+    return build_config(args.scale, {key: getattr(args, key) for key in keys})
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='补丁分析工具的性能基准测试（离线生成合成内核仓库）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""使用示例:
+  %(prog)s run --scale small --output bench_results.json
+  %(prog)s run --repo /tmp/synthetic-linux --scale medium --repeat 3
+  %(prog)s generate /tmp/synthetic-linux --scale large
+  %(prog)s compare old.json new.json --threshold 10
+        """
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='生成合成仓库并计时')
+    _add_config_arguments(run_parser)
+    run_parser.add_argument('--repo', help='合成仓库路径，参数相同时复用（默认: 临时目录，结束后删除）')
+    run_parser.add_argument('--keep-repo', action='store_true', help='保留临时生成的合成仓库')
+    run_parser.add_argument('-j', '--jobs', type=int, help='git并发进程数（默认按CPU核数确定）')
+    run_parser.add_argument('--repeat', type=int, default=1, help='重复轮数，结果取中位数（默认: 1）')
+    run_parser.add_argument('--skip-sweep', action='store_true', help='不计时 compare_adjacent_versions.py')
+    run_parser.add_argument('-o', '--output', default='bench_results.json', help='结果JSON文件（默认: bench_results.json）')
+
+    generate_parser = subparsers.add_parser('generate', help='只生成合成仓库')
+    generate_parser.add_argument('path', help='仓库路径（须不存在或为空目录）')
+    _add_config_arguments(generate_parser)
+
+    compare_parser = subparsers.add_parser('compare', help='对比两次基准测试结果')
+    compare_parser.add_argument('old', help='基准结果JSON')
+    compare_parser.add_argument('new', help='新的结果JSON')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help='报告变慢的百分比阈值（默认: 10）')
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        regressions = compare_results(args.old, args.new, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    config = _config_from_args(args)
+    if args.command == 'generate':
+        start = time.perf_counter()
+        stats = generate_repo(os.path.abspath(args.path), config)
+        print(f"✅ 已生成 {args.path}: 主线 {stats['mainline_commits']} 个提交，backport {stats['backports']} 个，"
+              f"{len(stats['tags'])} 个标签，耗时 {time.perf_counter() - start:.1f} 秒")
+        return
+
+    results = run_benchmark(config, args.repo, args.keep_repo, args.jobs, max(1, args.repeat), not args.skip_sweep)
+    print_results(results)
+    temp_path = f'{args.output}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, args.output)
+    print(f"💾 结果已写入: {args.output}")
+
+if __name__ == "__main__":
+    main()
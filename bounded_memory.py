@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存受限模式的数据结构
+
+跨大版本比较时两侧都有数万个提交。内存受限模式按固定大小的块处理源提交，
+进程中只保留：
+- 目标侧的patch-id和上游引用键，以20字节二进制保存在排好序的numpy数组中
+  （40位十六进制字符串对象每个约占90字节，数组中只占20字节）；
+- 当前块的提交和记录，记录使用 __slots__ 对象而不是每行一个字典。
+已完成的行立即写入临时SQLite文件，生成报告时各工作表从中按需流式读取。
+"""
+
+import os
+import sqlite3
+import subprocess
+import tempfile
+
+import numpy as np
+
+HASH_BYTES = 20
+
+# 独有补丁记录的字段及对应的报告列名（与详情表一致）
+ROW_FIELDS = (
+    ('commit_hash', '提交哈希'),
+    ('author', '作者'),
+    ('date', '日期'),
+    ('subject', '提交标题'),
+    ('full_message', '完整提交信息'),
+    ('changed_files', '修改文件'),
+    ('detailed_files', '文件变更详情'),
+    ('categories', '分类'),
+    ('patch_type', '类型'),
+    ('subsystems', '子系统'),
+    ('maintainers', '维护者'),
+)
+MAINTAINER_FIELDS = ('subsystems', 'maintainers')
+EQUIVALENT_COLUMNS = ('提交哈希', '作者', '日期', '提交标题', '匹配方式', '匹配依据')
+
+class HashSet:
+    """SHA-1形式的十六进制值（patch-id、提交SHA）的紧凑集合
+
+    add() 只追加，第一次查询时排序去重；查询整批进行，由 numpy.searchsorted 完成。
+    """
+
+    def __init__(self):
+        self._array = np.empty(0, dtype=f'S{HASH_BYTES}')
+        self._pending = []
+
+    @staticmethod
+    def _pack(hex_values):
+        hex_values = [h for h in hex_values if h and len(h) == HASH_BYTES * 2]
+        if not hex_values:
+            return np.empty(0, dtype=f'S{HASH_BYTES}')
+        return np.frombuffer(bytes.fromhex(''.join(hex_values)), dtype=f'S{HASH_BYTES}')
+
+    def add(self, hex_values):
+        packed = self._pack(hex_values)
+        if len(packed):
+            self._pending.append(packed)
+
+    def _merge(self):
+        if self._pending:
+            self._array = np.unique(np.concatenate([self._array] + self._pending))
+            self._pending = []
+
+    def contains(self, hex_values):
+        """返回与 hex_values 一一对应的布尔列表"""
+        self._merge()
+        result = [False] * len(hex_values)
+        positions = [i for i, h in enumerate(hex_values) if h and len(h) == HASH_BYTES * 2]
+        if not positions or not len(self._array):
+            return result
+        queries = self._pack([hex_values[i] for i in positions])
+        index = np.minimum(np.searchsorted(self._array, queries), len(self._array) - 1)
+        for position, found in zip(positions, self._array[index] == queries):
+            result[position] = bool(found)
+        return result
+
+    def __len__(self):
+        self._merge()
+        return len(self._array)
+
+    @property
+    def nbytes(self):
+        return self._array.nbytes + sum(a.nbytes for a in self._pending)
+
+class UniqueRow:
+    """一条独有补丁记录，categories 为分类列表"""
+
+    __slots__ = tuple(field for field, _ in ROW_FIELDS)
+
+    def __init__(self, **values):
+        for field, _ in ROW_FIELDS:
+            setattr(self, field, values.get(field, ''))
+
+    def values(self, with_maintainers=True):
+        """按报告列的顺序返回各列的值，分类合并为字符串"""
+        return tuple(', '.join(self.categories) if field == 'categories' else getattr(self, field)
+                     for field, _ in ROW_FIELDS if with_maintainers or field not in MAINTAINER_FIELDS)
+
+def row_columns(with_maintainers=True):
+    return [column for field, column in ROW_FIELDS if with_maintainers or field not in MAINTAINER_FIELDS]
+
+class RowSource:
+    """可以重复遍历的行来源，供报告写入器代替DataFrame使用
+
+    iterate 是无参函数，每次调用返回一个新的行迭代器（每行为值的序列）。
+    """
+
+    def __init__(self, columns, iterate):
+        self.columns = list(columns)
+        self._iterate = iterate
+
+    def rows(self):
+        return self._iterate()
+
+def iter_git_lines(args):
+    """流式读取git命令的输出行，不把整个输出读入内存"""
+    proc = subprocess.Popen(['git'] + args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        for line in proc.stdout:
+            line = line.decode('utf-8', errors='replace').rstrip('\n')
+            if line:
+                yield line
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+def iter_chunks(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+class RowSpill:
+    """已完成的行写入的临时SQLite文件，close() 时删除"""
+
+    def __init__(self, with_maintainers=True, directory=None):
+        self.with_maintainers = with_maintainers
+        self.columns = row_columns(with_maintainers)
+        self.row_count = 0
+        self.equivalent_count = 0
+        self._category_order = 0
+        fd, self.path = tempfile.mkstemp(prefix='patch-analysis-spill-', suffix='.sqlite', dir=directory)
+        os.close(fd)
+        self._conn = sqlite3.connect(self.path)
+        # 临时文件，崩溃后不需要恢复；页缓存限制在2MB左右
+        self._conn.execute('PRAGMA journal_mode=OFF')
+        self._conn.execute('PRAGMA synchronous=OFF')
+        self._conn.execute('PRAGMA cache_size=-2048')
+        self._conn.execute(f'CREATE TABLE rows (seq INTEGER PRIMARY KEY, '
+                           f'{", ".join(_quote(c) for c in self.columns)})')
+        self._conn.execute('CREATE TABLE row_categories (ord INTEGER PRIMARY KEY, seq INTEGER, category TEXT)')
+        self._conn.execute(f'CREATE TABLE equivalents (seq INTEGER PRIMARY KEY, '
+                           f'{", ".join(_quote(c) for c in EQUIVALENT_COLUMNS)})')
+
+    def append_rows(self, rows):
+        """追加一块独有补丁记录（UniqueRow），返回它们在详情表中的序号"""
+        placeholders = ', '.join('?' * (len(self.columns) + 1))
+        first = self.row_count
+        self._conn.executemany(f'INSERT INTO rows VALUES ({placeholders})',
+                               ((first + i,) + row.values(self.with_maintainers) for i, row in enumerate(rows)))
+        categories = []
+        for i, row in enumerate(rows):
+            for category in row.categories:
+                categories.append((self._category_order, first + i, category))
+                self._category_order += 1
+        self._conn.executemany('INSERT INTO row_categories VALUES (?, ?, ?)', categories)
+        self._conn.commit()
+        self.row_count += len(rows)
+        return range(first, self.row_count)
+
+    def append_equivalents(self, rows):
+        """追加一块等价提交（值的顺序同 EQUIVALENT_COLUMNS）"""
+        first = self.equivalent_count
+        self._conn.executemany(f'INSERT INTO equivalents VALUES ({", ".join("?" * (len(EQUIVALENT_COLUMNS) + 1))})',
+                               ((first + i,) + tuple(row) for i, row in enumerate(rows)))
+        self._conn.commit()
+        self.equivalent_count += len(rows)
+
+    def category_counts(self):
+        """各分类的补丁数，按数量降序，数量相同时按首次出现的顺序"""
+        return self._conn.execute(
+            'SELECT category, COUNT(*) AS n FROM row_categories GROUP BY category ORDER BY n DESC, MIN(ord)'
+        ).fetchall()
+
+    def value_counts(self, column, separator=None, empty=None):
+        """某列取值的计数，按数量降序，数量相同时按首次出现的顺序
+
+        separator 不为空时先按它拆分单元格；empty 不为空时把空值计为该名称。
+        """
+        counts = {}
+        for (value,) in self._conn.execute(f'SELECT {_quote(column)} FROM rows ORDER BY seq'):
+            for item in (value.split(separator) if separator is not None else [value]):
+                if empty is not None and item == '':
+                    item = empty
+                counts[item] = counts.get(item, 0) + 1
+        return sorted(counts.items(), key=lambda item: -item[1])
+
+    def _select(self, query, params=()):
+        def iterate():
+            # 报告写入期间不再写入，使用独立的游标即可并行遍历多个工作表
+            yield from self._conn.execute(query, params)
+        return iterate
+
+    def detail_table(self):
+        columns = ', '.join(_quote(c) for c in self.columns)
+        return RowSource(self.columns, self._select(f'SELECT {columns} FROM rows ORDER BY seq'))
+
+    def category_rows(self, category, columns):
+        """属于某分类的行，返回 (详情表序号, 各列值) 的迭代函数"""
+        selected = ', '.join(f'r.{_quote(c)}' for c in columns)
+        return self._select(
+            f'SELECT r.seq, {selected} FROM rows r JOIN row_categories c ON c.seq = r.seq '
+            f'WHERE c.category = ? ORDER BY r.seq', (category,)
+        )
+
+    def equivalent_table(self):
+        columns = ', '.join(_quote(c) for c in EQUIVALENT_COLUMNS)
+        return RowSource(EQUIVALENT_COLUMNS, self._select(f'SELECT {columns} FROM equivalents ORDER BY seq'))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据驱动的提交分类器
+
+分类和补丁类型规则从TOML文件（默认是同目录下的 patch_rules.toml）加载：
+每个分类的标题关键词编译为一个正则，文件路径规则放进前缀树，按单个路径
+匹配而不是在拼接后的文件列表字符串里做子串搜索。新增分类只需修改规则文件。
+"""
+
+import os
+import re
+
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patch_rules.toml')
+
+class PrefixTrie:
+    """字符级前缀树：查询一个路径命中的所有前缀对应的值，耗时与路径长度成正比"""
+
+    _VALUES = object()
+
+    def __init__(self):
+        self._root = {}
+        self._memo = {}
+
+    def add(self, prefix, value):
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node.setdefault(self._VALUES, set()).add(value)
+        self._memo.clear()
+
+    def lookup(self, path):
+        """返回所有是path前缀的键对应的值集合"""
+        cached = self._memo.get(path)
+        if cached is not None:
+            return cached
+
+        matched = set()
+        node = self._root
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            values = node.get(self._VALUES)
+            if values:
+                matched |= values
+
+        result = frozenset(matched)
+        # 内核路径大量重复，缓存查询结果；限制大小避免无限增长
+        if len(self._memo) < 1000000:
+            self._memo[path] = result
+        return result
+
+def _compile_keywords(keywords):
+    """把关键词列表编译为一个子串匹配正则，空列表返回None"""
+    keywords = [k.lower() for k in keywords if k]
+    if not keywords:
+        return None
+    return re.compile('|'.join(re.escape(k) for k in sorted(set(keywords))))
+
+class CommitClassifier:
+    """按规则对提交进行分类并确定补丁类型"""
+
+    def __init__(self, rules):
+        self.default_category = rules.get('default_category', '其他')
+        self.default_patch_type = rules.get('default_patch_type', '其他')
+
+        self.categories = []
+        self.path_trie = PrefixTrie()
+        # 各分类的路径前缀（保留原始大小写），按分类限定分析范围时转换为pathspec
+        self.path_prefixes = {}
+        for index, rule in enumerate(rules.get('category', [])):
+            vetoes = [
+                (_compile_all_keywords(veto.get('requires', [])), _compile_keywords(veto.get('keywords', [])))
+                for veto in rule.get('veto', [])
+            ]
+            self.categories.append((
+                rule['name'],
+                _compile_keywords(rule.get('subject_keywords', [])),
+                _compile_keywords(rule.get('exclude_subject_keywords', [])),
+                vetoes
+            ))
+            self.path_prefixes[rule['name']] = list(rule.get('path_prefixes', []))
+            for prefix in rule.get('path_prefixes', []):
+                self.path_trie.add(prefix.lower(), index)
+
+        self.patch_types = [
+            (rule['name'], _compile_keywords(rule.get('subject_keywords', [])))
+            for rule in rules.get('patch_type', [])
+        ]
+
+    def categorize(self, subject, files):
+        """返回提交所属的分类列表；files 为修改文件路径列表"""
+        subject = subject.lower()
+
+        path_hits = set()
+        for path in files:
+            path_hits |= self.path_trie.lookup(path.lower())
+
+        categories = []
+        for index, (name, keywords, excludes, vetoes) in enumerate(self.categories):
+            matched = index in path_hits
+            if not matched and keywords and keywords.search(subject):
+                matched = not (excludes and excludes.search(subject))
+
+            if matched and any(
+                all(r.search(subject) for r in requires) and keywords_any and keywords_any.search(subject)
+                for requires, keywords_any in vetoes
+            ):
+                matched = False
+
+            if matched:
+                categories.append(name)
+
+        return categories or [self.default_category]
+
+    def category_names(self):
+        return [name for name, _, _, _ in self.categories]
+
+    def patch_type(self, subject):
+        """按顺序匹配标题，返回第一个命中的补丁类型"""
+        subject = subject.lower()
+        for name, keywords in self.patch_types:
+            if keywords and keywords.search(subject):
+                return name
+        return self.default_patch_type
+
+    def classify_batch(self, commits):
+        """批量分类，commits 为 [(标题, 修改文件列表)]，返回 [(分类列表, 补丁类型)]"""
+        categorize = self.categorize
+        patch_type = self.patch_type
+        return [(categorize(subject, files), patch_type(subject)) for subject, files in commits]
+
+def _compile_all_keywords(keywords):
+    """requires 中的每个词都必须出现，分别编译"""
+    return [re.compile(re.escape(k.lower())) for k in keywords if k]
+
+def load_rules(path=None):
+    """读取规则文件（TOML）"""
+    with open(path or DEFAULT_RULES_FILE, 'rb') as f:
+        return tomllib.load(f)
+
+def load_classifier(path=None):
+    """根据规则文件创建分类器"""
+    return CommitClassifier(load_rules(path))
@@ -11,11 +11,30 @@
 
 import subprocess
 import re
+import shlex
 import sys
 import os
 from packaging import version
 import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from commit_classifier import load_classifier
+import analysis_scope
+import git_backend
+import git_executor
+import report_formats
+import run_metrics
+import work_queue
+
+MANIFEST_FILE = 'manifest.json'
+QUEUE_DIR_NAME = 'queue'
+# 分布式扫描时所有主机共享的patch-id缓存（位于输出目录中）
+SHARED_CACHE_DIR_NAME = 'patch-analysis-cache'
+WORKER_POLL_SECONDS = 30
+manifest_lock = threading.Lock()
 
 def run_git_command(cmd):
     """执行Git命令并返回结果"""
@@ -30,7 +49,7 @@ def run_git_command(cmd):
 def get_all_tags():
     """获取所有Git标签"""
     print("🔍 获取所有Git标签...")
-    tags = run_git_command("git tag -l")
+    tags = git_backend.list_refs('refs/tags/')
     return [tag for tag in tags if tag.strip()]
 
 def parse_version_tag(tag):
@@ -84,31 +103,402 @@ def check_analysis_script_exists():
         return False
     return True
 
-def run_patch_analysis(source_version, target_version, output_dir="version_comparisons"):
-    """运行补丁分析脚本"""
+def get_output_file(source_version, target_version, output_dir):
+    """生成版本对的输出文件路径"""
+    safe_source = re.sub(r'[^\w\-_.]', '_', source_version)
+    safe_target = re.sub(r'[^\w\-_.]', '_', target_version)
+    return os.path.join(output_dir, f"{safe_target}-to-{safe_source}-diff.xlsx")
+
+def get_output_files(source_version, target_version, output_dir, formats=('xlsx',)):
+    """版本对在各输出格式下的文件路径"""
+    output_file = get_output_file(source_version, target_version, output_dir)
+    return [report_formats.output_path(output_file, fmt) for fmt in formats]
+
+def get_metrics_file(source_version, target_version, metrics_dir):
+    """版本对的性能指标文件路径"""
+    output_file = get_output_file(source_version, target_version, metrics_dir)
+    return f"{output_file[:-len('-diff.xlsx')]}.metrics.json"
+
+def get_pair_key(source_version, target_version):
+    """版本对在清单中的键"""
+    return f"{target_version}..{source_version}"
+
+def load_manifest(output_dir):
+    """读取输出目录中记录已完成版本对的清单"""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  无法读取清单 {manifest_path}: {e}，将重新分析所有版本对")
+        return {}
+
+def save_manifest(output_dir, manifest):
+    """原子地写回清单，避免中途崩溃留下损坏的文件"""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def manifest_entry(output_dir, source_version, target_version, pair_shas, formats=('xlsx',), scope=None):
+    """已完成版本对在清单中的记录，scope 为 analysis_scope.scope_key 给出的范围标识"""
+    output_files = get_output_files(source_version, target_version, output_dir, formats)
+    return {
+        'source': source_version,
+        'target': target_version,
+        'source_sha': pair_shas[0],
+        'target_sha': pair_shas[1],
+        'formats': list(formats),
+        'scope': scope,
+        'output_file': os.path.basename(output_files[0]),
+        'output_files': [os.path.basename(f) for f in output_files],
+        # 没有独有补丁时分析脚本不会生成文件
+        'has_output': os.path.exists(output_files[0]),
+        'completed_at': datetime.now().isoformat(timespec='seconds')
+    }
+
+def record_pair_done(output_dir, manifest, source_version, target_version, pair_shas, formats=('xlsx',),
+                     scope=None):
+    """在清单中记录一个已完成的版本对"""
+    entry = manifest_entry(output_dir, source_version, target_version, pair_shas, formats, scope)
+    with manifest_lock:
+        manifest[get_pair_key(source_version, target_version)] = entry
+        save_manifest(output_dir, manifest)
+
+def is_pair_up_to_date(manifest, source_version, target_version, pair_shas, output_dir, formats=('xlsx',),
+                       scope=None):
+    """判断版本对是否已完成且标签未移动、分析范围相同、所需格式的输出文件都在"""
+    entry = manifest.get(get_pair_key(source_version, target_version))
+    if not entry:
+        return False
+    if (entry.get('source_sha'), entry.get('target_sha')) != pair_shas:
+        return False
+    if entry.get('scope') != scope:
+        return False
+    # 旧清单没有记录格式，只生成过xlsx
+    if not set(formats) <= set(entry.get('formats', ['xlsx'])):
+        return False
+    if entry.get('has_output'):
+        output_files = entry.get('output_files', [entry['output_file']])
+        return all(os.path.exists(os.path.join(output_dir, f)) for f in output_files)
+    return True
+
+def build_extra_args(formats, cache_dir=None, no_cache=False, paths=(), categories=(), shared_cache=False):
+    """传递给每次分析的缓存、格式和范围参数"""
+    extra_args = ""
+    if no_cache:
+        extra_args += " --no-cache"
+    elif cache_dir:
+        extra_args += f" --cache-dir {shlex.quote(os.path.abspath(cache_dir))}"
+    if shared_cache and not no_cache:
+        extra_args += " --shared-cache"
+    extra_args += f" --format {','.join(formats)}"
+    for path in paths:
+        extra_args += f" --path {shlex.quote(path)}"
+    for category in categories:
+        extra_args += f" --category {shlex.quote(category)}"
+    return extra_args
+
+def run_patch_analysis(source_version, target_version, output_dir="version_comparisons", extra_args="",
+                       jobs=None, log_file=None, metrics_dir=None):
+    """运行补丁分析脚本，提供 metrics_dir 时把该版本对的性能指标写入其中"""
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
 
     # 生成输出文件名
-    safe_source = re.sub(r'[^\w\-_.]', '_', source_version)
-    safe_target = re.sub(r'[^\w\-_.]', '_', target_version)
-    output_file = os.path.join(output_dir, f"{safe_target}-to-{safe_source}-diff.xlsx")
+    output_file = get_output_file(source_version, target_version, output_dir)
 
     print(f"\n🔄 分析版本差异: {target_version} -> {source_version}")
     print(f"📁 输出文件: {output_file}")
 
     # 构建命令
-    cmd = f"python3 generate_patch_analysis.py {source_version} {target_version} --output '{output_file}'"
+    cmd = f"python3 generate_patch_analysis.py {source_version} {target_version} --output '{output_file}'{extra_args}"
+    if jobs:
+        cmd += f" --jobs {jobs}"
+    if metrics_dir:
+        cmd += f" --metrics-json '{get_metrics_file(source_version, target_version, metrics_dir)}'"
 
     try:
-        result = subprocess.run(cmd, shell=True, check=True)
+        if log_file:
+            # 并行执行时各版本对的输出写入独立日志，避免相互交错
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            with open(log_file, 'w', encoding='utf-8') as log:
+                subprocess.run(cmd, shell=True, check=True, stdout=log, stderr=subprocess.STDOUT)
+        else:
+            subprocess.run(cmd, shell=True, check=True)
         print(f"✅ 分析完成: {output_file}")
         return True
     except subprocess.CalledProcessError as e:
         print(f"❌ 分析失败: {target_version} -> {source_version}")
         print(f"错误代码: {e.returncode}")
+        if log_file:
+            print(f"日志文件: {log_file}")
         return False
 
+def prefetch_chain_references(analysis, version_pairs):
+    """一次性批量读取整条标签链涉及的所有提交的上游引用
+
+    上游SHA能匹配的提交不再需要patch-id；其余提交的patch-id在各版本对分析时
+    按需计算，并通过进程内缓存保证每个提交只计算一次。
+    """
+    chain_commits = []
+    for source_version, target_version in version_pairs:
+        merge_base = run_git_command(f"git merge-base {target_version} {source_version}")
+        if not merge_base:
+            continue
+        # 目标侧索引包含合并提交，源侧只分析非合并提交，这里取两者的并集
+        chain_commits.extend(run_git_command(f"git rev-list {merge_base[0]}..{target_version}"))
+        chain_commits.extend(run_git_command(f"git rev-list --no-merges {merge_base[0]}..{source_version}"))
+
+    chain_commits = list(dict.fromkeys(c for c in chain_commits if c.strip()))
+    print(f"🔗 标签链共涉及 {len(chain_commits)} 个提交，批量读取上游引用...")
+    analysis.get_upstream_references_batch(chain_commits)
+
+def run_chain_analysis(version_pairs, output_dir, jobs, cache_dir=None, no_cache=False, on_pair_done=None,
+                       formats=('xlsx',), metrics_dir=None, paths=(), categories=()):
+    """链式模式：在同一进程内依次分析所有版本对，共享patch-id和提交详情
+
+    相邻版本对的目标侧历史大量重叠，每个提交的patch-id只计算一次，
+    总工作量与提交总数成正比，而不是与版本对数量相乘。
+    paths/categories 限定分析范围（同 generate_patch_analysis.py 的 --path/--category）。
+    返回 (成功数, 失败数)。
+    """
+    # 延迟导入，只有链式模式才需要加载pandas等依赖
+    import generate_patch_analysis as analysis
+
+    if not no_cache:
+        analysis.init_patch_id_store(cache_dir)
+    git_executor.configure(jobs)
+    scope = analysis_scope.build_scope(paths, categories, analysis.get_classifier())
+
+    # 限定范围时只有少量提交需要读取上游引用，逐个版本对读取即可
+    if scope is None:
+        prefetch_chain_references(analysis, version_pairs)
+
+    os.makedirs(output_dir, exist_ok=True)
+    successful_analyses = 0
+    failed_analyses = 0
+
+    for i, (source_version, target_version) in enumerate(version_pairs, 1):
+        print(f"\n{'='*60}")
+        print(f"📈 进度: {i}/{len(version_pairs)}")
+
+        output_file = get_output_file(source_version, target_version, output_dir)
+        print(f"\n🔄 分析版本差异: {target_version} -> {source_version}")
+        print(f"📁 输出文件: {output_file}")
+
+        try:
+            analysis.run_analysis(source_version, target_version, output_file, jobs, formats=formats, scope=scope)
+        except Exception as e:
+            print(f"❌ 分析失败: {target_version} -> {source_version}")
+            print(f"错误信息: {e}")
+            failed_analyses += 1
+            continue
+
+        if metrics_dir:
+            # 链式模式共享缓存，后面的版本对缓存命中率更高，指标按版本对分别记录
+            run_metrics.write_json(get_metrics_file(source_version, target_version, metrics_dir),
+                                   run_metrics.snapshot(), {'source': source_version, 'target': target_version})
+
+        print(f"✅ 分析完成: {output_file}")
+        successful_analyses += 1
+        if on_pair_done:
+            on_pair_done(source_version, target_version)
+
+    return successful_analyses, failed_analyses
+
+def update_report_index(output_dir):
+    """把输出目录中的新报告增量导入查询索引"""
+    # 延迟导入，report_index 依赖本模块中的版本解析函数
+    import report_index
+    ingested, unchanged, removed = report_index.ingest(output_dir)
+    print(f"🗃️  查询索引已更新: 新增/更新 {ingested} 个，未变化 {unchanged} 个，移除 {removed} 个")
+
+def get_queue(output_dir):
+    """输出目录中的分布式任务队列"""
+    return work_queue.WorkQueue(os.path.join(output_dir, QUEUE_DIR_NAME))
+
+def get_job_name(source_version, target_version):
+    """版本对在任务队列中的文件名"""
+    return work_queue.safe_name(get_pair_key(source_version, target_version))
+
+def merge_done_jobs(queue, output_dir, manifest):
+    """把队列中已完成任务的清单记录合并进清单，返回新合并的版本对数量"""
+    merged = 0
+    with manifest_lock:
+        for _, job, _ in queue.jobs('done'):
+            entry = (job.get('result') or {}).get('manifest_entry')
+            if not entry:
+                continue
+            key = get_pair_key(entry['source'], entry['target'])
+            if manifest.get(key) != entry:
+                manifest[key] = entry
+                merged += 1
+        if merged:
+            save_manifest(output_dir, manifest)
+    return merged
+
+def enqueue_pairs(queue, version_pairs, tag_shas, formats, paths, categories, scope):
+    """把版本对写入任务队列，已在等待或执行中的相同任务不重复加入，返回 (加入数, 跳过数)"""
+    queued = {name: job for state in ('pending', 'claimed') for name, job, _ in queue.jobs(state)}
+    added = 0
+    skipped = 0
+    for source, target in version_pairs:
+        name = get_job_name(source, target)
+        merge_base = run_git_command(f"git merge-base {tag_shas[target]} {tag_shas[source]}")
+        job = {
+            'source': source,
+            'target': target,
+            'source_sha': tag_shas[source],
+            'target_sha': tag_shas[target],
+            'merge_base': merge_base[0] if merge_base else None,
+            'formats': list(formats),
+            'paths': list(paths),
+            'categories': list(categories),
+            'scope': scope,
+        }
+        current = queued.get(name)
+        if current and all(current.get(key) == value for key, value in job.items()):
+            skipped += 1
+            continue
+        # 标签移动或参数变化的旧任务作废，执行中的工作进程完成时会发现租约丢失
+        queue.remove(name)
+        queue.add(name, job)
+        added += 1
+    return added, skipped
+
+def missing_commits(shas):
+    """返回本地仓库中不存在的提交"""
+    return [sha for sha in shas
+            if subprocess.run(['git', 'cat-file', '-e', f'{sha}^{{commit}}'], capture_output=True).returncode != 0]
+
+def run_queue_job(claim, worker_id, output_dir, jobs, cache_dir, no_cache, metrics_dir, lease_seconds,
+                  max_attempts):
+    """执行一个已领取的任务，返回是否成功"""
+    job = claim.job
+    source_version, target_version = job['source'], job['target']
+    print(f"\n🔄 [{worker_id}] 领取 {target_version} -> {source_version}（第 {job['attempts']} 次尝试）")
+
+    # 各主机使用自己的仓库克隆，标签必须指向与入队时相同的提交
+    local_shas = (git_backend.resolve(f"{source_version}^{{commit}}"),
+                  git_backend.resolve(f"{target_version}^{{commit}}"))
+    if local_shas != (job['source_sha'], job['target_sha']):
+        error = "本地标签指向的提交与队列不一致"
+        print(f"❌ [{worker_id}] {error}: {target_version} -> {source_version}")
+        claim.fail(error, max_attempts)
+        return False
+
+    # 分析结果会写入所有主机共享的patch-id缓存，浅克隆或不完整的克隆不能执行任务
+    required = [job['source_sha'], job['target_sha']] + ([job['merge_base']] if job.get('merge_base') else [])
+    missing = missing_commits(required)
+    if missing:
+        error = f"本地仓库缺少提交 {', '.join(sha[:12] for sha in missing)}"
+        print(f"❌ [{worker_id}] {error}: {target_version} -> {source_version}")
+        claim.fail(error, max_attempts)
+        return False
+
+    extra_args = build_extra_args(job['formats'], cache_dir, no_cache, job['paths'], job['categories'],
+                                  shared_cache=True)
+    log_name = f"{os.path.basename(get_output_file(source_version, target_version, output_dir))[:-5]}.log"
+    log_file = os.path.join(output_dir, 'logs', log_name)
+    with work_queue.LeaseKeeper(claim, lease_seconds / 4) as keeper:
+        ok = run_patch_analysis(source_version, target_version, output_dir, extra_args, jobs, log_file,
+                                metrics_dir)
+
+    if ok:
+        entry = manifest_entry(output_dir, source_version, target_version, local_shas, job['formats'],
+                               job['scope'])
+        done = claim.complete({'manifest_entry': entry, 'worker': worker_id})
+    else:
+        done = claim.fail(f"分析进程失败，日志: {os.path.relpath(log_file, output_dir)}", max_attempts)
+    if not done or keeper.lost:
+        print(f"⚠️  [{worker_id}] 任务 {claim.name} 的租约已过期并被重新放回队列，本次结果不计入")
+        return False
+    return ok
+
+def run_worker(output_dir, jobs, parallel=1, cache_dir=None, no_cache=False, metrics_dir=None):
+    """工作进程：从共享目录的任务队列中领取版本对并分析，直到队列中没有等待或执行中的任务
+
+    parallel 个线程同时领取任务，平分git并发总数。空闲时顺带处理租约过期的任务（放回队列或移入失败列表），
+    即使没有运行协调命令，崩溃主机上的任务也会被其他工作进程接手。返回 (成功数, 失败数)。
+    """
+    queue = get_queue(output_dir)
+    config = queue.load_config()
+    lease_seconds = config.get('lease_seconds', work_queue.DEFAULT_LEASE_SECONDS)
+    max_attempts = config.get('max_attempts', work_queue.DEFAULT_MAX_ATTEMPTS)
+    if not no_cache and not cache_dir:
+        # 命令行未指定时使用入队时的缓存设置，默认是输出目录中所有主机共享的缓存
+        no_cache = config.get('no_cache', False)
+        cache_dir = config.get('cache_dir') or os.path.join(output_dir, SHARED_CACHE_DIR_NAME)
+    jobs_per_pair = max(1, jobs // parallel)
+    poll_seconds = min(WORKER_POLL_SECONDS, lease_seconds / 4)
+    results = {'ok': 0, 'failed': 0}
+    results_lock = threading.Lock()
+
+    def worker_loop(index):
+        worker_id = work_queue.default_worker_id() + (f"-{index}" if parallel > 1 else "")
+        while True:
+            claim = queue.claim(worker_id)
+            if claim is None:
+                for name, worker, age, state in queue.requeue_stalled(lease_seconds, max_attempts):
+                    print(f"♻️  [{worker_id}] {worker} 的任务 {name} 已 {age:.0f} 秒没有心跳，"
+                          + ("重新放回队列" if state == 'pending' else "已达到尝试次数上限，移入失败列表"))
+                counts = queue.counts()
+                if not counts['pending'] and not counts['claimed']:
+                    return
+                if not counts['pending']:
+                    time.sleep(poll_seconds)
+                continue
+            ok = run_queue_job(claim, worker_id, output_dir, jobs_per_pair, cache_dir, no_cache, metrics_dir,
+                               lease_seconds, max_attempts)
+            with results_lock:
+                results['ok' if ok else 'failed'] += 1
+
+    print(f"👷 工作进程启动: {work_queue.default_worker_id()}，线程 {parallel}，"
+          f"每个分析进程的git并发数: {jobs_per_pair}")
+    if parallel == 1:
+        worker_loop(0)
+    else:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            for future in [executor.submit(worker_loop, i) for i in range(parallel)]:
+                future.result()
+    return results['ok'], results['failed']
+
+def show_queue_status(output_dir):
+    """协调命令：放回停滞的任务，合并已完成的结果到清单并显示进度，返回队列是否已处理完"""
+    queue = get_queue(output_dir)
+    config = queue.load_config()
+    lease_seconds = config.get('lease_seconds', work_queue.DEFAULT_LEASE_SECONDS)
+    max_attempts = config.get('max_attempts', work_queue.DEFAULT_MAX_ATTEMPTS)
+
+    for name, worker, age, state in queue.requeue_stalled(lease_seconds, max_attempts):
+        print(f"♻️  {worker} 的任务 {name} 已 {age:.0f} 秒没有心跳，"
+              + ("重新放回队列" if state == 'pending' else "已达到尝试次数上限，移入失败列表"))
+    manifest = load_manifest(output_dir)
+    merged = merge_done_jobs(queue, output_dir, manifest)
+
+    counts = queue.counts()
+    total = sum(counts.values())
+    finished = counts['done'] + counts['failed']
+    percent = finished * 100 // total if total else 100
+    print(f"\n📋 任务队列: {queue.directory}")
+    print(f"📈 进度: {finished}/{total}（{percent}%）  等待 {counts['pending']}，执行中 {counts['claimed']}，"
+          f"完成 {counts['done']}，失败 {counts['failed']}")
+
+    now = queue.now()
+    for name, job, mtime in queue.jobs('claimed'):
+        print(f"  🔄 {name}: {job.get('worker')}，第 {job.get('attempts')} 次尝试，"
+              f"已运行 {now - job.get('claimed_at', now):.0f} 秒，上次心跳 {now - mtime:.0f} 秒前")
+    for name, job, _ in queue.jobs('failed'):
+        last_error = job.get('errors', [{}])[-1]
+        print(f"  ❌ {name}: {last_error.get('error')}（{last_error.get('worker')}）")
+    if merged:
+        print(f"🗂️  已把 {merged} 个完成的版本对合并进清单")
+    return not counts['pending'] and not counts['claimed']
+
 def main():
     parser = argparse.ArgumentParser(
         description='自动比较大于指定版本的相邻Git版本',
@@ -117,6 +507,16 @@ def main():
   %(prog)s --min-version v6.6.8
   %(prog)s --min-version v6.6.8 --output-dir my_comparisons
   %(prog)s --min-version v6.6.8 --max-comparisons 5
+  %(prog)s --min-version v6.6.8 --parallel 4 --jobs 32
+  %(prog)s --min-version v6.6.8 --force
+  %(prog)s --min-version v6.6.8 --chain
+  %(prog)s --min-version v6.6.8 --chain --category RISC-V
+  %(prog)s --min-version v6.6.8 --metrics-dir version_comparisons/metrics
+
+分布式扫描（--output-dir 位于各主机共享的文件系统上）:
+  %(prog)s --min-version v6.0 --output-dir /shared/cmp --queue       # 把版本对写入任务队列
+  %(prog)s --output-dir /shared/cmp --worker --parallel 2 -j 32      # 在任意多台主机上运行
+  %(prog)s --output-dir /shared/cmp --queue-status --watch 60        # 查看进度、放回停滞的任务
         """
     )
 
@@ -128,9 +528,75 @@ def main():
                        help='最大比较次数（可选，用于限制比较数量）')
     parser.add_argument('--dry-run', action='store_true',
                        help='仅显示将要比较的版本对，不实际执行')
+    parser.add_argument('--cache-dir',
+                       help='持久化patch-id缓存目录，所有版本对共享（默认: .git/patch-analysis-cache）')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='禁用持久化patch-id缓存')
+    parser.add_argument('--parallel', type=int, default=1,
+                       help='同时分析的版本对数量（默认: 1）')
+    parser.add_argument('-j', '--jobs', type=int, default=git_executor.default_jobs(),
+                       help='所有版本对共享的git并发总数，按--parallel平分给每个分析进程'
+                            f'（默认按CPU核数: {git_executor.default_jobs()}）')
+    parser.add_argument('--force', action='store_true',
+                       help='忽略清单，重新分析所有版本对')
+    parser.add_argument('--chain', action='store_true',
+                       help='链式模式：在同一进程内依次分析所有版本对，共享patch-id计算结果')
+    parser.add_argument('--format', default='xlsx',
+                       help='输出格式，逗号分隔，可选 xlsx、parquet、jsonl、sqlite（默认: xlsx）')
+    parser.add_argument('--update-index', action='store_true',
+                       help='分析完成后把新报告增量导入输出目录中的查询索引（见 report_index.py）')
+    parser.add_argument('--metrics-dir',
+                       help='把每个版本对的性能指标（各阶段耗时、git进程、缓存命中等）写入该目录')
+    parser.add_argument('--path', action='append', default=[],
+                       help='只分析改动了该路径的提交（git pathspec，可重复指定）')
+    parser.add_argument('--category', action='append', default=[],
+                       help='只分析属于该分类的提交（分类名见 patch_rules.toml，可重复指定）')
+    parser.add_argument('--queue', action='store_true',
+                       help='不在本机执行，而是把待分析的版本对写入输出目录中的任务队列，供 --worker 领取')
+    parser.add_argument('--worker', action='store_true',
+                       help='工作进程：从输出目录中的任务队列领取版本对并分析，可以在多台主机上同时运行')
+    parser.add_argument('--queue-status', action='store_true',
+                       help='协调命令：显示任务队列的进度，放回租约过期的任务，并把完成的结果合并进清单')
+    parser.add_argument('--watch', type=int, metavar='SECONDS',
+                       help='与 --queue-status 一起使用：每隔SECONDS秒刷新一次，直到队列处理完')
+    parser.add_argument('--lease', type=int, default=work_queue.DEFAULT_LEASE_SECONDS,
+                       help='与 --queue 一起使用：任务的租约时长（秒），超过该时间没有心跳的任务会被放回队列'
+                            f'（默认: {work_queue.DEFAULT_LEASE_SECONDS}）')
+    parser.add_argument('--max-attempts', type=int, default=work_queue.DEFAULT_MAX_ATTEMPTS,
+                       help='与 --queue 一起使用：每个任务最多尝试的次数，之后移入失败列表'
+                            f'（默认: {work_queue.DEFAULT_MAX_ATTEMPTS}）')
 
     args = parser.parse_args()
 
+    if args.worker or args.queue_status:
+        # 版本对、输出格式和分析范围都由入队时决定
+        if not get_queue(args.output_dir).exists():
+            print(f"❌ 错误: {args.output_dir} 中没有任务队列，请先使用 --queue 创建")
+            sys.exit(1)
+        if args.worker:
+            if not check_analysis_script_exists():
+                sys.exit(1)
+            successful_analyses, failed_analyses = run_worker(
+                args.output_dir, args.jobs, max(1, args.parallel), args.cache_dir, args.no_cache, args.metrics_dir
+            )
+            print(f"\n📊 工作进程结束: 成功 {successful_analyses} 次，失败 {failed_analyses} 次")
+            show_queue_status(args.output_dir)
+        else:
+            while not show_queue_status(args.output_dir) and args.watch:
+                time.sleep(args.watch)
+        if args.update_index:
+            update_report_index(args.output_dir)
+        return
+
+    try:
+        formats = report_formats.parse_formats(args.format)
+        # 先检查分类名，避免每个版本对都失败
+        analysis_scope.build_scope(args.path, args.category, load_classifier())
+    except ValueError as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
+    scope = analysis_scope.scope_key(args.path, args.category)
+
     print(f"🚀 开始版本比较分析")
     print(f"📋 最小版本: {args.min_version}")
     print(f"📁 输出目录: {args.output_dir}")
@@ -164,29 +630,100 @@ def main():
         version_pairs = version_pairs[:args.max_comparisons]
         print(f"⚠️  限制比较次数为 {args.max_comparisons} 对")
 
-    print(f"\n📊 将要进行 {len(version_pairs)} 次版本比较:")
-    for i, (source, target) in enumerate(version_pairs, 1):
+    # 解析每个标签当前指向的提交，用于判断清单中的结果是否过期
+    tag_shas = {tag: git_backend.resolve(f"{tag}^{{commit}}") for tag in filtered_versions}
+    manifest = {} if args.force else load_manifest(args.output_dir)
+    queue = get_queue(args.output_dir)
+    if not args.force and queue.exists():
+        # 工作进程只把结果写入队列，先合并，避免重复入队已完成的版本对
+        merge_done_jobs(queue, args.output_dir, manifest)
+
+    pending_pairs = []
+    skipped_pairs = 0
+    for source, target in version_pairs:
+        pair_shas = (tag_shas[source], tag_shas[target])
+        if is_pair_up_to_date(manifest, source, target, pair_shas, args.output_dir, formats, scope):
+            skipped_pairs += 1
+        else:
+            pending_pairs.append((source, target))
+
+    print(f"\n📊 将要进行 {len(pending_pairs)} 次版本比较:")
+    for i, (source, target) in enumerate(pending_pairs, 1):
         print(f"  {i}. {target} -> {source}")
+    if skipped_pairs:
+        print(f"⏭️  跳过 {skipped_pairs} 个清单中已完成且未变化的版本对（使用 --force 重新分析）")
 
     if args.dry_run:
         print("\n🔍 这是试运行模式，实际不会执行分析")
         return
 
+    if args.queue:
+        queue.init({
+            'lease_seconds': args.lease,
+            'max_attempts': args.max_attempts,
+            'cache_dir': os.path.abspath(args.cache_dir) if args.cache_dir else None,
+            'no_cache': args.no_cache,
+        })
+        added, queued = enqueue_pairs(queue, pending_pairs, tag_shas, formats, args.path, args.category, scope)
+        print(f"\n📥 已加入任务队列 {added} 个版本对" + (f"，{queued} 个已在队列中" if queued else ""))
+        print(f"👷 在各主机上运行: {os.path.basename(sys.argv[0])} --output-dir {args.output_dir} --worker")
+        return
+
+    extra_args = build_extra_args(formats, args.cache_dir, args.no_cache, args.path, args.category)
+
+    # 并发的版本对平分git并发总数，避免嵌套线程池超额占用CPU
+    parallel = 1 if args.chain else max(1, min(args.parallel, len(pending_pairs) or 1))
+    jobs_per_pair = max(1, args.jobs // parallel)
+
     # 执行分析
     print(f"\n🔄 开始执行分析...")
+    if parallel > 1:
+        print(f"🧵 并行版本对: {parallel}，每个分析进程的git并发数: {jobs_per_pair}")
     successful_analyses = 0
     failed_analyses = 0
 
     start_time = datetime.now()
-
-    for i, (source_version, target_version) in enumerate(version_pairs, 1):
-        print(f"\n{'='*60}")
-        print(f"📈 进度: {i}/{len(version_pairs)}")
-
-        if run_patch_analysis(source_version, target_version, args.output_dir):
-            successful_analyses += 1
-        else:
-            failed_analyses += 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    def analyze_pair(source_version, target_version):
+        log_file = None
+        if parallel > 1:
+            log_name = f"{os.path.basename(get_output_file(source_version, target_version, args.output_dir))[:-5]}.log"
+            log_file = os.path.join(args.output_dir, 'logs', log_name)
+        ok = run_patch_analysis(source_version, target_version, args.output_dir, extra_args,
+                                jobs_per_pair, log_file, args.metrics_dir)
+        if ok:
+            record_pair_done(args.output_dir, manifest, source_version, target_version,
+                             (tag_shas[source_version], tag_shas[target_version]), formats, scope)
+        return ok
+
+    if args.chain:
+        if args.parallel > 1:
+            print("⚠️  链式模式按顺序复用共享状态，忽略 --parallel")
+        successful_analyses, failed_analyses = run_chain_analysis(
+            pending_pairs, args.output_dir, args.jobs, args.cache_dir, args.no_cache,
+            lambda source, target: record_pair_done(args.output_dir, manifest, source, target,
+                                                    (tag_shas[source], tag_shas[target]), formats, scope),
+            formats, args.metrics_dir, args.path, args.category
+        )
+    elif parallel == 1:
+        for i, (source_version, target_version) in enumerate(pending_pairs, 1):
+            print(f"\n{'='*60}")
+            print(f"📈 进度: {i}/{len(pending_pairs)}")
+
+            if analyze_pair(source_version, target_version):
+                successful_analyses += 1
+            else:
+                failed_analyses += 1
+    else:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            futures = [executor.submit(analyze_pair, source, target) for source, target in pending_pairs]
+            for i, future in enumerate(as_completed(futures), 1):
+                if future.result():
+                    successful_analyses += 1
+                else:
+                    failed_analyses += 1
+                print(f"📈 进度: {i}/{len(pending_pairs)}")
 
     end_time = datetime.now()
     duration = end_time - start_time
@@ -196,11 +733,15 @@ def main():
     print(f"📊 分析完成总结:")
     print(f"✅ 成功: {successful_analyses} 次")
     print(f"❌ 失败: {failed_analyses} 次")
+    print(f"⏭️  跳过: {skipped_pairs} 次")
     print(f"⏱️  总耗时: {duration}")
     print(f"📁 输出目录: {os.path.abspath(args.output_dir)}")
 
     if successful_analyses > 0:
         print(f"\n🎉 所有分析结果已保存到 {args.output_dir} 目录中")
 
+    if args.update_index:
+        update_report_index(args.output_dir)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,25 +1,76 @@
 #!/usr/bin/env python3
+import analysis_cli
+
+if __name__ == "__main__":
+    # --server 模式在导入pandas/openpyxl等依赖之前处理，客户端只发送一个请求
+    analysis_cli.run_thin_client()
+
 import subprocess
 import pandas as pd
 import re
-import argparse
 import sys
+import os
+import csv
+import shlex
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
-from openpyxl.styles import Alignment, Font
-from openpyxl.utils.dataframe import dataframe_to_rows
+import queue
+from collections import namedtuple
+from openpyxl.styles import Alignment, Font, NamedStyle
+from openpyxl.utils import get_column_letter
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet.hyperlink import Hyperlink
 from openpyxl import Workbook
-import multiprocessing
+import atexit
+import git_backend
+from patch_similarity import MinHashLSH, changed_line_shingles
+from patch_id_store import PatchIdStore, default_cache_dir, DEFAULT_MAX_ENTRIES
+from commit_classifier import load_classifier
+from analysis_cli import (BOUNDED_CHUNK_SIZE, check_option_conflicts, check_required_branches, default_output_file,
+                          parse_arguments)
+import maintainers_index
+import report_formats
+import analysis_state
+import bounded_memory
+import analysis_scope
+import git_executor
+import run_metrics
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
 
 # 全局缓存
 patch_id_cache = {}
 cache_lock = threading.Lock()
+# 持久化缓存（由init_patch_id_store初始化，--no-cache时为None）
+patch_id_store = None
+# 提交分类器（由get_classifier按规则文件加载）
+commit_classifier = None
+# 提交消息中引用的上游提交SHA缓存 {提交: (上游SHA, ...)}
+upstream_ref_cache = {}
+
+# stable/backport提交中指向上游提交的标记
+UPSTREAM_REF_PATTERNS = re.compile(
+    r'^\s*commit ([0-9a-f]{40}) upstream'
+    r'|\[\s*upstream commit ([0-9a-f]{40})\s*\]'
+    r'|cherry[- ]picked from commit ([0-9a-f]{40})',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# 交给git执行器的批量命令，提交列表从标准输入读取
+PATCH_ID_PIPELINE = (['log', '--no-walk=unsorted', '--stdin', '-p', '--no-color'], ['patch-id', '--stable'])
+COMMIT_DETAILS_COMMAND = ['log', '--no-walk=unsorted', '--stdin', '-z', '--no-color', '--format=%x1e%H%x00%B']
+DIFF_SIGNATURE_COMMAND = ['log', '--no-walk=unsorted', '--stdin', '-p', '-U0', '--no-color', '--format=%x1e%H']
 
 def run_git_command(cmd):
     """执行git命令并返回输出"""
     try:
         result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        run_metrics.add('git.processes')
+        run_metrics.add('git.bytes_read', len(result.stdout))
         return result.stdout.strip().split('\n') if result.stdout.strip() else []
     except Exception as e:
         print(f"Error running command: {cmd}")
@@ -30,6 +81,8 @@ def run_git_command_single(cmd):
     """执行git命令并返回单行输出"""
     try:
         result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        run_metrics.add('git.processes')
+        run_metrics.add('git.bytes_read', len(result.stdout))
         return result.stdout.strip() if result.returncode == 0 else None
     except Exception as e:
         print(f"Error running command: {cmd}")
@@ -38,9 +91,7 @@ def run_git_command_single(cmd):
 
 def validate_branch_exists(branch_name):
     """验证分支是否存在"""
-    cmd = f'git rev-parse --verify {branch_name}'
-    result = run_git_command_single(cmd)
-    return result is not None
+    return git_backend.resolve(branch_name) is not None
 
 def find_merge_base(branch1, branch2):
     """找到两个分支的公共祖先提交"""
@@ -68,345 +119,486 @@ def clean_text_for_excel(text):
 
     return cleaned
 
-def get_patch_id(commit_hash):
-    """获取提交的patch-id（带缓存）"""
-    with cache_lock:
-        if commit_hash in patch_id_cache:
-            return patch_id_cache[commit_hash]
+def init_patch_id_store(cache_dir=None, max_entries=DEFAULT_MAX_ENTRIES, shared=False):
+    """打开持久化patch-id缓存，进程退出时自动关闭；shared 表示缓存目录由多台主机共享"""
+    global patch_id_store
 
-    cmd = f'git show {commit_hash} | git patch-id --stable'
-    result = run_git_command_single(cmd)
-    patch_id = None
-    if result:
-        patch_id = result.split()[0]  # patch-id是第一个字段
+    cache_dir = cache_dir or default_cache_dir()
+    if not cache_dir:
+        print("警告: 无法确定缓存目录，持久化缓存已禁用")
+        return None
 
-    with cache_lock:
-        patch_id_cache[commit_hash] = patch_id
+    try:
+        patch_id_store = PatchIdStore(cache_dir, max_entries, shared)
+    except Exception as e:
+        print(f"警告: 无法打开持久化缓存 {cache_dir}: {e}")
+        patch_id_store = None
+        return None
 
-    return patch_id
+    atexit.register(patch_id_store.close)
+    print(f"💾 持久化缓存: {patch_id_store.path}")
+    return patch_id_store
 
-def build_target_branch_patch_index(target_branch, merge_base=None):
-    """构建目标分支的patch-id索引"""
-    print(f"正在构建 {target_branch} 分支的patch-id索引...")
+def split_into_chunks(items, chunk_size=500):
+    """把列表切成每块chunk_size个元素，各块交给git执行器排队运行"""
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+def _commit_list_input(commit_hashes):
+    return ''.join(f'{c}\n' for c in commit_hashes).encode()
+
+def _parse_patch_ids(output):
+    """解析 git patch-id 的输出，返回 {提交: patch-id}"""
+    results = {}
+    for line in output.decode('utf-8', errors='replace').splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            # 输出格式: <patch-id> <commit>
+            results[parts[1]] = parts[0]
+    return results
+
+def submit_patch_ids(commit_hashes, chunk_size=500, use_memory_cache=True):
+    """提交一批提交的patch-id计算，返回一个函数，调用它时等待计算完成并返回 {提交: patch-id}
+
+    commit_hashes 需为完整的40位SHA，以便与 git patch-id 的输出对应。
+    未命中缓存的提交按块交给git执行器，每块一条 git log -p | git patch-id 流水线，
+    计算结果整体写入缓存。use_memory_cache 为假时（内存受限模式）只使用持久化缓存，
+    结果不留在进程内。
+    """
+    commit_hashes = list(dict.fromkeys(commit_hashes))
+    results = {}
+
+    if use_memory_cache:
+        with cache_lock:
+            pending = [c for c in commit_hashes if c not in patch_id_cache]
+        run_metrics.add('patch_id.memory_hits', len(commit_hashes) - len(pending))
+    else:
+        pending = commit_hashes
+
+    # 先从持久化缓存中批量加载
+    if pending and patch_id_store:
+        stored = patch_id_store.get_many(pending)
+        if stored:
+            if use_memory_cache:
+                with cache_lock:
+                    patch_id_cache.update(stored)
+            else:
+                results.update(stored)
+            pending = [c for c in pending if c not in stored]
+            run_metrics.add('patch_id.store_hits', len(stored))
+    run_metrics.add('patch_id.computed', len(pending))
+
+    future_to_chunk = {git_executor.submit(PATCH_ID_PIPELINE, _commit_list_input(chunk)): chunk
+                       for chunk in split_into_chunks(pending, chunk_size)}
+
+    def wait():
+        errors = []
+        for future in as_completed(future_to_chunk):
+            chunk = future_to_chunk[future]
+            try:
+                chunk_results = _parse_patch_ids(future.result())
+            except Exception as e:
+                # 失败的块什么都不写入：缓存永不过期，记为None会让这些提交以后一直被当作独有补丁
+                print(f"批量计算patch-id时出错: {e}")
+                errors.append(e)
+                continue
+
+            # 流水线成功退出说明git处理了块中的每个提交（对象缺失时git log会以非零状态退出），
+            # 此时没有输出的提交确实没有补丁内容（合并提交、空提交），记为None
+            computed = {commit: chunk_results.get(commit) for commit in chunk}
+            if use_memory_cache:
+                with cache_lock:
+                    patch_id_cache.update(computed)
+            else:
+                results.update(computed)
+
+            if patch_id_store:
+                patch_id_store.put_many(computed)
 
+        if errors:
+            raise RuntimeError(f"{len(errors)} 批提交的patch-id计算失败: {errors[0]}") from errors[0]
+        if not use_memory_cache:
+            return results
+        with cache_lock:
+            return {c: patch_id_cache.get(c) for c in commit_hashes}
+
+    return wait
+
+def get_patch_ids_batch(commit_hashes, chunk_size=500, use_memory_cache=True):
+    """批量获取多个提交的patch-id并整体写入缓存，返回 {提交: patch-id}"""
+    return submit_patch_ids(commit_hashes, chunk_size, use_memory_cache)()
+
+def get_target_commits(target_branch, merge_base=None, scope=None):
+    """获取目标分支需要建立索引的提交（完整SHA），scope 不为空时只取范围内的提交"""
     # 如果有公共祖先，只获取公共祖先之后的提交
     if merge_base:
-        target_commits_cmd = f'git log {merge_base}..{target_branch} --format=%H'
+        revisions = f'{merge_base}..{target_branch}'
         print(f"只分析公共祖先 {merge_base[:8]} 之后的提交")
     else:
-        target_commits_cmd = f'git log {target_branch} --format=%H'
+        revisions = target_branch
+    if scope is not None:
+        return list_scoped_commits(revisions, scope)
+    target_commits_cmd = f'git log {revisions} --format=%H'
 
     target_commits = run_git_command(target_commits_cmd)
-    target_commits = [c.strip() for c in target_commits if c.strip()]
-
-    print(f"目标分支有 {len(target_commits)} 个提交需要建立索引")
+    return [c.strip() for c in target_commits if c.strip()]
 
-    # 使用多线程并行获取patch-id
-    patch_id_index = set()
-
-    def get_patch_id_for_commit(commit):
-        return get_patch_id(commit)
-
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        # 提交所有任务
-        future_to_commit = {executor.submit(get_patch_id_for_commit, commit): commit
-                           for commit in target_commits}
+def build_target_branch_patch_index(target_branch, merge_base=None, target_commits=None):
+    """构建目标分支的patch-id索引"""
+    print(f"正在构建 {target_branch} 分支的patch-id索引...")
 
-        # 收集结果
-        processed = 0
-        for future in as_completed(future_to_commit):
-            commit = future_to_commit[future]
-            try:
-                patch_id = future.result()
-                if patch_id:
-                    patch_id_index.add(patch_id)
-                processed += 1
+    with run_metrics.stage('target_index') as timer:
+        if target_commits is None:
+            target_commits = get_target_commits(target_branch, merge_base)
 
-                # 每处理100个提交显示一次进度
-                if processed % 100 == 0 or processed == len(target_commits):
-                    progress = int(processed / len(target_commits) * 100)
-                    print(f"索引构建进度: {progress}% ({processed}/{len(target_commits)})")
+        print(f"目标分支有 {len(target_commits)} 个提交需要建立索引")
 
-            except Exception as e:
-                print(f"处理提交 {commit} 时出错: {e}")
+        # 批量流式计算patch-id
+        patch_ids = get_patch_ids_batch(target_commits)
+        patch_id_index = {pid for pid in patch_ids.values() if pid}
+        timer.items = len(target_commits)
 
     print(f"✅ 索引构建完成，共 {len(patch_id_index)} 个唯一patch-id")
     return patch_id_index
 
-def is_patch_unique_fast(commit_hash, target_patch_index):
-    """快速检查补丁是否独有（使用预构建的索引）"""
-    source_patch_id = get_patch_id(commit_hash)
-    if not source_patch_id:
-        print(f"警告: 无法获取提交 {commit_hash} 的patch-id")
-        return True  # 如果无法获取patch-id，假设是独有的
-
-    return source_patch_id not in target_patch_index
-
-def get_commit_details(commit_hash):
-    """获取提交的详细信息"""
-    # 获取完整的提交消息
-    full_msg_cmd = f'git log --format="%B" -n 1 {commit_hash}'
-    full_message = run_git_command(full_msg_cmd)
-    full_message_text = '\n'.join(full_message).strip()
-
-    # 获取修改的文件列表
-    files_cmd = f'git diff-tree --no-commit-id --name-only -r {commit_hash}'
-    changed_files = run_git_command(files_cmd)
-    files_list = ', '.join([f for f in changed_files if f.strip()])
-
-    # 获取文件变更统计
-    stats_cmd = f'git diff-tree --no-commit-id --numstat {commit_hash}'
-    stats = run_git_command(stats_cmd)
-
-    file_stats = []
-    for stat in stats:
-        if stat.strip():
-            parts = stat.split('\t')
-            if len(parts) >= 3:
-                added = parts[0] if parts[0] != '-' else '0'
-                deleted = parts[1] if parts[1] != '-' else '0'
-                filename = parts[2]
-                file_stats.append(f"{filename}(+{added}/-{deleted})")
+def extract_upstream_references(message):
+    """从提交消息中提取引用的上游提交SHA"""
+    return tuple(dict.fromkeys(
+        sha.lower() for match in UPSTREAM_REF_PATTERNS.finditer(message) for sha in match.groups() if sha
+    ))
+
+def get_upstream_references_batch(commit_hashes, chunk_size=500, use_memory_cache=True):
+    """批量读取提交消息并提取上游引用，返回 {提交: (上游SHA, ...)}
+
+    use_memory_cache 为假时（内存受限模式）结果不写入进程内缓存。
+    """
+    commit_hashes = list(dict.fromkeys(commit_hashes))
+    if use_memory_cache:
+        pending = [c for c in commit_hashes if c not in upstream_ref_cache]
+        run_metrics.add('upstream_refs.memory_hits', len(commit_hashes) - len(pending))
+        cache = upstream_ref_cache
+    else:
+        pending = commit_hashes
+        cache = {}
+    run_metrics.add('upstream_refs.read', len(pending))
+
+    futures = [_submit_commit_details(chunk, False) for chunk in split_into_chunks(pending, chunk_size)]
+    for future in as_completed(futures):
+        try:
+            messages = _parse_commit_details(future.result())
+        except Exception as e:
+            print(f"批量读取提交消息时出错: {e}")
+            continue
+        with cache_lock:
+            for commit, details in messages.items():
+                cache[commit] = extract_upstream_references(details['full_message'])
 
-    detailed_files = ', '.join(file_stats)
+    with cache_lock:
+        return {c: cache.get(c, ()) for c in commit_hashes}
+
+def build_upstream_keys(target_commits):
+    """目标提交自身的SHA及其引用的上游SHA集合"""
+    references = get_upstream_references_batch(target_commits)
+    target_keys = set(target_commits)
+    for commit in target_commits:
+        target_keys.update(references[commit])
+    return target_keys
+
+def match_upstream_keys(parsed_commits, target_keys):
+    """源提交自身或其引用的上游SHA出现在target_keys中即视为等价，返回 {源提交完整SHA: 匹配到的SHA}"""
+    source_hashes = [c['full_hash'] for c in parsed_commits]
+    references = get_upstream_references_batch(source_hashes)
+
+    matches = {}
+    with_refs = 0
+    for commit in source_hashes:
+        if references[commit]:
+            with_refs += 1
+        for key in (commit,) + references[commit]:
+            if key in target_keys:
+                matches[commit] = key
+                break
+
+    print(f"  {with_refs} 个源提交带有上游引用，{len(matches)} 个通过SHA直接匹配")
+    return matches
+
+def match_by_upstream_reference(parsed_commits, target_commits):
+    """按上游提交SHA判断等价，返回 {源提交完整SHA: 匹配到的SHA}
+
+    源提交自身的SHA及其引用的上游SHA，只要出现在目标提交自身SHA或其引用的
+    上游SHA中即视为等价，无需计算patch-id。
+    """
+    print("🔗 通过上游提交引用匹配等价提交...")
+    source_hashes = [c['full_hash'] for c in parsed_commits]
+    # 一次批量读取两侧的提交消息
+    get_upstream_references_batch(list(target_commits) + source_hashes)
+    return match_upstream_keys(parsed_commits, build_upstream_keys(target_commits))
+
+def _parse_diff_signatures(output, lsh):
+    """解析一批提交的零上下文diff，返回 {提交: MinHash签名}"""
+    signatures = {}
+    current_commit = None
+    changed_lines = []
+    in_hunk = False
+
+    def finish_commit():
+        if current_commit:
+            signatures[current_commit] = lsh.signature(changed_line_shingles(changed_lines))
+
+    for line in output.decode('utf-8', errors='replace').split('\n'):
+        if line.startswith('\x1e'):
+            finish_commit()
+            current_commit = line[1:].strip()
+            changed_lines = []
+            in_hunk = False
+        elif line.startswith('diff '):
+            in_hunk = False
+        elif line.startswith('@@'):
+            in_hunk = True
+        elif in_hunk and line[:1] in ('+', '-'):
+            changed_lines.append(line)
+    finish_commit()
+    return signatures
+
+def get_diff_signatures_batch(commit_hashes, lsh):
+    """批量计算多个提交的diff签名"""
+    signatures = {}
+    futures = [git_executor.submit([DIFF_SIGNATURE_COMMAND], _commit_list_input(chunk))
+               for chunk in split_into_chunks(list(dict.fromkeys(commit_hashes)))]
+    for future in as_completed(futures):
+        try:
+            signatures.update(_parse_diff_signatures(future.result(), lsh))
+        except Exception as e:
+            print(f"计算diff签名时出错: {e}")
+    return signatures
+
+def find_fuzzy_equivalents(unique_commits, target_commits, threshold=0.7, max_candidates=3):
+    """对独有补丁做近似重复检测，返回疑似等价的候选列表
+
+    用于发现上下文被调整或细节有改动、因此patch-id不一致的backport。
+    """
+    print(f"🧩 近似重复检测: 为目标分支 {len(target_commits)} 个提交建立MinHash/LSH索引...")
+    lsh = MinHashLSH()
+    for commit, signature in get_diff_signatures_batch(target_commits, lsh).items():
+        lsh.add(commit, signature)
+
+    source_signatures = get_diff_signatures_batch([c['full_hash'] for c in unique_commits], lsh)
+
+    candidates = []
+    for commit in unique_commits:
+        matches = lsh.query(source_signatures.get(commit['full_hash']), threshold)
+        for target_commit, similarity in matches[:max_candidates]:
+            target_info = git_backend.read_commit(target_commit)
+            target_subject = target_info['message'].split('\n', 1)[0] if target_info else ''
+            candidates.append({
+                '提交哈希': commit['commit_hash'],
+                '提交标题': commit['subject'],
+                '疑似等价目标提交': target_commit[:12],
+                '目标提交标题': clean_text_for_excel(target_subject),
+                '相似度': round(similarity, 3)
+            })
 
-    return {
-        'full_message': clean_text_for_excel(full_message_text),
-        'changed_files': clean_text_for_excel(files_list),
-        'detailed_files': clean_text_for_excel(detailed_files)
-    }
+    matched = len({c['提交哈希'] for c in candidates})
+    print(f"  {matched} 个独有补丁找到疑似等价提交（相似度 ≥ {threshold}）")
+    return candidates
 
 def parse_commit_info(commit_line):
-    """解析提交信息行"""
+    """解析提交信息行（格式: %H|%h|%an|%ad|%s）"""
     parts = commit_line.split('|')
-    if len(parts) >= 4:
+    if len(parts) >= 5:
         return {
-            'commit_hash': parts[0],
-            'author': parts[1],
-            'date': parts[2],
-            'subject': '|'.join(parts[3:])  # 处理标题中可能包含|的情况
+            'full_hash': parts[0],
+            'commit_hash': parts[1],
+            'author': parts[2],
+            'date': parts[3],
+            'subject': '|'.join(parts[4:])  # 处理标题中可能包含|的情况
         }
     return None
 
+def get_classifier():
+    """返回当前使用的提交分类器（首次调用时加载默认规则文件）"""
+    global commit_classifier
+    if commit_classifier is None:
+        commit_classifier = load_classifier()
+    return commit_classifier
+
+def set_rules_file(rules_file):
+    """使用指定的规则文件替换当前分类器"""
+    global commit_classifier
+    commit_classifier = load_classifier(rules_file)
+    return commit_classifier
+
 def categorize_commit(commit_info, changed_files):
-    """根据提交信息和修改的文件对提交进行分类"""
-    categories = []
-    subject = commit_info['subject'].lower()
-    files = changed_files.lower()
-
-    # RISC-V相关
-    if any(keyword in subject for keyword in ['riscv', 'risc-v']) or 'arch/riscv' in files:
-        categories.append('RISC-V')
-
-    # 调度相关 - 更严格的条件
-    sched_keywords = [
-        'scheduler', 'sched:', 'sched_', 'cfs:', 'cfs_', 'rt:', 'rt_',
-        'fair scheduler', 'rt scheduler', 'deadline scheduler',
-        'load balancing', 'load balance', 'cpu scheduler',
-        'task scheduler', 'process scheduler', 'thread scheduler',
-        'runqueue', 'rq_', 'pick_next_task', 'enqueue_task', 'dequeue_task',
-        'sched_domain', 'sched_group', 'sched_entity', 'sched_class',
-        'wake_up_new_task', 'try_to_wake_up', 'schedule()', 'preempt'
-    ]
-
-    # 文件路径检查 - 只有真正的调度相关路径
-    sched_paths = [
-        'kernel/sched/',
-        'include/linux/sched/',
-        'include/uapi/linux/sched.h'
-    ]
-
-    # 排除明显不是调度的关键词（即使包含sched等词）
-    exclude_keywords = [
-        # 'usched',  # 用户态调度
-        # 'fsched',  # 文件系统调度
-        # 'iosched', # IO调度
-        # 'elevator', # 电梯调度算法
-        # 'deadline', # 除非明确是deadline scheduler
-        # 'nohz',    # 除非是调度相关的nohz
-        # 'rcu',     # RCU调度
-        # 'irq',     # 中断调度
-        # 'workqueue', # 工作队列调度
-        # 'timer',   # 定时器调度
-        # 'hrtimer', # 高精度定时器
-        # 'tick',    # 时钟滴答
-        # 'clocksource', # 时钟源
-        # 'cpufreq', # CPU频率调度
-        # 'cpuidle', # CPU空闲
-        # 'thermal', # 热调度
-        # 'power',   # 电源管理调度
-        # 'suspend', # 挂起调度
-        # 'hibernate' # 休眠调度
-    ]
-
-    # 检查是否为真正的调度相关
-    is_scheduler_related = False
-
-    # 首先检查文件路径
-    if any(path in files for path in sched_paths):
-        is_scheduler_related = True
-
-    # 然后检查关键词，但要排除误报
-    elif any(keyword in subject for keyword in sched_keywords):
-        # 确保不包含排除的关键词
-        if not any(exclude in subject for exclude in exclude_keywords):
-            is_scheduler_related = True
-
-    # 特殊情况：如果包含rt但明确是其他子系统的，则排除
-    if 'rt' in subject:
-        if any(exclude in subject for exclude in ['rtc', 'uart', 'spi', 'i2c', 'usb', 'pci', 'dma', 'gpio']):
-            is_scheduler_related = False
-
-    if is_scheduler_related:
-        categories.append('调度')
-
-    # 内存管理
-    if any(keyword in subject for keyword in ['mm', 'memory', 'page', 'slab', 'kmem']) or any(path in files for path in ['mm/', 'include/linux/mm']):
-        categories.append('内存管理')
-
-    # 文件系统
-    if any(keyword in subject for keyword in ['fs', 'filesystem', 'ext4', 'btrfs', 'xfs']) or 'fs/' in files:
-        categories.append('文件系统')
-
-    # 网络
-    if any(keyword in subject for keyword in ['net', 'network', 'tcp', 'udp', 'socket']) or 'net/' in files:
-        categories.append('网络')
-
-    # 驱动
-    if 'drivers/' in files or any(keyword in subject for keyword in ['driver', 'device']):
-        categories.append('驱动')
-
-    # 如果没有匹配到任何分类，归为其他
-    if not categories:
-        categories.append('其他')
-
-    return categories
+    """根据提交信息和修改的文件对提交进行分类
+
+    changed_files 可以是文件路径列表，也可以是以 ', ' 连接的字符串。
+    """
+    if isinstance(changed_files, str):
+        changed_files = [f for f in changed_files.split(', ') if f]
+    return get_classifier().categorize(commit_info['subject'], changed_files)
 
 def determine_patch_type(subject, full_message):
     """确定补丁类型"""
-    subject_lower = subject.lower()
-    message_lower = full_message.lower()
-
-    if any(keyword in subject_lower for keyword in ['fix', 'bug', 'error', 'issue']):
-        return 'Bug修复'
-    elif any(keyword in subject_lower for keyword in ['add', 'new', 'implement', 'introduce']):
-        return '新功能'
-    elif any(keyword in subject_lower for keyword in ['improve', 'optimize', 'enhance', 'refactor']):
-        return '性能优化'
-    elif any(keyword in subject_lower for keyword in ['update', 'change', 'modify']):
-        return '功能更新'
-    else:
-        return '其他'
-
-def format_worksheet(worksheet, df):
-    """格式化工作表：设置对齐方式、自动换行和自动调整列宽"""
-    # 设置对齐方式：左对齐、垂直居中、自动换行
-    alignment = Alignment(
-        horizontal='left',
-        vertical='center',
-        wrap_text=True
-    )
+    return get_classifier().patch_type(subject)
+
+# 流水线：每块提交数、阶段之间的队列长度（以块计）和详情阶段的线程数
+# （详情阶段的线程只等待git执行器并在本线程内分类，git并发数由 -j 统一限制）
+PIPELINE_CHUNK_SIZE = 500
+PIPELINE_QUEUE_SIZE = 8
+PIPELINE_DETAIL_WORKERS = 4
+EMPTY_DETAILS = {
+    'full_message': '',
+    'changed_files': '',
+    'detailed_files': '',
+    'file_list': []
+}
+
+# Excel格式：列宽范围（字符数）和每行文本对应的行高
+EXCEL_MIN_COLUMN_WIDTH = 10
+EXCEL_MAX_COLUMN_WIDTH = 100
+EXCEL_LINE_HEIGHT = 15
+DETAIL_SHEET_NAME = '独有补丁详情'
+
+# 指向工作簿内某个工作表第row行的超链接单元格
+ExcelLink = namedtuple('ExcelLink', ['text', 'sheet', 'row'])
+
+def _cell_text_metrics(value):
+    """返回单元格内容最长一行的长度和行数，空值返回 (0, 1)"""
+    if isinstance(value, ExcelLink):
+        return len(value.text), 1
+    if not value:
+        return 0, 1
+    text = str(value)
+    if '\n' not in text:
+        return len(text), 1
+    lines = text.split('\n')
+    return max(len(line) for line in lines), len(lines)
+
+def _column_width(max_length):
+    """按内容最大长度计算列宽，限制在最小/最大宽度之间"""
+    return max(min(max_length + 2, EXCEL_MAX_COLUMN_WIDTH), EXCEL_MIN_COLUMN_WIDTH)
+
+def _excel_rows(df):
+    """按行产出表头和数据，空值统一为None
+
+    df 也可以是内存受限模式下从临时文件流式读取的 bounded_memory.RowSource。
+    """
+    yield list(df.columns)
+    rows = df.rows() if isinstance(df, bounded_memory.RowSource) else df.itertuples(index=False, name=None)
+    for row in rows:
+        yield [None if isinstance(v, float) and v != v else v for v in row]
+
+def _write_sheet_xlsxwriter(workbook, sheet_name, df, header_format, cell_format):
+    """xlsxwriter流式写入：行高随行写出，列宽在追加过程中累计、关闭前统一设置"""
+    worksheet = workbook.add_worksheet(sheet_name)
+    widths = [0] * len(df.columns)
+
+    for row_idx, values in enumerate(_excel_rows(df)):
+        cell_format_for_row = header_format if row_idx == 0 else cell_format
+        max_lines = 1
+        for col_idx, value in enumerate(values):
+            length, lines = _cell_text_metrics(value)
+            widths[col_idx] = max(widths[col_idx], length)
+            max_lines = max(max_lines, lines)
+
+            if isinstance(value, ExcelLink):
+                worksheet.write_url(row_idx, col_idx, f"internal:'{value.sheet}'!A{value.row}",
+                                    cell_format_for_row, string=value.text)
+            elif value is None:
+                worksheet.write_blank(row_idx, col_idx, None, cell_format_for_row)
+            elif isinstance(value, str):
+                worksheet.write_string(row_idx, col_idx, value, cell_format_for_row)
+            else:
+                worksheet.write(row_idx, col_idx, value, cell_format_for_row)
 
-    # 设置标题行字体为粗体
-    header_font = Font(bold=True)
+        # constant_memory模式下当前行写完前设置行高
+        if max_lines > 1:
+            worksheet.set_row(row_idx, max_lines * EXCEL_LINE_HEIGHT)
 
-    # 应用格式到所有单元格
-    for row in worksheet.iter_rows():
-        for cell in row:
-            cell.alignment = alignment
-            # 标题行设置粗体
-            if cell.row == 1:
-                cell.font = header_font
+    for col_idx, width in enumerate(widths):
+        worksheet.set_column(col_idx, col_idx, _column_width(width))
 
-    # 自动调整列宽
-    for column in worksheet.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
+def _write_sheet_openpyxl(workbook, sheet_name, df, header_style, cell_style):
+    """openpyxl write-only写入：列宽需在首行之前确定，先做一次轻量的尺寸统计"""
+    worksheet = workbook.create_sheet(title=sheet_name)
 
-        for cell in column:
-            try:
-                # 计算单元格内容的最大长度
-                if cell.value:
-                    # 处理换行符，取最长的一行
-                    lines = str(cell.value).split('\n')
-                    cell_length = max(len(line) for line in lines) if lines else 0
-                    max_length = max(max_length, cell_length)
-            except:
-                pass
-
-        # 设置列宽，限制最大宽度避免过宽
-        adjusted_width = min(max_length + 2, 100)  # 最大100字符宽度
-        if adjusted_width < 10:  # 最小10字符宽度
-            adjusted_width = 10
-
-        worksheet.column_dimensions[column_letter].width = adjusted_width
-
-    # 设置行高自动调整（对于有换行的内容）
-    for row in worksheet.iter_rows():
+    widths = [0] * len(df.columns)
+    row_lines = []
+    for values in _excel_rows(df):
         max_lines = 1
-        for cell in row:
-            if cell.value:
-                lines = str(cell.value).count('\n') + 1
-                max_lines = max(max_lines, lines)
-
-        # 根据行数调整行高（每行大约15个单位）
-        if max_lines > 1:
-            worksheet.row_dimensions[row[0].row].height = max_lines * 15
+        for col_idx, value in enumerate(values):
+            length, lines = _cell_text_metrics(value)
+            widths[col_idx] = max(widths[col_idx], length)
+            max_lines = max(max_lines, lines)
+        row_lines.append(max_lines)
+
+    for col_idx, width in enumerate(widths, 1):
+        worksheet.column_dimensions[get_column_letter(col_idx)].width = _column_width(width)
+
+    for row_idx, values in enumerate(_excel_rows(df), 1):
+        # write-only模式在写出每一行时读取该行的行高
+        if row_lines[row_idx - 1] > 1:
+            worksheet.row_dimensions[row_idx].height = row_lines[row_idx - 1] * EXCEL_LINE_HEIGHT
+
+        style = header_style if row_idx == 1 else cell_style
+        row = []
+        for col_idx, value in enumerate(values, 1):
+            if isinstance(value, ExcelLink):
+                cell = WriteOnlyCell(worksheet, value=value.text)
+                # 设置超链接需要单元格坐标，追加时openpyxl会按实际位置重新设置
+                cell.row, cell.column = row_idx, col_idx
+                cell.hyperlink = Hyperlink(ref='', location=f"'{value.sheet}'!A{value.row}")
+            else:
+                cell = WriteOnlyCell(worksheet, value=value)
+            cell.style = style
+            row.append(cell)
+        worksheet.append(row)
+
+def create_formatted_excel(filename, dataframes_dict, engine='auto'):
+    """创建格式化的Excel文件（流式写入：左对齐、垂直居中、自动换行、表头粗体，自动列宽和行高）
+
+    dataframes_dict 的值可以是DataFrame，也可以是返回DataFrame的函数（延迟生成）。
+    engine 为 'xlsxwriter'、'openpyxl' 或 'auto'（安装了xlsxwriter时优先使用）。
+    """
+    if engine == 'auto':
+        engine = 'xlsxwriter' if xlsxwriter is not None else 'openpyxl'
+
+    if engine == 'xlsxwriter':
+        if xlsxwriter is None:
+            raise RuntimeError("未安装xlsxwriter，请使用 --excel-engine openpyxl")
+        workbook = xlsxwriter.Workbook(filename, {
+            'constant_memory': True,
+            'strings_to_numbers': False,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+            'nan_inf_to_errors': True
+        })
+        base = {'align': 'left', 'valign': 'vcenter', 'text_wrap': True}
+        header_format = workbook.add_format(dict(base, bold=True))
+        cell_format = workbook.add_format(base)
+        for sheet_name, df in dataframes_dict.items():
+            if callable(df):
+                df = df()
+            _write_sheet_xlsxwriter(workbook, sheet_name, df, header_format, cell_format)
+        workbook.close()
+        return
 
-def create_formatted_excel(filename, dataframes_dict):
-    """创建格式化的Excel文件"""
-    wb = Workbook()
+    workbook = Workbook(write_only=True)
 
-    # 删除默认的工作表
-    if 'Sheet' in wb.sheetnames:
-        wb.remove(wb['Sheet'])
+    # 共享的命名样式，避免为每个单元格创建独立的样式对象
+    alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
+    header_style = NamedStyle(name='patch_analysis_header', alignment=alignment, font=Font(bold=True))
+    cell_style = NamedStyle(name='patch_analysis_cell', alignment=alignment)
+    workbook.add_named_style(header_style)
+    workbook.add_named_style(cell_style)
 
     for sheet_name, df in dataframes_dict.items():
-        # 创建工作表
-        ws = wb.create_sheet(title=sheet_name)
-
-        # 写入数据
-        for r in dataframe_to_rows(df, index=False, header=True):
-            ws.append(r)
-
-        # 应用格式
-        format_worksheet(ws, df)
+        # 分类视图等以函数形式传入，写到该工作表时才生成
+        if callable(df):
+            df = df()
+        _write_sheet_openpyxl(workbook, sheet_name, df, header_style.name, cell_style.name)
 
     # 保存文件
-    wb.save(filename)
-
-def parse_arguments():
-    """解析命令行参数"""
-    parser = argparse.ArgumentParser(
-        description='分析两个Git分支之间的独有补丁差异',
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""使用示例:
-  %(prog)s v6.15.8 openkylin-6.6-next
-  %(prog)s --source v6.15.8 --target openkylin-6.6-next
-  %(prog)s v6.15.8 openkylin-6.6-next --output my_analysis.xlsx
-  %(prog)s v6.15.8 openkylin-6.6-next --no-merge-base
-        """
-    )
-
-    # 位置参数（可选）
-    parser.add_argument('source', nargs='?', help='源分支（要分析其独有补丁的分支）')
-    parser.add_argument('target', nargs='?', help='目标分支（用于比较的基准分支）')
-
-    # 命名参数
-    parser.add_argument('-s', '--source', dest='source_named', help='源分支（要分析其独有补丁的分支）')
-    parser.add_argument('-t', '--target', dest='target_named', help='目标分支（用于比较的基准分支）')
-    parser.add_argument('-o', '--output', help='输出文件名（默认: <源分支>-to-<目标分支>-diff.xlsx）')
-    parser.add_argument('--no-merge-base', action='store_true', help='不使用公共祖先优化，分析全部差异')
-    parser.add_argument('-j', '--jobs', type=int, default=64, help='并行线程数（默认: 64）')
-    parser.add_argument('--list-branches', action='store_true', help='列出所有可用的分支')
-
-    args = parser.parse_args()
-
-    # 处理分支参数的优先级：命名参数 > 位置参数
-    source_branch = args.source_named or args.source
-    target_branch = args.target_named or args.target
-
-    return source_branch, target_branch, args
+    workbook.save(filename)
 
 def list_available_branches():
     """列出所有可用的分支"""
@@ -439,148 +631,1305 @@ def list_available_branches():
             if tag.strip():
                 print(f"  {tag.strip()}")
 
-def get_commit_details_batch(commit_hashes, max_workers=None):
-    """批量并行获取多个提交的详细信息"""
-    if max_workers is None:
-        max_workers = min(len(commit_hashes), multiprocessing.cpu_count())
+def _submit_commit_details(commit_hashes, numstat=True):
+    """提交一个 git log --no-walk -z 命令，一次读取一批提交的消息和文件统计，返回Future"""
+    cmd = list(COMMIT_DETAILS_COMMAND)
+    if numstat:
+        cmd += ['--numstat', '--no-renames']
+    return git_executor.submit([cmd], _commit_list_input(commit_hashes))
+
+def _parse_commit_details(output):
+    """解析 _submit_commit_details 的输出，返回 {提交: 详情}"""
+    results = {}
+
+    def parse_record(record):
+        # 记录格式: <H>\0<B>\0\n<added>\t<deleted>\t<path>\0...
+        fields = record.split('\0')
+        commit_hash = fields[0]
+        message = fields[1] if len(fields) > 1 else ''
+
+        files = []
+        file_stats = []
+        for entry in fields[2:]:
+            parts = entry.lstrip('\n').split('\t', 2)
+            if len(parts) == 3:
+                added = parts[0] if parts[0] != '-' else '0'
+                deleted = parts[1] if parts[1] != '-' else '0'
+                filename = parts[2]
+                files.append(filename)
+                file_stats.append(f"{filename}(+{added}/-{deleted})")
+
+        results[commit_hash] = {
+            'full_message': clean_text_for_excel(message.strip()),
+            'changed_files': clean_text_for_excel(', '.join(files)),
+            'detailed_files': clean_text_for_excel(', '.join(file_stats)),
+            'file_list': files
+        }
+
+    record_start = re.compile(r'[0-9a-f]{40}\0')
+
+    # 每遇到下一条记录的开头就解析上一条
+    record = ''
+    for piece in output.decode('utf-8', errors='replace').split('\x1e'):
+        if not record:
+            record = piece
+        elif record_start.match(piece):
+            parse_record(record)
+            record = piece
+        else:
+            # 提交消息中偶然出现的分隔符不会紧跟完整SHA，拼回当前记录
+            record += '\x1e' + piece
+
+    if record:
+        parse_record(record)
+    return results
+
+def read_commit_details(commit_hashes):
+    """读取一批提交的详情并等待完成，返回 {提交: 详情}"""
+    if not commit_hashes:
+        return {}
+    return _parse_commit_details(_submit_commit_details(commit_hashes).result())
 
+def get_commit_details_batch(commit_hashes):
+    """批量获取多个提交的详细信息（按块交给git执行器）"""
     results = {}
+    full_hashes = [commit['full_hash'] for commit in commit_hashes]
+    streamed = {}
+
+    futures = [_submit_commit_details(chunk) for chunk in split_into_chunks(full_hashes)]
+    for future in as_completed(futures):
+        try:
+            streamed.update(_parse_commit_details(future.result()))
+        except Exception as e:
+            print(f"批量获取提交详情时出错: {e}")
 
-    def get_details_for_commit(commit_hash):
-        return commit_hash, get_commit_details(commit_hash)
+    for commit in commit_hashes:
+        # 提供默认值
+        results[commit['commit_hash']] = streamed.get(commit['full_hash'], EMPTY_DETAILS)
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_commit = {executor.submit(get_details_for_commit, commit['commit_hash']): commit
-                           for commit in commit_hashes}
+    return results
 
-        for future in as_completed(future_to_commit):
+def build_analysis_record(commit, details, categories, patch_type, maintainers=None):
+    """生成独有补丁的分析记录（每个提交一条，分类以列表保存，写入时再展开为各分类视图）"""
+    record = {
+        '提交哈希': commit['commit_hash'],
+        '作者': commit['author'],
+        '日期': commit['date'],
+        '提交标题': commit['subject'],
+        '完整提交信息': details['full_message'],
+        '修改文件': details['changed_files'],
+        '文件变更详情': details['detailed_files'],
+        '分类': categories,
+        '类型': patch_type
+    }
+    if maintainers is not None:
+        subsystems, maintainer_list = maintainers.classify(details['file_list'])
+        # 小节名称中可能含有逗号，用分号分隔
+        record['子系统'] = '; '.join(subsystems)
+        record['维护者'] = '; '.join(maintainer_list)
+    return record
+
+class DetailStage:
+    """流水线的详情阶段：独有补丁一经确认就提交到有界队列，由后台线程读取详情并分类
+
+    submit() 在队列已满时阻塞，上游的patch-id计算因此不会无限领先；每条记录生成后
+    立即交给 row_sink（以详情表的行格式，分类已合并为字符串），finish() 返回全部结果。
+    known_details 为已知的 {完整SHA: 详情}（如增量状态中保存的），这些提交不再读取git。
+    """
+
+    def __init__(self, max_workers=4, maintainers=None, row_sink=None, known_details=None):
+        self.maintainers = maintainers
+        self.row_sink = row_sink
+        self.records = {}
+        self.details = dict(known_details or {})
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self._errors = []
+        self._workers = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, max_workers))]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, commits):
+        if commits:
+            self._queue.put(list(commits))
+
+    def _run(self):
+        while True:
+            commits = self._queue.get()
+            if commits is None:
+                return
             try:
-                commit_hash, details = future.result()
-                results[commit_hash] = details
+                self._process(commits)
             except Exception as e:
-                commit = future_to_commit[future]
-                print(f"获取提交 {commit['commit_hash']} 详情时出错: {e}")
-                # 提供默认值
-                results[commit['commit_hash']] = {
-                    'full_message': '',
-                    'changed_files': '',
-                    'detailed_files': ''
-                }
+                print(f"读取提交详情或分类时出错: {e}")
+                self._errors.append(e)
+
+    def _process(self, commits):
+        missing = [c['full_hash'] for c in commits if c['full_hash'] not in self.details]
+        run_metrics.add('details.reused', len(commits) - len(missing))
+        run_metrics.add('details.read', len(missing))
+        fetched = read_commit_details(missing)
+
+        batch_details = [self.details.get(c['full_hash']) or fetched.get(c['full_hash'], EMPTY_DETAILS)
+                         for c in commits]
+        classifications = get_classifier().classify_batch(
+            [(commit['subject'], details['file_list']) for commit, details in zip(commits, batch_details)]
+        )
+
+        for commit, details, (categories, patch_type) in zip(commits, batch_details, classifications):
+            record = build_analysis_record(commit, details, categories, patch_type, self.maintainers)
+            with self._lock:
+                self.details[commit['full_hash']] = details
+                self.records[commit['full_hash']] = record
+                if self.row_sink is not None:
+                    self.row_sink(dict(record, 分类=', '.join(categories)))
+
+    def finish(self):
+        """等待队列中的提交全部处理完，返回 {完整SHA: 记录}"""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        if self._errors:
+            raise self._errors[0]
+        return self.records
+
+def analyze_commits_parallel(unique_commits, maintainers=None, row_sink=None, details_dict=None):
+    """分析提交：读取详情后完成分类和类型确定，返回与unique_commits顺序一致的记录列表
+
+    提供MAINTAINERS索引时，同时按修改文件标注子系统和维护者。
+    row_sink 不为空时，每生成一条记录就以详情表的行格式（分类已合并为字符串）传给它。
+    details_dict 为已获取的 {短哈希: 详情}（如增量状态中保存的），提供时不再读取git。
+    """
+    known_details = None
+    if details_dict is not None:
+        known_details = {c['full_hash']: details_dict[c['commit_hash']]
+                         for c in unique_commits if c['commit_hash'] in details_dict}
+
+    print("📥 读取提交详情并分类...")
+    stage = DetailStage(PIPELINE_DETAIL_WORKERS, maintainers, row_sink, known_details)
+    try:
+        for start in range(0, len(unique_commits), PIPELINE_CHUNK_SIZE):
+            stage.submit(unique_commits[start:start + PIPELINE_CHUNK_SIZE])
+    finally:
+        records = stage.finish()
+
+    print(f"分析进度: 100% ({len(records)}/{len(unique_commits)})")
+    return [records[c['full_hash']] for c in unique_commits if c['full_hash'] in records]
+
+def check_unique_commits_pipelined(parsed_commits, get_target_index, on_unique=None):
+    """分块计算源提交的patch-id并判定独有性，返回 (独有提交列表, 等价提交数)
+
+    get_target_index 是返回目标分支patch-id集合的函数（可以阻塞到后台构建完成），
+    各块的patch-id在此之前就已在后台计算。每块判定完成后立即把其中的独有提交
+    交给 on_unique，后续阶段无需等待全部提交检查完毕。
+    """
+    chunks = [parsed_commits[i:i + PIPELINE_CHUNK_SIZE] for i in range(0, len(parsed_commits), PIPELINE_CHUNK_SIZE)]
+    if not chunks:
+        return [], 0
+
+    print(f"🚀 使用流水线计算 {len(parsed_commits)} 个源提交的patch-id（{len(chunks)} 块）...")
+    timer = run_metrics.start_stage('uniqueness')
+    unique_commits = []
+    equivalent_count = 0
+    completed = 0
+
+    waiters = [submit_patch_ids([c['full_hash'] for c in chunk], PIPELINE_CHUNK_SIZE) for chunk in chunks]
+    target_patch_index = get_target_index()
+
+    # 按提交顺序逐块判定，保证输出顺序与git log一致
+    for chunk, wait in zip(chunks, waiters):
+        patch_ids = wait()
+        chunk_unique = []
+        for commit in chunk:
+            source_patch_id = patch_ids.get(commit['full_hash'])
+            if not source_patch_id:
+                print(f"警告: 无法获取提交 {commit['full_hash']} 的patch-id")
+            if not source_patch_id or source_patch_id not in target_patch_index:
+                chunk_unique.append(commit)
+            else:
+                equivalent_count += 1
+        unique_commits.extend(chunk_unique)
+        if on_unique is not None:
+            on_unique(chunk_unique)
 
-    return results
+        completed += len(chunk)
+        progress = int(completed / len(parsed_commits) * 100)
+        print(f"独有性检查进度: {progress}% ({completed}/{len(parsed_commits)})")
 
-def analyze_commits_parallel(unique_commits, max_workers=None):
-    """并行分析提交（分类和类型确定）"""
-    if max_workers is None:
-        max_workers = min(len(unique_commits), multiprocessing.cpu_count())
+    timer.stop(len(parsed_commits))
+    return unique_commits, equivalent_count
+
+def check_unique_commits_parallel(parsed_commits, target_patch_index):
+    """并行检查提交的独有性"""
+    return check_unique_commits_pipelined(parsed_commits, lambda: target_patch_index)
 
-    print(f"🚀 使用 {max_workers} 个线程并行分析提交...")
+def build_commit_fact_table(analysis_data):
+    """由分析结果构建事实表（每个提交一行）和提交→分类映射
 
-    # 1. 并行获取所有提交的详细信息
-    print("📥 并行获取提交详情...")
-    details_dict = get_commit_details_batch(unique_commits, max_workers)
+    映射是以事实表行号为索引的Series，一个提交属于几个分类就出现几次。
+    """
+    df = pd.DataFrame(analysis_data)
+    category_map = df['分类'].explode()
+    df['分类'] = df['分类'].str.join(', ')
+    return df, category_map
 
-    # 2. 并行进行分类和类型分析
-    analysis_data = []
-    analysis_lock = threading.Lock()
+def category_sheet_view(df, category, rows, compact=False):
+    """返回生成某分类工作表的函数，由create_formatted_excel在写入时调用"""
+    if not compact:
+        # 与详情表相同的列，分类列只显示当前分类
+        return lambda: df.loc[rows].assign(分类=category)
 
-    def analyze_single_commit(commit):
-        commit_hash = commit['commit_hash']
-        details = details_dict.get(commit_hash, {
-            'full_message': '',
-            'changed_files': '',
-            'detailed_files': ''
+    def build_compact_view():
+        view = df.loc[rows, ['提交哈希', '作者', '日期', '提交标题', '类型']].copy()
+        # 详情表第1行为表头，事实表第i行位于第i+2行
+        view['详情'] = [ExcelLink('查看详情', DETAIL_SHEET_NAME, row + 2) for row in rows]
+        return view
+
+    return build_compact_view
+
+def build_report_sheets(df, category_map, extra_sheets=None, compact_category_sheets=False):
+    """由事实表生成报告的工作表，返回 (工作表字典, 分类统计, 类型统计)
+
+    工作表依次为详情、分类统计、类型统计、子系统统计、extra_sheets 和各分类的视图。
+    """
+    category_groups = category_map.groupby(category_map, sort=False).groups
+
+    # 按分类统计
+    category_stats = pd.Series(
+        {category: len(rows) for category, rows in category_groups.items()}, dtype='int64'
+    ).sort_values(ascending=False, kind='stable')
+    type_stats = df['类型'].value_counts()
+
+    # 准备要写入Excel的数据字典
+    excel_data = {
+        DETAIL_SHEET_NAME: df,
+        '分类统计': pd.DataFrame({
+            '分类': category_stats.index,
+            '数量': category_stats.values
+        }),
+        '类型统计': pd.DataFrame({
+            '类型': type_stats.index,
+            '数量': type_stats.values
         })
+    }
+    if '子系统' in df.columns:
+        subsystem_stats = df['子系统'].str.split('; ').explode().replace('', '未匹配').value_counts()
+        excel_data['子系统统计'] = pd.DataFrame({
+            '子系统': subsystem_stats.index,
+            '数量': subsystem_stats.values
+        })
+    excel_data.update(extra_sheets or {})
 
-        # 分类
-        categories = categorize_commit(commit, details['changed_files'])
+    # 添加各分类的专门分析（写入时才生成对应视图）
+    for category in category_stats.index:
+        sheet_name = f'{category}独有补丁'
+        # Excel工作表名称长度限制
+        if len(sheet_name) > 31:
+            sheet_name = sheet_name[:28] + '...'
+        excel_data[sheet_name] = category_sheet_view(df, category, category_groups[category],
+                                                     compact_category_sheets)
+    return excel_data, category_stats, type_stats
+
+def write_report_files(summary, output, formats, df, excel_data, metadata, report_summary, excel_engine='auto'):
+    """写出Parquet/SQLite和Excel报告，生成的文件追加到 summary['outputs']（Excel在最前）"""
+    for fmt, writer in (('parquet', report_formats.write_parquet), ('sqlite', report_formats.write_sqlite)):
+        if fmt not in formats:
+            continue
+        path = report_formats.output_path(output, fmt)
+        try:
+            writer(path, df, metadata, report_summary)
+            summary['outputs'].append(path)
+            print(f"✅ 已写出{fmt}: {path}")
+        except Exception as e:
+            print(f"❌ 生成{fmt}文件时出错: {e}")
 
-        # 确定补丁类型
-        patch_type = determine_patch_type(commit['subject'], details['full_message'])
+    # 创建格式化的Excel文件
+    if 'xlsx' in formats:
+        print(f"📄 生成格式化的 {output} 文件...")
+        try:
+            with run_metrics.stage('excel_write') as timer:
+                create_formatted_excel(output, excel_data, excel_engine)
+                timer.items = len(df)
+            summary['outputs'].insert(0, output)
+        except Exception as e:
+            print(f"❌ 生成Excel文件时出错: {e}")
+            csv_file = output.replace('.xlsx', '.csv')
+            print(f"尝试保存为CSV格式: {csv_file}")
+            df.to_csv(csv_file, index=False, encoding='utf-8-sig')
+            print(f"✅ 已保存为CSV文件: {csv_file}")
+            summary['outputs'].insert(0, csv_file)
+
+def load_maintainers_index(revision):
+    """加载指定版本的MAINTAINERS索引，与持久化patch-id缓存放在同一目录"""
+    cache_dir = os.path.dirname(patch_id_store.path) if patch_id_store is not None else None
+    try:
+        index = maintainers_index.load_index(revision, cache_dir)
+    except Exception as e:
+        print(f"警告: 解析MAINTAINERS失败，跳过子系统标注: {e}")
+        return None
+    if index is None:
+        print(f"ℹ️ {revision} 中没有MAINTAINERS文件，跳过子系统标注")
+    else:
+        print(f"🗂️ MAINTAINERS索引: {len(index.sections)} 个小节")
+    return index
 
-        # 为每个分类创建记录
-        local_data = []
-        for category in categories:
-            local_data.append({
-                '提交哈希': commit['commit_hash'],
-                '作者': commit['author'],
-                '日期': commit['date'],
-                '提交标题': commit['subject'],
-                '完整提交信息': details['full_message'],
-                '修改文件': details['changed_files'],
-                '文件变更详情': details['detailed_files'],
-                '分类': category,
-                '类型': patch_type
-            })
+def get_scope_touched_commits(revisions, scope, options=''):
+    """改动了范围内路径的提交（完整SHA，按git log顺序），由git按pathspec筛选
 
-        # 线程安全地添加到结果中
-        with analysis_lock:
-            analysis_data.extend(local_data)
+    使用 --full-history：按路径简化历史时git会跳过内容与另一个父提交相同的侧分支，
+    而重复合入的补丁恰好位于这样的侧分支上。
+    """
+    if not scope.pathspecs:
+        return []
+    commits = run_git_command(
+        f'git log --full-history --format=%H {options}{revisions} -- {shlex.join(scope.pathspecs)}'
+    )
+    return [c.strip() for c in commits if c.strip()]
+
+def scoped_commit_filter(revisions, scope, options=''):
+    """返回判断提交（完整SHA, 标题）是否在范围内的函数
+
+    改动了范围内路径的提交由git筛出，只靠标题关键词命中所选分类的提交在这里补充。
+    """
+    touched = set(get_scope_touched_commits(revisions, scope, options))
+    return lambda commit_hash, subject: commit_hash in touched or scope.matches_subject(subject)
+
+def list_scoped_commits(revisions, scope, options=''):
+    """范围内的提交（完整SHA，按git log顺序）"""
+    if not scope.categories:
+        return get_scope_touched_commits(revisions, scope, options)
+    in_scope = scoped_commit_filter(revisions, scope, options)
+    commits = []
+    for line in bounded_memory.iter_git_lines(['log', '--format=%H %s'] + options.split() + revisions.split()):
+        commit_hash, _, subject = line.partition(' ')
+        if in_scope(commit_hash, subject):
+            commits.append(commit_hash)
+    return commits
+
+def get_source_commits(revisions, scope=None):
+    """按git log的版本范围获取源分支的非合并提交并解析，scope 不为空时只取范围内的提交"""
+    with run_metrics.stage('source_commits') as timer:
+        pathspec = ''
+        if scope is not None and not scope.categories:
+            # 只按路径限定时直接由git筛选
+            pathspec = f' --full-history -- {shlex.join(scope.pathspecs)}'
+        commits = run_git_command(
+            f'git log --pretty=format:"%H|%h|%an|%ad|%s" --date=short --no-merges {revisions}{pathspec}'
+        )
+        parsed_commits = []
+        for commit in commits:
+            if commit.strip():
+                commit_info = parse_commit_info(commit)
+                if commit_info:
+                    parsed_commits.append(commit_info)
+        if scope is not None and scope.categories:
+            in_scope = scoped_commit_filter(revisions, scope, '--no-merges ')
+            parsed_commits = [c for c in parsed_commits if in_scope(c['full_hash'], c['subject'])]
+        timer.items = len(parsed_commits)
+    return parsed_commits
+
+def _unique_commit_info(commit_hash):
+    """增量状态中为独有补丁保存的复查依据"""
+    return {'patch_id': patch_id_cache.get(commit_hash), 'refs': list(upstream_ref_cache.get(commit_hash, ()))}
+
+def filter_commits_full(source_branch, target_branch, merge_base, use_upstream_match, track_state=False,
+                        on_unique=None, scope=None):
+    """完整地判定源分支每个提交是否在目标分支中有等价提交
+
+    返回包含 commits、equivalents（{完整SHA: (匹配方式, 匹配依据)}）、unique_commits
+    以及目标侧索引的字典；track_state 为真时总是构建目标侧索引以便写入增量状态。
+    独有提交按块确认后立即交给 on_unique。scope 不为空时两侧都只取范围内的提交。
+    """
+    if merge_base:
+        print(f"只分析公共祖先 {merge_base[:8]} 之后的提交")
+        parsed_commits = get_source_commits(f'{merge_base}..{source_branch}', scope)
+    else:
+        print("分析全部差异提交")
+        parsed_commits = get_source_commits(f'{target_branch}..{source_branch}', scope)
 
-    print("🔍 并行进行分类和类型分析...")
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有分析任务
-        futures = [executor.submit(analyze_single_commit, commit) for commit in unique_commits]
+    result = {'commits': parsed_commits, 'equivalents': {}, 'unique_commits': [], 'unique_info': {},
+              'details': {}, 'target_commits': [], 'target_keys': set(), 'target_patch_ids': set()}
+    if not parsed_commits:
+        return result
 
-        # 等待完成并显示进度
-        completed = 0
-        for future in as_completed(futures):
-            try:
-                future.result()
-                completed += 1
-                if completed % 20 == 0 or completed == len(futures):
-                    progress = int(completed / len(futures) * 100)
-                    print(f"分析进度: {progress}% ({completed}/{len(futures)})")
-            except Exception as e:
-                print(f"分析提交时出错: {e}")
-                completed += 1
+    target_commits = get_target_commits(target_branch, merge_base, scope)
+    result['target_commits'] = target_commits
+
+    # 先按上游提交引用（stable/cherry-pick标记）匹配，命中的提交无需计算patch-id
+    upstream_matches = {}
+    if use_upstream_match:
+        with run_metrics.stage('upstream_match') as timer:
+            upstream_matches = match_by_upstream_reference(parsed_commits, target_commits)
+            if track_state:
+                # 两侧的上游引用已在缓存中，这里只是组装集合
+                result['target_keys'] = build_upstream_keys(target_commits)
+            timer.items = len(parsed_commits)
+    for commit_hash, key in upstream_matches.items():
+        result['equivalents'][commit_hash] = ('上游SHA', key)
+    remaining_commits = [c for c in parsed_commits if c['full_hash'] not in upstream_matches]
+
+    # 目标分支的patch-id索引在后台构建，同时计算剩余源提交的patch-id，两侧共享git并发预算
+    if remaining_commits:
+        with ThreadPoolExecutor(max_workers=1) as index_executor:
+            index_future = index_executor.submit(build_target_branch_patch_index, target_branch, merge_base,
+                                                 target_commits)
+            print(f"\n🔍 开始并行检查 {len(remaining_commits)} 个提交的独有性...")
+            unique_commits, _ = check_unique_commits_pipelined(remaining_commits, index_future.result, on_unique)
+        result['target_patch_ids'] = index_future.result()
+        result['unique_commits'] = unique_commits
+    elif track_state:
+        result['target_patch_ids'] = build_target_branch_patch_index(target_branch, merge_base, target_commits)
+
+    unique_hashes = {c['full_hash'] for c in result['unique_commits']}
+    for commit in remaining_commits:
+        commit_hash = commit['full_hash']
+        if commit_hash in unique_hashes:
+            result['unique_info'][commit_hash] = _unique_commit_info(commit_hash)
+        else:
+            result['equivalents'][commit_hash] = ('patch-id', patch_id_cache.get(commit_hash))
+    return result
+
+def filter_commits_incremental(state, source_branch, target_branch, merge_base, use_upstream_match,
+                               on_unique=None, scope=None):
+    """在上次分析结果的基础上只处理两侧的新提交，返回值与filter_commits_full相同
+
+    目标侧只会增加提交，上次的等价结论保持不变；上次的独有补丁只需对照目标侧
+    新增的提交复查，源分支新增的提交则对照完整的目标侧索引检查。
+    scope 须与上次分析相同（由 analysis_state.check_resumable 保证）。
+    """
+    new_target_revisions = f'{target_branch} ^{state["target_tip"]} ^{merge_base}'
+    if scope is not None:
+        new_target = list_scoped_commits(new_target_revisions, scope)
+    else:
+        new_target = [c.strip() for c in run_git_command(
+            f'git log {new_target_revisions} --format=%H'
+        ) if c.strip()]
+    new_source = get_source_commits(f'{source_branch} ^{state["source_tip"]} ^{merge_base}', scope)
+    print(f"♻️  增量分析: {source_branch} 新增 {len(new_source)} 个提交，{target_branch} 新增 {len(new_target)} 个提交")
+
+    target_keys = set(state['target_keys'])
+    target_patch_ids = set(state['target_patch_ids'])
+    new_keys = set()
+    new_patch_ids = set()
+    if new_target:
+        with run_metrics.stage('target_index') as timer:
+            if use_upstream_match:
+                new_keys = build_upstream_keys(new_target)
+                target_keys |= new_keys
+            new_patch_ids = {pid for pid in get_patch_ids_batch(new_target).values() if pid}
+            target_patch_ids |= new_patch_ids
+            timer.items = len(new_target)
+
+    result = {'commits': new_source + state['commits'], 'equivalents': {}, 'unique_commits': [],
+              'unique_info': {}, 'details': {}, 'target_commits': new_target + state['target_commits'],
+              'target_keys': target_keys, 'target_patch_ids': target_patch_ids}
+
+    rechecked = 0
+    for commit in state['commits']:
+        commit_hash = commit['full_hash']
+        if commit_hash not in state['unique']:
+            result['equivalents'][commit_hash] = tuple(state['equivalents'][commit_hash])
+            continue
+        info = state['unique'][commit_hash]
+        upstream_key = next((k for k in [commit_hash] + info['refs'] if k in new_keys), None)
+        if upstream_key:
+            result['equivalents'][commit_hash] = ('上游SHA', upstream_key)
+        elif info['patch_id'] and info['patch_id'] in new_patch_ids:
+            result['equivalents'][commit_hash] = ('patch-id', info['patch_id'])
+        else:
+            result['unique_info'][commit_hash] = {'patch_id': info['patch_id'], 'refs': info['refs']}
+            result['details'][commit_hash] = info['details']
+            continue
+        rechecked += 1
+    if rechecked:
+        print(f"  {rechecked} 个原独有补丁在目标分支的新提交中找到了等价版本")
+    # 仍然独有的旧提交详情已保存在状态中，直接进入详情阶段
+    if on_unique is not None:
+        on_unique([c for c in state['commits'] if c['full_hash'] in result['unique_info']])
+
+    if new_source:
+        upstream_matches = {}
+        if use_upstream_match:
+            print("🔗 通过上游提交引用匹配等价提交...")
+            with run_metrics.stage('upstream_match') as timer:
+                upstream_matches = match_upstream_keys(new_source, target_keys)
+                timer.items = len(new_source)
+        for commit_hash, key in upstream_matches.items():
+            result['equivalents'][commit_hash] = ('上游SHA', key)
+
+        remaining_commits = [c for c in new_source if c['full_hash'] not in upstream_matches]
+        if remaining_commits:
+            print(f"\n🔍 开始并行检查 {len(remaining_commits)} 个新提交的独有性...")
+            unique_commits, _ = check_unique_commits_pipelined(remaining_commits, lambda: target_patch_ids, on_unique)
+            unique_hashes = {c['full_hash'] for c in unique_commits}
+            for commit in remaining_commits:
+                commit_hash = commit['full_hash']
+                if commit_hash in unique_hashes:
+                    result['unique_info'][commit_hash] = _unique_commit_info(commit_hash)
+                else:
+                    result['equivalents'][commit_hash] = ('patch-id', patch_id_cache.get(commit_hash))
+
+    result['unique_commits'] = [c for c in result['commits'] if c['full_hash'] in result['unique_info']]
+    return result
+
+def save_analysis_state(state_file, source_branch, target_branch, source_tip, target_tip, merge_base,
+                        use_upstream_match, result, details, scope=None):
+    """把本次分析结果写入增量状态文件"""
+    unique = {}
+    for commit_hash, info in result['unique_info'].items():
+        unique[commit_hash] = dict(info, details=details.get(commit_hash))
+    analysis_state.save_state(state_file, {
+        'source': source_branch,
+        'target': target_branch,
+        'source_tip': source_tip,
+        'target_tip': target_tip,
+        'merge_base': merge_base,
+        'use_upstream_match': use_upstream_match,
+        'scope': scope.key() if scope is not None else None,
+        'commits': result['commits'],
+        'equivalents': result['equivalents'],
+        'unique': unique,
+        'target_commits': result['target_commits'],
+        'target_keys': sorted(result['target_keys']),
+        'target_patch_ids': sorted(result['target_patch_ids'])
+    })
+    print(f"💾 增量状态: {state_file}")
+
+def run_analysis(source_branch, target_branch, output, jobs=None, use_merge_base=True, use_upstream_match=True,
+                 fuzzy_threshold=None, excel_engine='auto', compact_category_sheets=False, use_maintainers=True,
+                 formats=('xlsx',), state_file=None, memory_bounded=False, chunk_size=None, scope=None):
+    """分析源分支相对目标分支的独有补丁并生成报告，返回统计摘要
+
+    分支需已验证存在。patch-id和提交详情的缓存在同一进程内的多次调用之间共享，
+    compare_adjacent_versions.py 的链式模式依赖这一点。
+    formats 为输出格式列表（xlsx/parquet/jsonl/sqlite），非Excel格式的文件名由output替换扩展名得到。
+    提供 state_file 时启用增量分析：分支只是向前推进时只处理新提交，并在结束时更新状态文件。
+    jobs 为同时运行的git进程总数，为空时按CPU核数确定。
+    每次调用重新开始记录性能指标，返回后可用 run_metrics.snapshot() 取得本次分析的指标。
+    memory_bounded 为真时按 chunk_size 分块处理源提交（见 run_analysis_bounded），
+    不支持近似重复检测和增量分析。
+    scope（analysis_scope.AnalysisScope）不为空时两侧都只分析范围内的提交。
+    """
+    if memory_bounded and (fuzzy_threshold is not None or state_file):
+        raise ValueError("内存受限模式不支持近似重复检测和增量分析")
+    jobs = git_executor.configure(jobs).jobs
+    run_metrics.begin()
+
+    summary = {
+        'source': source_branch,
+        'target': target_branch,
+        'total_commits': 0,
+        'equivalent_count': 0,
+        'unique_count': 0,
+        'upstream_match_count': 0,
+        'patch_id_match_count': 0,
+        'fuzzy_candidate_count': 0,
+        'merge_base': None,
+        'output': None,
+        'outputs': []
+    }
 
-    return analysis_data
+    # 1. 找到公共祖先（除非禁用）
+    merge_base = None
+    if use_merge_base:
+        with run_metrics.stage('merge_base'):
+            merge_base = find_merge_base(target_branch, source_branch)
+    summary['merge_base'] = merge_base
+    if scope is not None:
+        print(f"🎯 分析范围: {scope.describe()}")
+
+    if memory_bounded:
+        return run_analysis_bounded(summary, merge_base, output, jobs, use_upstream_match, excel_engine,
+                                    compact_category_sheets, use_maintainers, formats, chunk_size, scope)
+
+    # 2. 判定源分支每个提交是否有等价版本（能增量时只处理上次分析之后的新提交）
+    state = None
+    source_tip = target_tip = None
+    if state_file:
+        source_tip = git_backend.resolve(f'{source_branch}^{{commit}}')
+        target_tip = git_backend.resolve(f'{target_branch}^{{commit}}')
+        previous = analysis_state.load_state(state_file)
+        resumable, reason = analysis_state.check_resumable(previous, source_branch, target_branch, source_tip,
+                                                           target_tip, merge_base, use_upstream_match,
+                                                           scope.key() if scope is not None else None)
+        if resumable:
+            state = previous
+        else:
+            print(f"ℹ️  无法增量分析（{reason}），执行完整分析")
+
+    # 3. 独有补丁一经确认就进入详情阶段：读取详情、分类，并把记录流式写出
+    # 子系统按被分析版本（源分支）中的MAINTAINERS确定
+    maintainers = None
+    if use_maintainers:
+        with run_metrics.stage('maintainers'):
+            maintainers = load_maintainers_index(source_branch)
+    metadata = report_formats.comparison_metadata(source_branch, target_branch, merge_base)
+    jsonl_writer = None
+    if 'jsonl' in formats:
+        jsonl_writer = report_formats.JsonlWriter(report_formats.output_path(output, 'jsonl'), metadata)
+    known_details = None
+    if state is not None:
+        known_details = {h: info['details'] for h, info in state['unique'].items() if info.get('details')}
+    detail_timer = run_metrics.start_stage('details')
+    detail_stage = DetailStage(PIPELINE_DETAIL_WORKERS, maintainers,
+                               jsonl_writer.write_row if jsonl_writer else None, known_details)
 
-def check_unique_commits_parallel(parsed_commits, target_patch_index, max_workers=None):
-    """并行检查提交的独有性"""
-    if max_workers is None:
-        max_workers = min(len(parsed_commits), multiprocessing.cpu_count())
+    try:
+        try:
+            if state is not None:
+                result = filter_commits_incremental(state, source_branch, target_branch, merge_base,
+                                                    use_upstream_match, detail_stage.submit, scope)
+            else:
+                result = filter_commits_full(source_branch, target_branch, merge_base, use_upstream_match,
+                                             bool(state_file), detail_stage.submit, scope)
+        finally:
+            records = detail_stage.finish()
+            detail_timer.stop(len(records))
+    except BaseException:
+        if jsonl_writer:
+            jsonl_writer.abort()
+        raise
+
+    parsed_commits = result['commits']
+    unique_commits = result['unique_commits']
+    target_commits = result['target_commits']
+    equivalents = result['equivalents']
+
+    total_commits = len(parsed_commits)
+    summary['total_commits'] = total_commits
+    if total_commits == 0:
+        print("✅ 没有找到提交差异，两个分支内容相同")
+        if jsonl_writer:
+            jsonl_writer.abort()
+        return summary
+    print(f"📊 共 {total_commits} 个提交需要分析")
+
+    upstream_match_count = sum(1 for method, _ in equivalents.values() if method == '上游SHA')
+    patch_id_equivalent_count = len(equivalents) - upstream_match_count
+    equivalent_count = len(equivalents)
+    summary['equivalent_count'] = equivalent_count
+    summary['unique_count'] = len(unique_commits)
+    summary['upstream_match_count'] = upstream_match_count
+    summary['patch_id_match_count'] = patch_id_equivalent_count
 
-    print(f"🚀 使用 {max_workers} 个线程并行检查独有性...")
+    print(f"\n📈 过滤结果:")
+    print(f"  总提交数: {total_commits}")
+    print(f"  等价提交: {equivalent_count}（上游SHA匹配 {upstream_match_count}，patch-id匹配 {patch_id_equivalent_count}）")
+    print(f"  独有补丁: {len(unique_commits)}")
 
-    unique_commits = []
-    equivalent_count = 0
-    results_lock = threading.Lock()
+    # 增量状态保存独有补丁的详情，下次无需重新读取
+    if state_file:
+        with run_metrics.stage('state_save'):
+            save_analysis_state(state_file, source_branch, target_branch, source_tip, target_tip, merge_base,
+                                use_upstream_match, result, detail_stage.details, scope)
 
-    def check_commit_uniqueness(commit):
-        nonlocal equivalent_count
-        is_unique = is_patch_unique_fast(commit['commit_hash'], target_patch_index)
+    if not unique_commits:
+        print("✅ 没有找到独有补丁，所有提交都有等价版本")
+        if jsonl_writer:
+            jsonl_writer.abort()
+        return summary
+
+    if jsonl_writer:
+        jsonl_writer.close()
+        summary['outputs'].append(jsonl_writer.path)
+        print(f"✅ 已写出JSONL: {jsonl_writer.path}（{jsonl_writer.count} 行）")
+
+    # 可选：对独有补丁做近似重复检测
+    fuzzy_candidates = []
+    if fuzzy_threshold is not None:
+        with run_metrics.stage('fuzzy') as timer:
+            fuzzy_candidates = find_fuzzy_equivalents(unique_commits, target_commits, fuzzy_threshold)
+            timer.items = len(unique_commits)
+    summary['fuzzy_candidate_count'] = len({c['提交哈希'] for c in fuzzy_candidates})
+
+    # 报告中的记录按git log顺序排列
+    analysis_data = [records[c['full_hash']] for c in unique_commits]
+
+    # 创建DataFrame：每个提交一行的事实表 + 提交→分类映射
+    print("📊 创建数据表...")
+    report_timer = run_metrics.start_stage('report')
+    df, category_map = build_commit_fact_table(analysis_data)
+
+    # 记录每个等价提交的匹配方式
+    equivalent_rows = []
+    for commit in parsed_commits:
+        if commit['full_hash'] not in equivalents:
+            continue
+        method, evidence = equivalents[commit['full_hash']]
+        equivalent_rows.append({
+            '提交哈希': commit['commit_hash'],
+            '作者': commit['author'],
+            '日期': commit['date'],
+            '提交标题': commit['subject'],
+            '匹配方式': method,
+            '匹配依据': evidence
+        })
+    extra_sheets = {}
+    if equivalent_rows:
+        extra_sheets['等价提交'] = pd.DataFrame(equivalent_rows)
+    if fuzzy_candidates:
+        extra_sheets['疑似等价补丁'] = pd.DataFrame(fuzzy_candidates)
+    excel_data, category_stats, type_stats = build_report_sheets(df, category_map, extra_sheets,
+                                                                 compact_category_sheets)
+
+    # 列式格式：与详情表相同的列，附带比较元数据
+    report_summary = {key: summary[key] for key in (
+        'total_commits', 'equivalent_count', 'unique_count', 'upstream_match_count',
+        'patch_id_match_count', 'fuzzy_candidate_count'
+    )}
+    write_report_files(summary, output, formats, df, excel_data, metadata, report_summary, excel_engine)
+    report_timer.stop(len(unique_commits))
+
+    if not summary['outputs']:
+        return summary
+    summary['output'] = summary['outputs'][0]
+
+    print_analysis_summary(summary, jobs, category_stats.items(), type_stats.items(), fuzzy_threshold is not None)
+    return summary
+
+def print_analysis_summary(summary, jobs, category_counts, type_counts, fuzzy=False):
+    """打印分析完成后的总结，category_counts/type_counts 为 (名称, 数量) 序列"""
+    print(f"\n🎉 分析完成！")
+    print(f"📊 分支对比: {summary['source']} vs {summary['target']}")
+    if summary.get('targets'):
+        # 多目标模式：逐个目标分支给出统计
+        print(f"📈 总提交数: {summary['total_commits']}")
+        print(f"⭐ 至少相对一个目标分支独有: {summary['unique_count']}")
+        for target, counts in summary['targets'].items():
+            print(f"  🎯 {target}: 比较范围内 {counts['total_commits']} 个提交，"
+                  f"等价 {counts['equivalent_count']}（上游SHA {counts['upstream_match_count']} / "
+                  f"patch-id {counts['patch_id_match_count']}），独有 {counts['unique_count']}")
+    else:
+        if summary['merge_base']:
+            print(f"🔗 公共祖先: {summary['merge_base']}")
+        print(f"📈 总提交数: {summary['total_commits']}")
+        print(f"🔄 等价提交: {summary['equivalent_count']}"
+              f"（上游SHA {summary['upstream_match_count']} / patch-id {summary['patch_id_match_count']}）")
+        print(f"⭐ 独有补丁: {summary['unique_count']}")
+    if fuzzy:
+        print(f"🧩 疑似等价: {summary['fuzzy_candidate_count']} 个独有补丁")
+    counters = run_metrics.current().counters
+    print(f"💾 patch-id缓存: 内存命中 {counters.get('patch_id.memory_hits', 0)}，"
+          f"持久化缓存命中 {counters.get('patch_id.store_hits', 0)}，新计算 {counters.get('patch_id.computed', 0)}")
+    print(f"🧵 git并发进程: {jobs}")
+    for path in summary['outputs']:
+        print(f"📁 输出文件: {path}")
+    print("\n📊 独有补丁分类统计:")
+    for category, count in category_counts:
+        print(f"  {category}: {count} 个补丁")
+    print("\n📋 独有补丁类型统计:")
+    for patch_type, count in type_counts:
+        print(f"  {patch_type}: {count} 个补丁")
+
+def build_unique_row(commit, details, categories, patch_type, maintainers=None):
+    """与 build_analysis_record 相同，返回 __slots__ 记录（内存受限模式使用）"""
+    row = bounded_memory.UniqueRow(
+        commit_hash=commit['commit_hash'],
+        author=commit['author'],
+        date=commit['date'],
+        subject=commit['subject'],
+        full_message=details['full_message'],
+        changed_files=details['changed_files'],
+        detailed_files=details['detailed_files'],
+        categories=categories,
+        patch_type=patch_type
+    )
+    if maintainers is not None:
+        subsystems, maintainer_list = maintainers.classify(details['file_list'])
+        row.subsystems = '; '.join(subsystems)
+        row.maintainers = '; '.join(maintainer_list)
+    return row
+
+def _bounded_batch_size(chunk_size, jobs):
+    # 每块再按git并发数切成若干批，同一块内的git命令可以并行
+    return max(50, -(-chunk_size // jobs))
+
+def build_bounded_target_index(target_branch, merge_base, use_upstream_match, chunk_size, jobs, scope=None):
+    """流式读取目标分支的提交并建立索引，返回 (上游引用键, patch-id, 提交数)
+
+    两个集合都是 bounded_memory.HashSet，计算结果只写入持久化缓存，不留在进程内缓存中。
+    scope 不为空时只索引范围内的提交（范围内的提交列表本身很小，直接读入）。
+    """
+    revisions = [f'{merge_base}..{target_branch}'] if merge_base else [target_branch]
+    if scope is not None:
+        commits = iter(list_scoped_commits(revisions[0], scope))
+    else:
+        commits = bounded_memory.iter_git_lines(['rev-list'] + revisions)
+    target_keys = bounded_memory.HashSet()
+    target_patch_ids = bounded_memory.HashSet()
+    batch_size = _bounded_batch_size(chunk_size, jobs)
+    count = 0
 
-        with results_lock:
-            if is_unique:
-                unique_commits.append(commit)
+    print(f"正在构建 {target_branch} 分支的patch-id索引...")
+    with run_metrics.stage('target_index') as timer:
+        for chunk in bounded_memory.iter_chunks(commits, chunk_size):
+            wait = submit_patch_ids(chunk, batch_size, use_memory_cache=False)
+            if use_upstream_match:
+                references = get_upstream_references_batch(chunk, batch_size, use_memory_cache=False)
+                target_keys.add(chunk)
+                target_keys.add([ref for refs in references.values() for ref in refs])
+            target_patch_ids.add([pid for pid in wait().values() if pid])
+            count += len(chunk)
+            print(f"  已索引 {count} 个目标提交")
+        timer.items = count
+
+    size = (target_keys.nbytes + target_patch_ids.nbytes) / (1 << 20)
+    print(f"✅ 索引构建完成，共 {len(target_patch_ids)} 个唯一patch-id（索引占用 {size:.1f} MiB）")
+    return target_keys, target_patch_ids, count
+
+def _match_bounded_chunk(commits, target_keys, target_patch_ids, use_upstream_match, batch_size):
+    """判定一块源提交，返回 ({完整SHA: (匹配方式, 匹配依据)}, 独有提交列表)"""
+    hashes = [c['full_hash'] for c in commits]
+    equivalents = {}
+
+    if use_upstream_match:
+        with run_metrics.stage('upstream_match') as timer:
+            references = get_upstream_references_batch(hashes, batch_size, use_memory_cache=False)
+            # 各提交自身及其引用的SHA一次性查询，每个提交取第一个命中的键
+            owners = []
+            keys = []
+            for commit in hashes:
+                for key in (commit,) + references[commit]:
+                    owners.append(commit)
+                    keys.append(key)
+            for commit, key, found in zip(owners, keys, target_keys.contains(keys)):
+                if found and commit not in equivalents:
+                    equivalents[commit] = ('上游SHA', key)
+            timer.items = len(hashes)
+
+    remaining = [c for c in commits if c['full_hash'] not in equivalents]
+    unique_commits = []
+    with run_metrics.stage('uniqueness') as timer:
+        patch_ids = get_patch_ids_batch([c['full_hash'] for c in remaining], batch_size, use_memory_cache=False)
+        source_ids = [patch_ids.get(c['full_hash']) for c in remaining]
+        for commit, patch_id, found in zip(remaining, source_ids, target_patch_ids.contains(source_ids)):
+            if not patch_id:
+                print(f"警告: 无法获取提交 {commit['full_hash']} 的patch-id")
+            if found:
+                equivalents[commit['full_hash']] = ('patch-id', patch_id)
             else:
-                equivalent_count += 1
+                unique_commits.append(commit)
+        timer.items = len(remaining)
+    return equivalents, unique_commits
+
+def _bounded_rows(unique_commits, maintainers, batch_size):
+    """读取一块独有补丁的详情并分类，返回 UniqueRow 列表"""
+    with run_metrics.stage('details') as timer:
+        hashes = [c['full_hash'] for c in unique_commits]
+        run_metrics.add('details.read', len(hashes))
+        details = {}
+        for future in [_submit_commit_details(part) for part in split_into_chunks(hashes, batch_size)]:
+            details.update(_parse_commit_details(future.result()))
+        batch_details = [details.get(h, EMPTY_DETAILS) for h in hashes]
+        classifications = get_classifier().classify_batch(
+            [(commit['subject'], d['file_list']) for commit, d in zip(unique_commits, batch_details)]
+        )
+        rows = [build_unique_row(commit, d, categories, patch_type, maintainers)
+                for commit, d, (categories, patch_type) in zip(unique_commits, batch_details, classifications)]
+        timer.items = len(rows)
+    return rows
+
+def _bounded_category_view(spill, category, compact=False):
+    """某分类工作表的行来源，与 category_sheet_view 生成的视图列相同"""
+    if not compact:
+        category_index = spill.columns.index('分类')
+        rows = spill.category_rows(category, spill.columns)
+        return bounded_memory.RowSource(spill.columns, lambda: (
+            [category if i == category_index else value for i, value in enumerate(row[1:])] for row in rows()
+        ))
+
+    columns = ['提交哈希', '作者', '日期', '提交标题', '类型']
+    rows = spill.category_rows(category, columns)
+    # 详情表第1行为表头，第seq个提交位于第seq+2行
+    return bounded_memory.RowSource(columns + ['详情'], lambda: (
+        list(row[1:]) + [ExcelLink('查看详情', DETAIL_SHEET_NAME, row[0] + 2)] for row in rows()
+    ))
+
+def _write_csv_rows(path, table):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(table.columns)
+        writer.writerows(table.rows())
+
+def run_analysis_bounded(summary, merge_base, output, jobs, use_upstream_match=True, excel_engine='auto',
+                         compact_category_sheets=False, use_maintainers=True, formats=('xlsx',),
+                         chunk_size=None, scope=None):
+    """内存受限模式的分析（由 run_analysis 调用），峰值内存与比较范围的大小无关
+
+    目标侧索引以二进制数组保存；源提交按 chunk_size 分块流式读取，每块依次完成
+    上游引用匹配、patch-id判定、读取详情和分类，完成的行写入临时SQLite文件后即释放。
+    报告的各工作表和其他格式都从临时文件流式生成。
+    """
+    source_branch, target_branch = summary['source'], summary['target']
+    chunk_size = chunk_size or BOUNDED_CHUNK_SIZE
+    batch_size = _bounded_batch_size(chunk_size, jobs)
+    print(f"🪶 内存受限模式: 每块 {chunk_size} 个源提交，已完成的行暂存在临时文件中")
+
+    maintainers = None
+    if use_maintainers:
+        with run_metrics.stage('maintainers'):
+            maintainers = load_maintainers_index(source_branch)
+    target_keys, target_patch_ids, _ = build_bounded_target_index(target_branch, merge_base, use_upstream_match,
+                                                                  chunk_size, jobs, scope)
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有检查任务
-        futures = [executor.submit(check_commit_uniqueness, commit) for commit in parsed_commits]
+    if merge_base:
+        print(f"只分析公共祖先 {merge_base[:8]} 之后的提交")
+        revisions = f'{merge_base}..{source_branch}'
+    else:
+        print("分析全部差异提交")
+        revisions = f'{target_branch}..{source_branch}'
 
-        # 等待完成并显示进度
-        completed = 0
-        for future in as_completed(futures):
+    metadata = report_formats.comparison_metadata(source_branch, target_branch, merge_base)
+    jsonl_writer = None
+    if 'jsonl' in formats:
+        jsonl_writer = report_formats.JsonlWriter(report_formats.output_path(output, 'jsonl'), metadata)
+    spill = bounded_memory.RowSpill(maintainers is not None)
+    try:
+        total_commits = 0
+        upstream_match_count = 0
+        patch_id_equivalent_count = 0
+        log_args = ['log', '--pretty=format:%H|%h|%an|%ad|%s', '--date=short', '--no-merges', revisions]
+        if scope is not None and not scope.categories:
+            log_args += ['--full-history', '--'] + scope.pathspecs
+        source_commits = (c for c in map(parse_commit_info, bounded_memory.iter_git_lines(log_args)) if c)
+        if scope is not None and scope.categories:
+            in_scope = scoped_commit_filter(revisions, scope, '--no-merges ')
+            source_commits = (c for c in source_commits if in_scope(c['full_hash'], c['subject']))
+        for commits in bounded_memory.iter_chunks(source_commits, chunk_size):
+            equivalents, unique_commits = _match_bounded_chunk(commits, target_keys, target_patch_ids,
+                                                               use_upstream_match, batch_size)
+            rows = _bounded_rows(unique_commits, maintainers, batch_size) if unique_commits else []
+            spill.append_rows(rows)
+            if jsonl_writer:
+                for row in rows:
+                    jsonl_writer.write_row(dict(zip(spill.columns, row.values(spill.with_maintainers))))
+
+            equivalent_rows = []
+            for commit in commits:
+                if commit['full_hash'] in equivalents:
+                    method, evidence = equivalents[commit['full_hash']]
+                    equivalent_rows.append((commit['commit_hash'], commit['author'], commit['date'],
+                                            commit['subject'], method, evidence))
+            spill.append_equivalents(equivalent_rows)
+
+            total_commits += len(commits)
+            upstream_match_count += sum(1 for method, _ in equivalents.values() if method == '上游SHA')
+            patch_id_equivalent_count += sum(1 for method, _ in equivalents.values() if method == 'patch-id')
+            print(f"分块进度: 已分析 {total_commits} 个提交，独有补丁 {spill.row_count} 个")
+
+        summary['total_commits'] = total_commits
+        if total_commits == 0:
+            print("✅ 没有找到提交差异，两个分支内容相同")
+            if jsonl_writer:
+                jsonl_writer.abort()
+            return summary
+        print(f"📊 共 {total_commits} 个提交需要分析")
+
+        equivalent_count = upstream_match_count + patch_id_equivalent_count
+        summary['equivalent_count'] = equivalent_count
+        summary['unique_count'] = spill.row_count
+        summary['upstream_match_count'] = upstream_match_count
+        summary['patch_id_match_count'] = patch_id_equivalent_count
+
+        print(f"\n📈 过滤结果:")
+        print(f"  总提交数: {total_commits}")
+        print(f"  等价提交: {equivalent_count}（上游SHA匹配 {upstream_match_count}，patch-id匹配 {patch_id_equivalent_count}）")
+        print(f"  独有补丁: {spill.row_count}")
+
+        if not spill.row_count:
+            print("✅ 没有找到独有补丁，所有提交都有等价版本")
+            if jsonl_writer:
+                jsonl_writer.abort()
+            return summary
+
+        if jsonl_writer:
+            jsonl_writer.close()
+            summary['outputs'].append(jsonl_writer.path)
+            print(f"✅ 已写出JSONL: {jsonl_writer.path}（{jsonl_writer.count} 行）")
+
+        print("📊 汇总临时文件中的结果...")
+        report_timer = run_metrics.start_stage('report')
+        category_counts = spill.category_counts()
+        type_counts = spill.value_counts('类型')
+        excel_data = {
+            DETAIL_SHEET_NAME: spill.detail_table(),
+            '分类统计': pd.DataFrame(category_counts, columns=['分类', '数量']),
+            '类型统计': pd.DataFrame(type_counts, columns=['类型', '数量'])
+        }
+        if maintainers is not None:
+            excel_data['子系统统计'] = pd.DataFrame(spill.value_counts('子系统', '; ', '未匹配'),
+                                                columns=['子系统', '数量'])
+        if spill.equivalent_count:
+            excel_data['等价提交'] = spill.equivalent_table()
+        for category, _ in category_counts:
+            sheet_name = f'{category}独有补丁'
+            if len(sheet_name) > 31:
+                sheet_name = sheet_name[:28] + '...'
+            excel_data[sheet_name] = _bounded_category_view(spill, category, compact_category_sheets)
+
+        report_summary = {key: summary[key] for key in (
+            'total_commits', 'equivalent_count', 'unique_count', 'upstream_match_count',
+            'patch_id_match_count', 'fuzzy_candidate_count'
+        )}
+        for fmt, writer in (('parquet', report_formats.write_parquet_rows),
+                            ('sqlite', report_formats.write_sqlite_rows)):
+            if fmt not in formats:
+                continue
+            path = report_formats.output_path(output, fmt)
             try:
-                future.result()
-                completed += 1
-                if completed % 50 == 0 or completed == len(futures):
-                    progress = int(completed / len(futures) * 100)
-                    print(f"独有性检查进度: {progress}% ({completed}/{len(futures)})")
+                writer(path, spill.columns, spill.detail_table().rows(), metadata, report_summary)
+                summary['outputs'].append(path)
+                print(f"✅ 已写出{fmt}: {path}")
             except Exception as e:
-                print(f"检查提交独有性时出错: {e}")
-                completed += 1
+                print(f"❌ 生成{fmt}文件时出错: {e}")
 
-    return unique_commits, equivalent_count
+        if 'xlsx' in formats:
+            print(f"📄 生成格式化的 {output} 文件...")
+            try:
+                with run_metrics.stage('excel_write') as timer:
+                    create_formatted_excel(output, excel_data, excel_engine)
+                    timer.items = spill.row_count
+                summary['outputs'].insert(0, output)
+            except Exception as e:
+                print(f"❌ 生成Excel文件时出错: {e}")
+                csv_file = output.replace('.xlsx', '.csv')
+                print(f"尝试保存为CSV格式: {csv_file}")
+                _write_csv_rows(csv_file, spill.detail_table())
+                print(f"✅ 已保存为CSV文件: {csv_file}")
+                summary['outputs'].insert(0, csv_file)
+        report_timer.stop(spill.row_count)
+    except BaseException:
+        if jsonl_writer:
+            jsonl_writer.abort()
+        raise
+    finally:
+        spill.close()
+
+    if not summary['outputs']:
+        return summary
+    summary['output'] = summary['outputs'][0]
+    print_analysis_summary(summary, jobs, category_counts, type_counts)
+    return summary
+
+# 多目标模式中源提交相对某个目标分支的状态
+TARGET_STATUS_UNIQUE = '独有'
+TARGET_STATUS_CONTAINED = '已包含'
+
+def target_status_column(target_branch):
+    """多目标模式中记录相对某个目标分支状态的列名"""
+    return f'相对{target_branch}'
+
+def run_multi_target_analysis(source_branch, target_branches, output, jobs=None, use_merge_base=True,
+                              use_upstream_match=True, excel_engine='auto', compact_category_sheets=False,
+                              use_maintainers=True, formats=('xlsx',), scope=None):
+    """把一个源分支同时与多个目标分支比较，生成一份报告，返回统计摘要
+
+    源提交的上游引用、patch-id和详情只计算一次；每个目标分支各建一个patch-id索引，
+    在后台线程中并行构建，与源提交的patch-id计算共享git并发预算和缓存。
+    报告的每一行是至少相对一个目标分支独有的提交，每个目标分支一列，给出该提交
+    相对它的状态：独有、等价（上游SHA/patch-id）或已包含（位于公共祖先之前）。
+    """
+    jobs = git_executor.configure(jobs).jobs
+    run_metrics.begin()
+    target_branches = list(dict.fromkeys(target_branches))
+
+    summary = {
+        'source': source_branch,
+        'target': ', '.join(target_branches),
+        'targets': {},
+        'total_commits': 0,
+        'unique_count': 0,
+        'merge_base': None,
+        'output': None,
+        'outputs': []
+    }
+
+    # 1. 各目标分支的公共祖先和对应的源提交范围
+    merge_bases = {}
+    if use_merge_base:
+        with run_metrics.stage('merge_base'):
+            for target in target_branches:
+                merge_bases[target] = find_merge_base(target, source_branch)
+    if scope is not None:
+        print(f"🎯 分析范围: {scope.describe()}")
+
+    range_commits = {}
+    for target in target_branches:
+        merge_base = merge_bases.get(target)
+        print(f"🎯 {target}: " + (f"只分析公共祖先 {merge_base[:8]} 之后的提交" if merge_base else "分析全部差异提交"))
+        range_commits[target] = get_source_commits(
+            f'{merge_base}..{source_branch}' if merge_base else f'{target}..{source_branch}', scope
+        )
+    ranges = {target: {c['full_hash'] for c in commits} for target, commits in range_commits.items()}
+
+    # 所有范围的并集；范围相互嵌套时（最常见的情况）即最大范围的git log顺序
+    parsed_commits = {}
+    for target in sorted(target_branches, key=lambda t: -len(range_commits[t])):
+        for commit in range_commits[target]:
+            parsed_commits.setdefault(commit['full_hash'], commit)
+    parsed_commits = list(parsed_commits.values())
+    summary['total_commits'] = len(parsed_commits)
+    if not parsed_commits:
+        print("✅ 没有找到提交差异，源分支的提交都已包含在各目标分支中")
+        return summary
+    print(f"📊 共 {len(parsed_commits)} 个提交需要分析")
+
+    # 2. 先按上游提交引用匹配，两侧的提交消息一次批量读取
+    target_commits = {target: get_target_commits(target, merge_bases.get(target), scope)
+                      for target in target_branches}
+    equivalents = {target: {} for target in target_branches}
+    if use_upstream_match:
+        with run_metrics.stage('upstream_match') as timer:
+            print("🔗 通过上游提交引用匹配等价提交...")
+            get_upstream_references_batch([c for target in target_branches for c in target_commits[target]] +
+                                          [c['full_hash'] for c in parsed_commits])
+            for target in target_branches:
+                print(f"  {target}:")
+                matches = match_upstream_keys(range_commits[target], build_upstream_keys(target_commits[target]))
+                for commit_hash, key in matches.items():
+                    equivalents[target][commit_hash] = ('上游SHA', key)
+            timer.items = len(parsed_commits)
+
+    # 3. 各目标分支的patch-id索引在后台并行构建，同时计算源提交的patch-id（每个提交只算一次）
+    pending = [c['full_hash'] for c in parsed_commits
+               if any(c['full_hash'] in ranges[t] and c['full_hash'] not in equivalents[t] for t in target_branches)]
+    with ThreadPoolExecutor(max_workers=len(target_branches)) as index_executor:
+        index_futures = {
+            target: index_executor.submit(build_target_branch_patch_index, target, merge_bases.get(target),
+                                          target_commits[target])
+            for target in target_branches
+        }
+        print(f"\n🔍 计算 {len(pending)} 个源提交的patch-id（各目标分支共用）...")
+        with run_metrics.stage('uniqueness') as timer:
+            source_patch_ids = get_patch_ids_batch(pending)
+            timer.items = len(pending)
+        target_patch_ids = {target: future.result() for target, future in index_futures.items()}
+
+    statuses = {}
+    unique_commits = []
+    for commit in parsed_commits:
+        commit_hash = commit['full_hash']
+        patch_id = source_patch_ids.get(commit_hash)
+        if commit_hash in source_patch_ids and not patch_id:
+            print(f"警告: 无法获取提交 {commit_hash} 的patch-id")
+        status = {}
+        for target in target_branches:
+            if commit_hash not in ranges[target]:
+                status[target] = TARGET_STATUS_CONTAINED
+                continue
+            if commit_hash not in equivalents[target] and patch_id and patch_id in target_patch_ids[target]:
+                equivalents[target][commit_hash] = ('patch-id', patch_id)
+            if commit_hash in equivalents[target]:
+                status[target] = f"等价（{equivalents[target][commit_hash][0]}）"
+            else:
+                status[target] = TARGET_STATUS_UNIQUE
+        statuses[commit_hash] = status
+        if TARGET_STATUS_UNIQUE in status.values():
+            unique_commits.append(commit)
+
+    print(f"\n📈 过滤结果:")
+    for target in target_branches:
+        methods = [method for method, _ in equivalents[target].values()]
+        counts = {
+            'merge_base': merge_bases.get(target),
+            'total_commits': len(ranges[target]),
+            'equivalent_count': len(methods),
+            'upstream_match_count': methods.count('上游SHA'),
+            'patch_id_match_count': methods.count('patch-id'),
+            'unique_count': sum(1 for status in statuses.values() if status[target] == TARGET_STATUS_UNIQUE)
+        }
+        summary['targets'][target] = counts
+        print(f"  {target}: 比较范围内 {counts['total_commits']} 个提交，等价 {counts['equivalent_count']}"
+              f"（上游SHA匹配 {counts['upstream_match_count']}，patch-id匹配 {counts['patch_id_match_count']}），"
+              f"独有 {counts['unique_count']}")
+    summary['unique_count'] = len(unique_commits)
+    print(f"  至少相对一个目标分支独有: {len(unique_commits)}")
+    if not unique_commits:
+        print("✅ 没有找到独有补丁，所有提交在各目标分支中都有等价版本")
+        return summary
+
+    # 4. 独有补丁的详情只读取一次；子系统按源分支中的MAINTAINERS确定
+    maintainers = None
+    if use_maintainers:
+        with run_metrics.stage('maintainers'):
+            maintainers = load_maintainers_index(source_branch)
+    with run_metrics.stage('details') as timer:
+        analysis_data = analyze_commits_parallel(unique_commits, maintainers)
+        timer.items = len(analysis_data)
+
+    print("📊 创建数据表...")
+    report_timer = run_metrics.start_stage('report')
+    df, category_map = build_commit_fact_table(analysis_data)
+    # 各目标分支的状态列紧跟在提交标题之后
+    position = df.columns.get_loc('提交标题') + 1
+    for offset, target in enumerate(target_branches):
+        df.insert(position + offset, target_status_column(target),
+                  [statuses[c['full_hash']][target] for c in unique_commits])
+
+    target_rows = [{
+        '目标分支': target,
+        '公共祖先': counts['merge_base'] or '',
+        '比较范围内提交': counts['total_commits'],
+        '上游SHA等价': counts['upstream_match_count'],
+        'patch-id等价': counts['patch_id_match_count'],
+        '独有补丁': counts['unique_count']
+    } for target, counts in summary['targets'].items()]
+    extra_sheets = {'目标统计': pd.DataFrame(target_rows)}
+    equivalent_rows = []
+    for target in target_branches:
+        for commit in range_commits[target]:
+            if commit['full_hash'] not in equivalents[target]:
+                continue
+            method, evidence = equivalents[target][commit['full_hash']]
+            equivalent_rows.append({
+                '目标分支': target,
+                '提交哈希': commit['commit_hash'],
+                '作者': commit['author'],
+                '日期': commit['date'],
+                '提交标题': commit['subject'],
+                '匹配方式': method,
+                '匹配依据': evidence
+            })
+    if equivalent_rows:
+        extra_sheets['等价提交'] = pd.DataFrame(equivalent_rows)
+    excel_data, category_stats, type_stats = build_report_sheets(df, category_map, extra_sheets,
+                                                                 compact_category_sheets)
+
+    metadata = report_formats.comparison_metadata(
+        source_branch, ', '.join(target_branches), ', '.join(merge_bases.get(t) or '' for t in target_branches)
+    )
+    report_summary = {'total_commits': summary['total_commits'], 'unique_count': summary['unique_count']}
+    for target, counts in summary['targets'].items():
+        report_summary[f'unique_count:{target}'] = counts['unique_count']
+    if 'jsonl' in formats:
+        jsonl_writer = report_formats.JsonlWriter(report_formats.output_path(output, 'jsonl'), metadata)
+        for row in df.to_dict('records'):
+            jsonl_writer.write_row(row)
+        jsonl_writer.close()
+        summary['outputs'].append(jsonl_writer.path)
+        print(f"✅ 已写出JSONL: {jsonl_writer.path}（{jsonl_writer.count} 行）")
+    write_report_files(summary, output, formats, df, excel_data, metadata, report_summary, excel_engine)
+    report_timer.stop(len(unique_commits))
+
+    if not summary['outputs']:
+        return summary
+    summary['output'] = summary['outputs'][0]
+    print_analysis_summary(summary, jobs, category_stats.items(), type_stats.items())
+    return summary
+
+def default_state_file(source_branch, target_branch, output):
+    """--incremental 未指定状态文件时的默认路径：缓存目录下按分支对命名，没有缓存目录时放在输出文件旁"""
+    cache_dir = os.path.dirname(patch_id_store.path) if patch_id_store is not None else default_cache_dir()
+    if cache_dir:
+        return analysis_state.default_state_path(cache_dir, source_branch, target_branch)
+    return report_formats.output_path(output, 'state.json')
 
-# 修改主函数中的相关部分
 def main():
     # 解析命令行参数
-    source_branch, target_branch, args = parse_arguments()
+    source_branch, target_branches, args = parse_arguments()
+    target_branch = ', '.join(target_branches)
+    multi_target = len(target_branches) > 1
 
     # 如果请求列出分支
     if args.list_branches:
@@ -588,14 +1937,7 @@ def main():
         return
 
     # 验证必需的参数
-    if not source_branch or not target_branch:
-        print("❌ 错误: 必须指定源分支和目标分支")
-        print("\n使用方法:")
-        print("  python generate_patch_analysis.py <源分支> <目标分支>")
-        print("  python generate_patch_analysis.py --source <源分支> --target <目标分支>")
-        print("\n查看帮助: python generate_patch_analysis.py --help")
-        print("列出分支: python generate_patch_analysis.py --list-branches")
-        sys.exit(1)
+    check_required_branches(source_branch, target_branches)
 
     # 验证分支是否存在
     if not validate_branch_exists(source_branch):
@@ -603,141 +1945,71 @@ def main():
         print("\n💡 提示: 使用 --list-branches 查看可用分支")
         sys.exit(1)
 
-    if not validate_branch_exists(target_branch):
-        print(f"❌ 错误: 目标分支 '{target_branch}' 不存在")
-        print("\n💡 提示: 使用 --list-branches 查看可用分支")
-        sys.exit(1)
+    for branch in target_branches:
+        if not validate_branch_exists(branch):
+            print(f"❌ 错误: 目标分支 '{branch}' 不存在")
+            print("\n💡 提示: 使用 --list-branches 查看可用分支")
+            sys.exit(1)
 
     # 如果没有指定输出文件名，则动态生成
     if not args.output:
-        # 清理分支名称中的特殊字符，避免文件名问题
-        safe_source = re.sub(r'[^\w\-_.]', '_', source_branch)
-        safe_target = re.sub(r'[^\w\-_.]', '_', target_branch)
-        args.output = f"{safe_source}-to-{safe_target}-diff.xlsx"
+        args.output = default_output_file(source_branch, target_branches)
 
-    print(f"🔍 分析分支差异: {target_branch}..{source_branch}")
-    print(f"📁 输出文件: {args.output}")
-    print(f"🧵 并行线程: {args.jobs}")
+    try:
+        formats = report_formats.parse_formats(args.format)
+    except ValueError as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
 
-    # 1. 找到公共祖先（除非禁用）
-    merge_base = None
-    if not args.no_merge_base:
-        merge_base = find_merge_base(target_branch, source_branch)
+    check_option_conflicts(target_branches, args)
 
-    # 2. 获取源分支相对于公共祖先的提交差异
-    if merge_base and not args.no_merge_base:
-        commits_cmd = f'git log --pretty=format:"%h|%an|%ad|%s" --date=short --no-merges {merge_base}..{source_branch}'
-        print(f"只分析公共祖先 {merge_base[:8]} 之后的提交")
+    if multi_target:
+        print(f"🔍 分析分支差异: {source_branch} 对比 {len(target_branches)} 个目标分支（{target_branch}）")
     else:
-        commits_cmd = f'git log --pretty=format:"%h|%an|%ad|%s" --date=short --no-merges {target_branch}..{source_branch}'
-        print("分析全部差异提交")
-
-    commits = run_git_command(commits_cmd)
-
-    if not commits:
-        print("✅ 没有找到提交差异，两个分支内容相同")
-        return
-
-    # 解析提交信息
-    parsed_commits = []
-    for commit in commits:
-        if commit.strip():
-            commit_info = parse_commit_info(commit)
-            if commit_info:
-                parsed_commits.append(commit_info)
-
-    total_commits = len(parsed_commits)
-    print(f"📊 找到 {total_commits} 个提交需要分析")
-
-    if total_commits == 0:
-        print("✅ 没有需要分析的提交")
-        return
-
-    # 3. 构建目标分支的patch-id索引
-    target_patch_index = build_target_branch_patch_index(target_branch, merge_base)
-
-    # 4. 并行过滤独有补丁（使用预构建的索引）
-    print(f"\n🔍 开始并行检查 {total_commits} 个提交的独有性...")
-
-    # 使用并行版本
-    unique_commits, equivalent_count = check_unique_commits_parallel(
-        parsed_commits, target_patch_index, args.jobs
-    )
-
-    print(f"\n📈 过滤结果:")
-    print(f"  总提交数: {total_commits}")
-    print(f"  等价提交: {equivalent_count}")
-    print(f"  独有补丁: {len(unique_commits)}")
-
-    if not unique_commits:
-        print("✅ 没有找到独有补丁，所有提交都有等价版本")
-        return
-
-    # 5. 并行分类和分析独有补丁
-    print(f"\n📝 开始并行分析 {len(unique_commits)} 个独有补丁...")
-
-    # 使用并行版本
-    analysis_data = analyze_commits_parallel(unique_commits, args.jobs)
+        print(f"🔍 分析分支差异: {target_branch}..{source_branch}")
+    print(f"📁 输出文件: {args.output}")
+    print(f"🧵 git并发进程: {args.jobs}")
 
-    # 创建DataFrame
-    print("📊 创建数据表...")
-    df = pd.DataFrame(analysis_data)
+    if not args.no_cache:
+        init_patch_id_store(args.cache_dir, args.cache_max_entries, args.shared_cache)
 
-    # 按分类统计
-    category_stats = df['分类'].value_counts()
-    type_stats = df['类型'].value_counts()
+    if args.rules:
+        set_rules_file(args.rules)
 
-    # 准备要写入Excel的数据字典
-    excel_data = {
-        '独有补丁详情': df,
-        '分类统计': pd.DataFrame({
-            '分类': category_stats.index,
-            '数量': category_stats.values
-        }),
-        '类型统计': pd.DataFrame({
-            '类型': type_stats.index,
-            '数量': type_stats.values
-        })
-    }
+    try:
+        scope = analysis_scope.build_scope(args.path, args.category, get_classifier())
+    except ValueError as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
 
-    # 添加各分类的专门分析
-    for category in category_stats.index:
-        category_df = df[df['分类'] == category]
-        if not category_df.empty:
-            sheet_name = f'{category}独有补丁'
-            # Excel工作表名称长度限制
-            if len(sheet_name) > 31:
-                sheet_name = sheet_name[:28] + '...'
-            excel_data[sheet_name] = category_df
+    state_file = args.state_file
+    if args.incremental and not state_file:
+        state_file = default_state_file(source_branch, target_branch, args.output)
 
-    # 创建格式化的Excel文件
-    print(f"📄 生成格式化的 {args.output} 文件...")
+    profiler = run_metrics.Profiler(args.profile, args.profile_format).start() if args.profile else None
     try:
-        create_formatted_excel(args.output, excel_data)
-
-        print(f"\n🎉 分析完成！")
-        print(f"📊 分支对比: {source_branch} vs {target_branch}")
-        if merge_base:
-            print(f"🔗 公共祖先: {merge_base}")
-        print(f"📈 总提交数: {total_commits}")
-        print(f"🔄 等价提交: {equivalent_count}")
-        print(f"⭐ 独有补丁: {len(unique_commits)}")
-        print(f"💾 缓存命中: {len(patch_id_cache)} 个patch-id")
-        print(f"🧵 使用线程: {args.jobs}")
-        print(f"📁 输出文件: {args.output}")
-        print("\n📊 独有补丁分类统计:")
-        for category, count in category_stats.items():
-            print(f"  {category}: {count} 个补丁")
-        print("\n📋 独有补丁类型统计:")
-        for patch_type, count in type_stats.items():
-            print(f"  {patch_type}: {count} 个补丁")
-
-    except Exception as e:
-        print(f"❌ 生成Excel文件时出错: {e}")
-        csv_file = args.output.replace('.xlsx', '.csv')
-        print(f"尝试保存为CSV格式: {csv_file}")
-        df.to_csv(csv_file, index=False, encoding='utf-8-sig')
-        print(f"✅ 已保存为CSV文件: {csv_file}")
+        if multi_target:
+            run_multi_target_analysis(source_branch, target_branches, args.output, args.jobs,
+                                      not args.no_merge_base, not args.no_upstream_match, args.excel_engine,
+                                      args.compact_category_sheets, not args.no_maintainers, formats, scope)
+        else:
+            run_analysis(source_branch, target_branch, args.output, args.jobs, not args.no_merge_base,
+                         not args.no_upstream_match, args.fuzzy_threshold if args.fuzzy else None,
+                         args.excel_engine, args.compact_category_sheets, not args.no_maintainers, formats,
+                         state_file, args.low_memory, max(1, args.chunk_size), scope)
+    finally:
+        if profiler:
+            profiler.stop()
+
+    metrics = run_metrics.snapshot()
+    run_metrics.print_summary(metrics)
+    labels = {'source': source_branch, 'target': target_branch}
+    if args.metrics_json:
+        run_metrics.write_json(args.metrics_json, metrics, labels)
+        print(f"📈 性能指标: {args.metrics_json}")
+    if args.metrics_prom:
+        run_metrics.write_prometheus(args.metrics_prom, metrics, labels)
+        print(f"📈 Prometheus指标: {args.metrics_prom}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻的Git对象访问层
+
+每个工作线程持有自己的长期运行的 `git cat-file --batch`、
+`git cat-file --batch-check` 进程，
+提交头、提交消息、树和blob的读取都通过这些进程完成，避免每次查询都
+付出fork/exec和shell的开销。安装了pygit2时直接在进程内读取对象。
+"""
+
+import atexit
+import os
+import subprocess
+import threading
+
+import run_metrics
+
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+_local = threading.local()
+_all_processes = []
+_processes_lock = threading.Lock()
+_use_pygit2 = pygit2 is not None
+
+class _BatchProcess:
+    """一个常驻的git批处理子进程，按行写入请求、读取响应"""
+
+    def __init__(self, args):
+        self.proc = subprocess.Popen(
+            ['git'] + args,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        with _processes_lock:
+            _all_processes.append(self)
+        run_metrics.add('git.processes')
+
+    def request(self, line):
+        self.proc.stdin.write(line.encode() + b'\n')
+        self.proc.stdin.flush()
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except Exception:
+                self.proc.kill()
+
+def _thread_process(name, args):
+    """获取当前线程的某个常驻进程，不存在或已退出时重新启动"""
+    process = getattr(_local, name, None)
+    if process is None or process.proc.poll() is not None:
+        process = _BatchProcess(args)
+        setattr(_local, name, process)
+    return process
+
+def _thread_repository():
+    """获取当前线程的pygit2仓库对象"""
+    global _use_pygit2
+    repo = getattr(_local, 'repo', None)
+    if repo is None:
+        try:
+            repo = pygit2.Repository(pygit2.discover_repository(os.getcwd()))
+        except Exception:
+            # 无法打开仓库时回退到cat-file进程
+            _use_pygit2 = False
+            return None
+        _local.repo = repo
+    return repo
+
+def disable_pygit2():
+    """强制使用cat-file进程（用于对比测试或规避pygit2问题）"""
+    global _use_pygit2
+    _use_pygit2 = False
+
+@atexit.register
+def close_all():
+    """关闭所有线程创建的常驻进程"""
+    with _processes_lock:
+        processes = list(_all_processes)
+        _all_processes.clear()
+    for process in processes:
+        process.close()
+
+def object_info(rev):
+    """查询对象信息，返回 (sha, 类型, 大小)，对象不存在时返回None"""
+    if _use_pygit2 and _thread_repository() is not None:
+        try:
+            obj = _thread_repository().revparse_single(rev)
+        except (KeyError, ValueError, pygit2.GitError):
+            return None
+        return str(obj.id), obj.type_str, len(obj.read_raw())
+
+    if '\n' in rev:
+        return None
+    process = _thread_process('batch_check', ['cat-file', '--batch-check'])
+    process.request(rev)
+    header = process.proc.stdout.readline().decode().split()
+    if len(header) != 3:
+        return None
+    return header[0], header[1], int(header[2])
+
+def read_object(rev):
+    """读取对象内容，返回 (sha, 类型, 原始字节)，对象不存在时返回None"""
+    if _use_pygit2 and _thread_repository() is not None:
+        try:
+            obj = _thread_repository().revparse_single(rev)
+        except (KeyError, ValueError, pygit2.GitError):
+            return None
+        return str(obj.id), obj.type_str, obj.read_raw()
+
+    if '\n' in rev:
+        return None
+    process = _thread_process('batch', ['cat-file', '--batch'])
+    process.request(rev)
+    header = process.proc.stdout.readline().decode().split()
+    if len(header) != 3:
+        # "<rev> missing" 或 "<rev> ambiguous"
+        return None
+    sha, obj_type, size = header[0], header[1], int(header[2])
+    data = process.proc.stdout.read(size)
+    process.proc.stdout.read(1)  # 内容后的换行
+    run_metrics.add('git.bytes_read', size)
+    return sha, obj_type, data
+
+def resolve(rev):
+    """把分支、标签或提交表达式解析为完整SHA，不存在时返回None"""
+    info = object_info(rev)
+    return info[0] if info else None
+
+def read_commit(rev):
+    """读取提交对象，返回包含tree、parents、author、committer和message的字典"""
+    obj = read_object(f'{rev}^{{commit}}')
+    if obj is None:
+        return None
+    sha, _, data = obj
+
+    header_bytes, _, message_bytes = data.partition(b'\n\n')
+    commit = {'sha': sha, 'tree': None, 'parents': [], 'author': '', 'committer': '',
+              'encoding': 'utf-8'}
+    for line in header_bytes.split(b'\n'):
+        key, _, value = line.partition(b' ')
+        if key == b'tree':
+            commit['tree'] = value.decode()
+        elif key == b'parent':
+            commit['parents'].append(value.decode())
+        elif key in (b'author', b'committer', b'encoding'):
+            commit[key.decode()] = value.decode('utf-8', errors='replace')
+
+    try:
+        commit['message'] = message_bytes.decode(commit['encoding'], errors='replace')
+    except LookupError:
+        commit['message'] = message_bytes.decode('utf-8', errors='replace')
+    return commit
+
+def read_tree(rev):
+    """读取树对象，返回 [(模式, 类型, sha, 名称)]"""
+    obj = read_object(f'{rev}^{{tree}}')
+    if obj is None:
+        return None
+    data = obj[2]
+
+    entries = []
+    pos = 0
+    while pos < len(data):
+        space = data.index(b' ', pos)
+        nul = data.index(b'\0', space)
+        mode = data[pos:space].decode()
+        name = data[space + 1:nul].decode('utf-8', errors='surrogateescape')
+        sha = data[nul + 1:nul + 21].hex()
+        entry_type = 'tree' if mode == '40000' else ('commit' if mode == '160000' else 'blob')
+        entries.append((mode, entry_type, sha, name))
+        pos = nul + 21
+    return entries
+
+def read_blob(rev):
+    """读取blob内容（字节），不存在时返回None"""
+    obj = read_object(rev)
+    if obj is None or obj[1] != 'blob':
+        return None
+    return obj[2]
+
+def list_refs(prefix='refs/tags/'):
+    """列出指定前缀下的引用名（不含前缀）"""
+    if _use_pygit2 and _thread_repository() is not None:
+        return sorted(ref[len(prefix):] for ref in _thread_repository().references if ref.startswith(prefix))
+
+    git_dir = _git_common_dir()
+    if git_dir is None or os.path.isdir(os.path.join(git_dir, 'reftable')):
+        # reftable格式无法直接读取文件，回退到for-each-ref
+        result = subprocess.run(['git', 'for-each-ref', '--format=%(refname)', prefix],
+                                capture_output=True, text=True)
+        return [line[len(prefix):] for line in result.stdout.splitlines() if line.startswith(prefix)]
+
+    # 直接读取packed-refs和松散引用，不启动任何进程
+    names = set()
+    packed_refs = os.path.join(git_dir, 'packed-refs')
+    if os.path.exists(packed_refs):
+        with open(packed_refs, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if line.startswith(('#', '^')):
+                    continue
+                parts = line.rstrip('\n').split(' ', 1)
+                if len(parts) == 2 and parts[1].startswith(prefix):
+                    names.add(parts[1][len(prefix):])
+
+    loose_root = os.path.join(git_dir, prefix)
+    for dirpath, _, filenames in os.walk(loose_root):
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            names.add(os.path.relpath(full_path, loose_root).replace(os.sep, '/'))
+
+    return sorted(names)
+
+_git_common_dir_cache = {}
+
+def _git_common_dir():
+    """当前工作目录所在仓库的公共git目录"""
+    cwd = os.getcwd()
+    if cwd not in _git_common_dir_cache:
+        result = subprocess.run(['git', 'rev-parse', '--git-common-dir'],
+                                capture_output=True, text=True)
+        path = result.stdout.strip() if result.returncode == 0 else ''
+        _git_common_dir_cache[cwd] = os.path.abspath(path) if path else None
+    return _git_common_dir_cache[cwd]
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享并发预算的git子进程执行器
+
+各阶段的批量git命令（patch-id流水线、提交消息和文件统计、diff签名）都提交到
+同一个在后台线程中运行的asyncio事件循环，由一个全局预算限制同时运行的git进程数：
+管道连接的每个进程各占一个名额，-j 因此表示整个分析同时运行的git进程总数。
+调用方拿到 concurrent.futures.Future，可以在任意线程中等待；输出的解析、分类等
+CPU密集的工作在调用方线程中完成，不占用事件循环。
+
+merge-base、rev-list 这类只在开始时串行执行一次的命令不经过执行器。
+
+每个进程的标准错误都被收集，任何一个进程以非零状态退出（对象缺失、fork失败、
+被信号杀死）时 Future 抛出 GitCommandError，调用方据此区分“没有输出”和“执行失败”。
+"""
+
+import asyncio
+import atexit
+import os
+import signal
+import subprocess
+import threading
+
+import run_metrics
+
+# 超过这个数量后对象库的锁争用和内存带宽成为瓶颈，再增加进程也不会提高吞吐
+MAX_DEFAULT_JOBS = 32
+
+_executor = None
+_executor_lock = threading.Lock()
+
+class GitCommandError(subprocess.CalledProcessError):
+    """git命令或流水线中的某个进程以非零状态退出"""
+
+    def __str__(self):
+        stderr = (self.stderr or b'').decode('utf-8', errors='replace').strip()
+        message = f"git {' '.join(self.cmd)} 退出状态 {self.returncode}"
+        return f"{message}: {stderr}" if stderr else message
+
+def default_jobs():
+    """默认的git并发进程数
+
+    生成diff和计算patch-id主要消耗CPU，冷缓存时读取对象还要等待磁盘，
+    因此在CPU核数的基础上多留四分之一的进程来填补I/O等待。
+    """
+    cpus = os.cpu_count() or 4
+    return max(2, min(MAX_DEFAULT_JOBS, cpus + cpus // 4))
+
+class GitExecutor:
+    """在后台事件循环中运行git命令，同时运行的进程数不超过 jobs"""
+
+    def __init__(self, jobs=None):
+        self.jobs = max(1, jobs or default_jobs())
+        # 累计启动的进程数和同时运行的最大进程数
+        self.spawned = 0
+        self.peak = 0
+        self._available = self.jobs
+        self._loop = asyncio.new_event_loop()
+        self._condition = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name='git-executor', daemon=True)
+        self._thread.start()
+
+    def _budget(self):
+        # asyncio同步原语需在事件循环中创建
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def _acquire(self, count):
+        condition = self._budget()
+        async with condition:
+            await condition.wait_for(lambda: self._available >= count)
+            self._available -= count
+            self.peak = max(self.peak, self.jobs - self._available)
+            run_metrics.observe_max('git.concurrent', self.jobs - self._available)
+
+    async def _release(self, count):
+        condition = self._budget()
+        async with condition:
+            self._available += count
+            condition.notify_all()
+
+    async def _resize(self, jobs):
+        condition = self._budget()
+        async with condition:
+            self._available += jobs - self.jobs
+            self.jobs = jobs
+            condition.notify_all()
+
+    async def _spawn(self, commands):
+        """启动用管道依次连接的进程，返回进程列表"""
+        processes = []
+        upstream = None
+        try:
+            for index, args in enumerate(commands):
+                last = index == len(commands) - 1
+                read_fd, write_fd = (None, None) if last else os.pipe()
+                try:
+                    proc = await asyncio.create_subprocess_exec(
+                        'git', *args,
+                        stdin=asyncio.subprocess.PIPE if upstream is None else upstream,
+                        stdout=asyncio.subprocess.PIPE if last else write_fd,
+                        stderr=asyncio.subprocess.PIPE
+                    )
+                finally:
+                    # 管道两端已由子进程继承，父进程关闭自己的副本，上游退出时下游才能收到EOF
+                    if upstream is not None:
+                        os.close(upstream)
+                    upstream = None
+                    if write_fd is not None:
+                        os.close(write_fd)
+                upstream = read_fd
+                read_fd = None
+                processes.append(proc)
+                self.spawned += 1
+                run_metrics.add('git.processes')
+        except BaseException:
+            if read_fd is not None:
+                os.close(read_fd)
+            for proc in processes:
+                if proc.returncode is None:
+                    proc.kill()
+                await proc.wait()
+            raise
+        return processes
+
+    async def _run(self, commands, input_data):
+        # 预算小于流水线长度时按整个预算计，避免永远等不到足够的名额
+        count = min(len(commands), self.jobs)
+        await self._acquire(count)
+        processes = []
+        try:
+            processes = await self._spawn(commands)
+
+            async def feed():
+                stdin = processes[0].stdin
+                try:
+                    if input_data:
+                        stdin.write(input_data)
+                        await stdin.drain()
+                    stdin.close()
+                    await stdin.wait_closed()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            _, output, *errors = await asyncio.gather(
+                feed(), processes[-1].stdout.read(), *(proc.stderr.read() for proc in processes)
+            )
+            for proc in processes:
+                await proc.wait()
+            run_metrics.add('git.bytes_written', len(input_data))
+            run_metrics.add('git.bytes_read', len(output))
+            failed = [(args, proc.returncode, stderr)
+                      for args, proc, stderr in zip(commands, processes, errors) if proc.returncode != 0]
+            if failed:
+                # 下游进程失败时上游会因SIGPIPE退出，优先报告真正出错的进程
+                failed.sort(key=lambda item: item[1] == -signal.SIGPIPE)
+                args, returncode, stderr = failed[0]
+                raise GitCommandError(returncode, args, output, stderr)
+            return output
+        finally:
+            for proc in processes:
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+            await self._release(count)
+
+    def submit(self, commands, input_data=b''):
+        """提交一条git命令或流水线，返回Future，结果为最后一个进程的标准输出（字节）
+
+        commands 是git参数列表（不含 'git'）的列表，多个命令依次用管道连接；
+        input_data 写入第一个进程的标准输入。任一进程失败时 Future 抛出 GitCommandError。
+        """
+        return asyncio.run_coroutine_threadsafe(self._run(commands, input_data), self._loop)
+
+    def run(self, commands, input_data=b''):
+        """执行git命令或流水线并等待其完成，返回标准输出（字节）"""
+        return self.submit(commands, input_data).result()
+
+    def resize(self, jobs):
+        """修改并发预算，正在运行的进程不受影响"""
+        jobs = max(1, jobs)
+        if jobs != self.jobs:
+            asyncio.run_coroutine_threadsafe(self._resize(jobs), self._loop).result()
+
+    def close(self):
+        if self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+def configure(jobs=None):
+    """设置全局git并发预算并返回执行器，jobs为空时使用默认值"""
+    global _executor
+    jobs = max(1, jobs or default_jobs())
+    with _executor_lock:
+        if _executor is None:
+            _executor = GitExecutor(jobs)
+            atexit.register(_executor.close)
+        else:
+            _executor.resize(jobs)
+        return _executor
+
+def get_executor():
+    """全局执行器，尚未配置时按默认并发数创建"""
+    if _executor is None:
+        return configure()
+    return _executor
+
+def submit(commands, input_data=b''):
+    return get_executor().submit(commands, input_data)
+
+def run(commands, input_data=b''):
+    return get_executor().run(commands, input_data)
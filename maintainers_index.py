@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于内核 MAINTAINERS 文件的子系统分类
+
+解析指定版本中的 MAINTAINERS，把各小节的 F:/X: 文件模式按路径分量放进前缀树：
+不含通配符的模式挂在对应目录/文件节点上，含通配符的模式挂在其最长字面前缀节点上，
+查询时只沿路径走一遍，检查途经节点上的条目，耗时与路径深度成正比。
+N: 正则模式无法按前缀索引，先用合并后的正则快速排除再逐个检查。
+
+索引按 MAINTAINERS 的blob SHA缓存为JSON文件，同一版本再次分析时直接加载。
+"""
+
+import json
+import os
+import re
+
+import git_backend
+
+MAINTAINERS_FILE = 'MAINTAINERS'
+# 匹配全部文件的兜底小节，只在没有其他小节匹配时保留
+FALLBACK_SPECIFICITY = 0
+INDEX_FORMAT_VERSION = 1
+
+_FIELD = re.compile(r'^([A-Z]):\s*(.*?)\s*$')
+_WILDCARDS = set('*?[')
+
+# 进程内已加载的索引，按blob SHA复用（链式模式下相邻版本的MAINTAINERS经常相同）
+_loaded_indexes = {}
+
+def parse_maintainers(text):
+    """解析MAINTAINERS文本，返回小节列表
+
+    每个小节是包含 name、status、maintainers、files、excludes、regexes 的字典。
+    文件开头的说明文字（缩进行）不会被当作字段。
+    """
+    sections = []
+    current = None
+    for line in text.splitlines():
+        if not line.strip():
+            current = None
+            continue
+
+        match = _FIELD.match(line)
+        if match is None:
+            # 非字段行：空行之后的第一行是新小节的标题
+            if current is None and not line[0].isspace():
+                current = {'name': line.strip(), 'status': '', 'maintainers': [],
+                           'files': [], 'excludes': [], 'regexes': []}
+                sections.append(current)
+            continue
+
+        if current is None:
+            continue
+        field, value = match.groups()
+        if field == 'M':
+            current['maintainers'].append(value)
+        elif field == 'S':
+            current['status'] = value
+        elif field == 'F':
+            current['files'].append(value)
+        elif field == 'X':
+            current['excludes'].append(value)
+        elif field == 'N':
+            current['regexes'].append(value)
+
+    # 只有标题没有任何字段的块不是小节（例如文件开头的分隔标题）
+    return [s for s in sections if s['maintainers'] or s['files'] or s['regexes'] or s['status']]
+
+def _new_node():
+    return {'sub': {}}
+
+def _glob_to_regex(pattern):
+    """按 get_maintainer.pl 的规则把文件模式转换为正则：* 匹配任意字符，? 匹配单个字符"""
+    parts = []
+    for char in pattern:
+        if char == '*':
+            parts.append('.*')
+        elif char == '?':
+            parts.append('.')
+        elif char in '[]':
+            parts.append(char)
+        else:
+            parts.append(re.escape(char))
+    return ''.join(parts)
+
+def _add_pattern(root, pattern, section_id):
+    """把一个 F:/X: 模式加入前缀树"""
+    pattern = pattern.strip()
+    if pattern.startswith('./'):
+        pattern = pattern[2:]
+    if not pattern:
+        return
+
+    # 特异度为模式中的字面字符数，* 和 */ 这类兜底模式为0
+    specificity = sum(1 for char in pattern if char not in _WILDCARDS and char != '/')
+    components = pattern.rstrip('/').split('/')
+
+    if not any(char in _WILDCARDS for char in pattern):
+        node = root
+        for component in components:
+            node = node['sub'].setdefault(component, _new_node())
+        # 不以/结尾的模式既可能是文件也可能是目录
+        node.setdefault('dir', []).append([section_id, specificity])
+        if not pattern.endswith('/'):
+            node.setdefault('file', []).append([section_id, specificity])
+        return
+
+    node = root
+    for component in components:
+        if any(char in _WILDCARDS for char in component):
+            break
+        node = node['sub'].setdefault(component, _new_node())
+    # 以/结尾的模式匹配其下任意深度的文件，否则只匹配与模式同一深度的文件
+    depth = -1 if pattern.endswith('/') else pattern.count('/')
+    node.setdefault('glob', []).append([_glob_to_regex(pattern), depth, section_id, specificity])
+
+class MaintainersIndex:
+    """MAINTAINERS 路径索引：查询文件所属的子系统和维护者"""
+
+    def __init__(self, sections, file_trie=None, exclude_trie=None):
+        self.sections = sections
+        if file_trie is None or exclude_trie is None:
+            file_trie, exclude_trie = _new_node(), _new_node()
+            for section_id, section in enumerate(sections):
+                for pattern in section['files']:
+                    _add_pattern(file_trie, pattern, section_id)
+                for pattern in section['excludes']:
+                    _add_pattern(exclude_trie, pattern, section_id)
+        self.file_trie = file_trie
+        self.exclude_trie = exclude_trie
+
+        self._regexes = []
+        for section_id, section in enumerate(sections):
+            for pattern in section['regexes']:
+                try:
+                    # get_maintainer.pl 使用 /x 修饰符匹配 N: 模式
+                    self._regexes.append((re.compile(pattern, re.VERBOSE), section_id, len(pattern)))
+                except re.error:
+                    continue
+        self._any_regex = None
+        if self._regexes:
+            self._any_regex = re.compile('|'.join(f'(?:{r.pattern})' for r, _, _ in self._regexes), re.VERBOSE)
+
+        self._compiled_globs = {}
+        self._memo = {}
+
+    def _glob(self, source):
+        compiled = self._compiled_globs.get(source)
+        if compiled is None:
+            compiled = self._compiled_globs[source] = re.compile(source)
+        return compiled
+
+    def _walk(self, root, path):
+        """沿路径遍历前缀树，返回 {小节: 最高特异度}"""
+        matched = {}
+
+        def hit(section_id, specificity):
+            if matched.get(section_id, -1) < specificity:
+                matched[section_id] = specificity
+
+        components = path.split('/')
+        depth = len(components) - 1
+        node = root
+        for index, component in enumerate(components):
+            for source, glob_depth, section_id, specificity in node.get('glob', ()):
+                if (glob_depth < 0 or glob_depth == depth) and self._glob(source).match(path):
+                    hit(section_id, specificity)
+            node = node['sub'].get(component)
+            if node is None:
+                break
+            entries = node.get('file', ()) if index == depth else node.get('dir', ())
+            for section_id, specificity in entries:
+                hit(section_id, specificity)
+        return matched
+
+    def lookup(self, path):
+        """返回路径所属的 {小节编号: 特异度}（已去掉被 X: 排除的小节）"""
+        cached = self._memo.get(path)
+        if cached is not None:
+            return cached
+
+        matched = self._walk(self.file_trie, path)
+        if self._any_regex is not None and self._any_regex.search(path):
+            for regex, section_id, specificity in self._regexes:
+                if regex.search(path) and matched.get(section_id, -1) < specificity:
+                    matched[section_id] = specificity
+        if matched:
+            for section_id in self._walk(self.exclude_trie, path):
+                matched.pop(section_id, None)
+
+        # 内核路径大量重复，缓存查询结果；限制大小避免无限增长
+        if len(self._memo) < 1000000:
+            self._memo[path] = matched
+        return matched
+
+    def classify(self, files):
+        """返回修改文件列表对应的 (子系统列表, 维护者列表)，按匹配特异度从高到低排序"""
+        matched = {}
+        for path in files:
+            for section_id, specificity in self.lookup(path).items():
+                if matched.get(section_id, -1) < specificity:
+                    matched[section_id] = specificity
+
+        if any(specificity > FALLBACK_SPECIFICITY for specificity in matched.values()):
+            matched = {s: spec for s, spec in matched.items() if spec > FALLBACK_SPECIFICITY}
+
+        ordered = sorted(matched, key=lambda s: (-matched[s], s))
+        subsystems = [self.sections[s]['name'] for s in ordered]
+        maintainers = []
+        seen = set()
+        for section_id in ordered:
+            for maintainer in self.sections[section_id]['maintainers']:
+                if maintainer not in seen:
+                    seen.add(maintainer)
+                    maintainers.append(maintainer)
+        return subsystems, maintainers
+
+    def to_json(self):
+        return {'version': INDEX_FORMAT_VERSION, 'sections': self.sections,
+                'file_trie': self.file_trie, 'exclude_trie': self.exclude_trie}
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get('version') != INDEX_FORMAT_VERSION:
+            return None
+        return cls(data['sections'], data['file_trie'], data['exclude_trie'])
+
+def load_index(revision, cache_dir=None):
+    """加载指定版本的MAINTAINERS索引，版本中没有MAINTAINERS时返回None
+
+    cache_dir 不为空时按blob SHA读写JSON缓存。
+    """
+    blob_sha = git_backend.resolve(f'{revision}:{MAINTAINERS_FILE}')
+    if blob_sha is None:
+        return None
+    if blob_sha in _loaded_indexes:
+        return _loaded_indexes[blob_sha]
+
+    cache_file = os.path.join(cache_dir, f'maintainers-{blob_sha}.json') if cache_dir else None
+    index = None
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                index = MaintainersIndex.from_json(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"警告: 无法读取MAINTAINERS索引缓存 {cache_file}: {e}")
+
+    if index is None:
+        data = git_backend.read_blob(blob_sha)
+        if data is None:
+            return None
+        index = MaintainersIndex(parse_maintainers(data.decode('utf-8', errors='replace')))
+        if cache_file:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                temp_file = f'{cache_file}.{os.getpid()}.tmp'
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(index.to_json(), f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(temp_file, cache_file)
+            except OSError as e:
+                print(f"警告: 无法写入MAINTAINERS索引缓存 {cache_file}: {e}")
+
+    _loaded_indexes[blob_sha] = index
+    return index
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+patch-id 反向索引：回答“某个补丁最早出现在哪个标签里”
+
+按版本顺序遍历所有标签，每个提交记在第一个能到达它的标签下，再把
+(patch-id, 提交SHA, 标签编号) 以44字节定长记录按patch-id排序写入二进制文件。
+查询时对内存映射的文件做二分查找，耗时 O(log n)，无需为每个问题重新运行完整分析。
+
+新标签抓取后再次运行 update 只处理新标签带来的提交，并与已有文件归并；标签移动、
+额外分支非快进，或新标签排在已索引的标签之前且其提交已记在更晚的标签下时重新构建。
+
+使用示例:
+  python3 patch_id_index.py update
+  python3 patch_id_index.py update --ref openkylin-6.6-next
+  python3 patch_id_index.py lookup <提交SHA>
+  python3 patch_id_index.py lookup --patch-file fix.patch --in v6.6.30
+"""
+
+import argparse
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import subprocess
+import sys
+import time
+
+import git_backend
+import git_executor
+from compare_adjacent_versions import get_all_tags
+from patch_id_store import default_cache_dir
+
+INDEX_FORMAT_VERSION = 1
+INDEX_DIR_NAME = 'patch-id-index'
+DATA_FILE_NAME = 'patch_id_index.bin'
+META_FILE_NAME = 'patch_id_index.json'
+# 记录格式：patch-id(20字节) + 提交SHA(20字节) + 标签编号(uint32，大端)
+RECORD = struct.Struct('>20s20sI')
+RECORD_SIZE = RECORD.size
+BATCH_SIZE = 20000
+
+_TAG_VERSION = re.compile(r'^v?(\d+(?:\.\d+)*)(?:-rc(\d+))?$')
+
+def tag_sort_key(tag):
+    """标签的版本排序键：v6.7-rc1 < v6.7 < v6.7.1，无法解析的标签排在最后"""
+    match = _TAG_VERSION.match(tag)
+    if not match:
+        return (1, (), 0, 0, tag)
+    release = tuple(int(part) for part in match.group(1).split('.'))
+    release = release + (0,) * (3 - len(release))
+    if match.group(2) is not None:
+        return (0, release, 0, int(match.group(2)), tag)
+    return (0, release, 1, 0, tag)
+
+def default_index_dir():
+    """默认索引目录（与持久化patch-id缓存放在一起）"""
+    cache_dir = default_cache_dir()
+    return os.path.join(cache_dir, INDEX_DIR_NAME) if cache_dir else None
+
+class PatchIdIndex:
+    """内存映射的patch-id反向索引（只读）"""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.meta = load_meta(index_dir)
+        self.labels = self.meta['labels'] if self.meta else []
+        self._file = None
+        self._mmap = None
+        self.count = 0
+
+        data_path = os.path.join(index_dir, DATA_FILE_NAME)
+        if self.meta and os.path.exists(data_path) and os.path.getsize(data_path) > 0:
+            self._file = open(data_path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.count = len(self._mmap) // RECORD_SIZE
+
+    def _patch_id_at(self, position):
+        offset = position * RECORD_SIZE
+        return self._mmap[offset:offset + 20]
+
+    def lookup(self, patch_id):
+        """返回携带该patch-id的 [(提交SHA, 标签)]，按标签版本顺序排列"""
+        if self._mmap is None:
+            return []
+        key = bytes.fromhex(patch_id)
+
+        # 二分查找第一条 patch-id >= key 的记录
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._patch_id_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        results = []
+        position = low
+        while position < self.count and self._patch_id_at(position) == key:
+            _, commit, label = RECORD.unpack_from(self._mmap, position * RECORD_SIZE)
+            results.append((commit.hex(), self.labels[label]))
+            position += 1
+        results.sort(key=lambda item: tag_sort_key(item[1]))
+        return results
+
+    def iter_records(self):
+        """按顺序遍历全部原始记录（归并更新时使用）"""
+        if self._mmap is None:
+            return
+        for position in range(self.count):
+            offset = position * RECORD_SIZE
+            yield self._mmap[offset:offset + RECORD_SIZE]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+            self._file = None
+
+def load_meta(index_dir):
+    """读取索引元数据，不存在或格式不兼容时返回None"""
+    meta_path = os.path.join(index_dir, META_FILE_NAME)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  无法读取索引元数据 {meta_path}: {e}")
+        return None
+    if meta.get('version') != INDEX_FORMAT_VERSION:
+        return None
+    return meta
+
+def _list_new_commits(tip, excluded_tips):
+    """列出从tip可达、但从任何已处理的位置都不可达的非合并提交"""
+    stdin = ''.join([f'{tip}\n'] + [f'^{sha}\n' for sha in excluded_tips])
+    result = subprocess.run(['git', 'rev-list', '--no-merges', '--stdin'],
+                            input=stdin, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git rev-list 失败: {result.stderr.strip()}")
+    return result.stdout.split()
+
+def _count_new_commits(tip, excluded_tips):
+    """统计从tip可达、但从excluded_tips都不可达的非合并提交数"""
+    stdin = ''.join([f'{tip}\n'] + [f'^{sha}\n' for sha in excluded_tips])
+    result = subprocess.run(['git', 'rev-list', '--count', '--no-merges', '--stdin'],
+                            input=stdin, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git rev-list 失败: {result.stderr.strip()}")
+    return int(result.stdout)
+
+def _tags_claimed_by_later_labels(tags, tips, meta, boundary_tips):
+    """找出新抓取的标签中，有提交已被记在更晚的标签或额外分支下的标签
+
+    每个提交应记在按版本顺序第一个能到达它的标签下。后抓取的标签如果排在已索引的
+    标签之前，它带来的提交可能已经记在更晚的标签下，增量更新无法纠正这些记录。
+    """
+    position = {tag: i for i, tag in enumerate(tags)}
+    claimed = []
+    for i, tag in enumerate(tags):
+        if tag in meta['tips'] or tag not in tips:
+            continue
+        # 不在当前标签列表中的引用是额外分支，排在所有标签之后
+        later = [sha for ref, sha in meta['tips'].items() if position.get(ref, len(tags)) > i]
+        if not later:
+            continue
+        earlier = boundary_tips + [tips[t] for t in tags[:i] if t in tips]
+        if _count_new_commits(tips[tag], earlier) != _count_new_commits(tips[tag], earlier + later):
+            claimed.append(tag)
+    return claimed
+
+def _compute_records(analysis, commits, label):
+    """计算一批提交的patch-id，返回索引记录（字节串）列表"""
+    records = []
+    for start in range(0, len(commits), BATCH_SIZE):
+        batch = commits[start:start + BATCH_SIZE]
+        patch_ids = analysis.get_patch_ids_batch(batch)
+        # 结果已写入持久化缓存，清空进程内缓存，避免遍历整个历史时内存无限增长
+        with analysis.cache_lock:
+            analysis.patch_id_cache.clear()
+        for commit, patch_id in patch_ids.items():
+            if patch_id:
+                records.append(RECORD.pack(bytes.fromhex(patch_id), bytes.fromhex(commit), label))
+    return records
+
+def _write_index(index_dir, meta, old_index, new_records):
+    """把已有记录与新记录归并写入新文件，再原子替换数据文件和元数据"""
+    os.makedirs(index_dir, exist_ok=True)
+    data_path = os.path.join(index_dir, DATA_FILE_NAME)
+    meta_path = os.path.join(index_dir, META_FILE_NAME)
+    temp_data = f'{data_path}.{os.getpid()}.tmp'
+    temp_meta = f'{meta_path}.{os.getpid()}.tmp'
+
+    new_records.sort()
+    existing = old_index.iter_records() if old_index is not None else iter(())
+    count = 0
+    with open(temp_data, 'wb') as f:
+        for record in heapq.merge(existing, new_records):
+            f.write(record)
+            count += 1
+    meta['record_count'] = count
+    with open(temp_meta, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    if old_index is not None:
+        old_index.close()
+    # 先替换数据文件再替换元数据：新元数据只增加标签，旧元数据也能正确解释新数据中的旧记录
+    os.replace(temp_data, data_path)
+    os.replace(temp_meta, meta_path)
+    return count
+
+def update_index(index_dir, extra_refs=(), min_version=None, rebuild=False, jobs=None, cache_dir=None,
+                 no_cache=False):
+    """构建或增量更新索引，返回新增记录数"""
+    # 延迟导入，查询时不需要加载pandas等依赖
+    import generate_patch_analysis as analysis
+
+    if not no_cache:
+        analysis.init_patch_id_store(cache_dir)
+    git_executor.configure(jobs)
+
+    old_index = None if rebuild else PatchIdIndex(index_dir)
+    meta = old_index.meta if old_index is not None and old_index.meta else None
+
+    tags = sorted(get_all_tags(), key=tag_sort_key)
+    boundary = []
+    if min_version:
+        minimum = tag_sort_key(min_version)
+        boundary = [tag for tag in tags if tag_sort_key(tag) <= minimum]
+        tags = [tag for tag in tags if tag_sort_key(tag) > minimum]
+
+    tips = {}
+    for ref in tags + list(extra_refs):
+        sha = git_backend.resolve(f'{ref}^{{commit}}')
+        if sha is None:
+            print(f"⚠️  无法解析 {ref}，已跳过")
+            continue
+        tips[ref] = sha
+
+    boundary_tips = [git_backend.resolve(f'{tag}^{{commit}}') for tag in boundary]
+    boundary_tips = [sha for sha in boundary_tips if sha]
+
+    if meta is not None:
+        moved = [tag for tag in tags if tag in meta['tips'] and meta['tips'][tag] != tips.get(tag)]
+        # 额外分支可以快进，非快进（变基、强推）时旧记录可能已不可达
+        moved += [ref for ref in extra_refs if ref in meta['tips'] and ref in tips
+                  and not is_ancestor(meta['tips'][ref], tips[ref])]
+        if moved or meta.get('min_version') != min_version:
+            print(f"⚠️  引用发生移动或范围变化（{', '.join(moved[:5]) or '--min-version'}），重新构建索引")
+            old_index.close()
+            old_index, meta = None, None
+
+    if meta is not None:
+        claimed = _tags_claimed_by_later_labels(tags, tips, meta, boundary_tips)
+        if claimed:
+            print(f"⚠️  新标签早于已索引的标签（{', '.join(claimed[:5])}），重新构建索引")
+            old_index.close()
+            old_index, meta = None, None
+
+    if meta is None:
+        meta = {'version': INDEX_FORMAT_VERSION, 'min_version': min_version, 'labels': [], 'tips': {}}
+        old_index = None
+
+    excluded_tips = boundary_tips + list(meta['tips'].values())
+
+    pending = [ref for ref in tips if meta['tips'].get(ref) != tips[ref]]
+    if not pending:
+        print("✅ 索引已是最新，没有新的标签")
+        if old_index is not None:
+            old_index.close()
+        return 0
+
+    print(f"🔍 需要处理 {len(pending)} 个新的或已变化的引用")
+    new_records = []
+    for i, ref in enumerate(pending, 1):
+        commits = _list_new_commits(tips[ref], excluded_tips)
+        if ref not in meta['labels']:
+            meta['labels'].append(ref)
+        label = meta['labels'].index(ref)
+        records = _compute_records(analysis, commits, label) if commits else []
+        new_records.extend(records)
+        meta['tips'][ref] = tips[ref]
+        excluded_tips.append(tips[ref])
+        print(f"📥 [{i}/{len(pending)}] {ref}: {len(commits)} 个新提交")
+
+    count = _write_index(index_dir, meta, old_index, new_records)
+    print(f"✅ 索引共 {count} 条记录，新增 {len(new_records)} 条")
+    return len(new_records)
+
+def patch_ids_for_input(value, patch_file=False):
+    """计算提交或补丁文件的patch-id列表（补丁文件可能包含多个补丁）"""
+    if patch_file:
+        with open(value, 'rb') as f:
+            diff = f.read()
+    else:
+        sha = git_backend.resolve(f'{value}^{{commit}}')
+        if sha is None:
+            raise ValueError(f"无法解析提交 '{value}'")
+        diff = subprocess.run(['git', 'show', '--format=', '-p', '--no-color', sha],
+                              capture_output=True, check=True).stdout
+
+    result = subprocess.run(['git', 'patch-id', '--stable'], input=diff, capture_output=True, check=True)
+    return list(dict.fromkeys(line.split()[0] for line in result.stdout.decode().splitlines() if line.strip()))
+
+def is_ancestor(commit, ref):
+    return subprocess.run(['git', 'merge-base', '--is-ancestor', commit, ref],
+                          capture_output=True).returncode == 0
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='patch-id 反向索引：查询补丁最早出现在哪个标签',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""使用示例:
+  %(prog)s update
+  %(prog)s update --min-version v6.6 --ref openkylin-6.6-next
+  %(prog)s lookup <提交SHA>
+  %(prog)s lookup --patch-file fix.patch --in v6.6.30
+        """
+    )
+    parser.add_argument('--index-dir', help='索引目录（默认: .git/patch-analysis-cache/patch-id-index）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = subparsers.add_parser('update', help='构建或增量更新索引')
+    update_parser.add_argument('--ref', action='append', default=[],
+                               help='除标签外额外索引的分支（可重复，如厂商分支）')
+    update_parser.add_argument('--min-version', help='只索引大于该版本的标签带来的提交')
+    update_parser.add_argument('--rebuild', action='store_true', help='丢弃已有索引重新构建')
+    update_parser.add_argument('-j', '--jobs', type=int, default=git_executor.default_jobs(),
+                               help='同时运行的git进程数（默认按CPU核数确定）')
+    update_parser.add_argument('--cache-dir', help='持久化patch-id缓存目录（默认: .git/patch-analysis-cache）')
+    update_parser.add_argument('--no-cache', action='store_true', help='禁用持久化patch-id缓存')
+
+    lookup_parser = subparsers.add_parser('lookup', help='查询提交或补丁文件')
+    lookup_parser.add_argument('value', help='提交SHA/引用，或与 --patch-file 一起使用的补丁文件路径')
+    lookup_parser.add_argument('--patch-file', action='store_true', help='把参数当作补丁文件')
+    lookup_parser.add_argument('--in', dest='in_ref', help='额外检查等价提交是否已包含在该标签或分支中')
+
+    args = parser.parse_args()
+
+    index_dir = args.index_dir or default_index_dir()
+    if not index_dir:
+        print("❌ 错误: 无法确定索引目录，请使用 --index-dir 指定")
+        sys.exit(1)
+
+    if args.command == 'update':
+        start_time = time.time()
+        update_index(index_dir, args.ref, args.min_version, args.rebuild, args.jobs, args.cache_dir,
+                     args.no_cache)
+        print(f"⏱️  耗时 {time.time() - start_time:.1f} 秒")
+        return
+
+    index = PatchIdIndex(index_dir)
+    if index.meta is None:
+        print(f"❌ 错误: 索引不存在，请先运行 update（索引目录: {index_dir}）")
+        sys.exit(1)
+
+    try:
+        patch_ids = patch_ids_for_input(args.value, args.patch_file)
+    except (ValueError, OSError, subprocess.CalledProcessError) as e:
+        print(f"❌ 错误: {e}")
+        sys.exit(1)
+    if not patch_ids:
+        print("❌ 错误: 无法计算patch-id（空提交、合并提交或无效补丁）")
+        sys.exit(1)
+
+    for patch_id in patch_ids:
+        matches = index.lookup(patch_id)
+        print(f"\n🔑 patch-id {patch_id}: {len(matches)} 个等价提交")
+        for commit, label in matches:
+            info = git_backend.read_commit(commit)
+            subject = info['message'].split('\n', 1)[0] if info else ''
+            line = f"  {commit[:12]}  {label:<24} {subject}"
+            if args.in_ref:
+                line += f"  [{'已包含' if is_ancestor(commit, args.in_ref) else '未包含'}于 {args.in_ref}]"
+            print(line)
+        if matches:
+            print(f"🏷️  最早包含该补丁的标签: {matches[0][1]}")
+        if args.in_ref and not any(is_ancestor(commit, args.in_ref) for commit, _ in matches):
+            print(f"⚠️  {args.in_ref} 中没有该补丁的等价提交")
+    index.close()
+
+if __name__ == "__main__":
+    main()
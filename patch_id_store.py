@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+持久化的patch-id缓存
+
+以完整提交SHA为键，把patch-id保存到SQLite数据库中，供多次运行以及
+compare_adjacent_versions.py 启动的各个分析进程共享。提交SHA不可变，
+因此缓存值永远不会过期，只在超过容量上限时按最近使用时间淘汰。
+"""
+
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 2000000
+CACHE_FILE_NAME = 'patch_ids.sqlite'
+# 内存中累积的命中记录达到该数量时立即写回使用时间
+HIT_FLUSH_THRESHOLD = 100000
+
+def default_cache_dir():
+    """返回默认缓存目录（当前仓库的 .git/patch-analysis-cache）"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--git-common-dir'],
+                                capture_output=True, text=True)
+    except Exception:
+        return None
+    if result.returncode != 0 or not result.stdout.strip():
+        return None
+    return os.path.join(os.path.abspath(result.stdout.strip()), 'patch-analysis-cache')
+
+class PatchIdStore:
+    """基于SQLite的patch-id持久缓存，线程安全，支持多进程并发写入
+
+    shared=True 表示缓存位于多台主机共享的网络文件系统（如NFS）上：WAL依赖
+    同一主机上的共享内存，不能跨主机使用，此时改用回滚日志，靠文件锁协调写入。
+    """
+
+    def __init__(self, cache_dir, max_entries=DEFAULT_MAX_ENTRIES, shared=False):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE_NAME)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hits = set()
+        self._written = False
+
+        # 多个分析进程可能同时写入，依赖WAL（或共享模式下的回滚日志）和忙等待超时保证安全
+        self._conn = sqlite3.connect(self.path, timeout=300 if shared else 60, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=DELETE' if shared else 'PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS patch_ids ('
+            ' sha BLOB PRIMARY KEY,'
+            ' patch_id BLOB,'
+            ' last_used INTEGER NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        self._conn.commit()
+
+    def get_many(self, commit_hashes):
+        """批量查询，返回命中的 {提交: patch-id}（patch-id可能为None）"""
+        found = {}
+        keys = [bytes.fromhex(c) for c in commit_hashes if _is_full_sha(c)]
+        with self._lock:
+            # SQLite对单条语句的参数个数有限制，分批查询
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f'SELECT sha, patch_id FROM patch_ids WHERE sha IN ({placeholders})', batch
+                ).fetchall()
+                for sha, patch_id in rows:
+                    self._hits.add(sha)
+                    found[sha.hex()] = patch_id.hex() if patch_id is not None else None
+            if len(self._hits) >= HIT_FLUSH_THRESHOLD:
+                self._touch_hits()
+        return found
+
+    def get(self, commit_hash):
+        """查询单个提交，未命中时返回 (False, None)"""
+        found = self.get_many([commit_hash])
+        if commit_hash in found:
+            return True, found[commit_hash]
+        return False, None
+
+    def put_many(self, patch_ids):
+        """批量写入 {提交: patch-id}"""
+        now = int(time.time())
+        rows = [
+            (bytes.fromhex(c), bytes.fromhex(p) if p else None, now)
+            for c, p in patch_ids.items() if _is_full_sha(c)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO patch_ids (sha, patch_id, last_used) VALUES (?, ?, ?)', rows
+            )
+            self._conn.commit()
+            self._written = True
+
+    def _touch_hits(self):
+        """把命中记录的使用时间写回数据库（调用方持有锁）"""
+        if not self._hits:
+            return
+        now = int(time.time())
+        self._conn.executemany(
+            'UPDATE patch_ids SET last_used = ? WHERE sha = ?',
+            ((now, sha) for sha in self._hits)
+        )
+        self._hits.clear()
+        self._conn.commit()
+
+    def _evict(self):
+        """超过容量时淘汰最久未使用的条目（调用方持有锁）"""
+        count = self._conn.execute('SELECT COUNT(*) FROM patch_ids').fetchone()[0]
+        if count > self.max_entries:
+            excess = count - self.max_entries
+            self._conn.execute(
+                'DELETE FROM patch_ids WHERE sha IN '
+                '(SELECT sha FROM patch_ids ORDER BY last_used LIMIT ?)', (excess,)
+            )
+            self._conn.commit()
+            print(f"🧹 patch-id缓存超过上限，已淘汰 {excess} 条")
+        self._written = False
+
+    def flush(self):
+        """刷新命中记录的使用时间，写入过新条目时检查容量上限
+
+        单次分析只在 close() 时做这些工作；常驻服务在每个请求之后调用本方法，
+        命中记录不会无限累积，容量上限也持续生效。
+        """
+        with self._lock:
+            if self._conn is None:
+                return
+            self._touch_hits()
+            if self._written:
+                self._evict()
+
+    def close(self):
+        """刷新命中记录的使用时间，超过容量时淘汰最久未使用的条目"""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._touch_hits()
+            self._evict()
+            self._conn.close()
+            self._conn = None
+
+def _is_full_sha(commit_hash):
+    """只缓存完整的40位SHA，缩写哈希可能产生歧义"""
+    if len(commit_hash) != 40:
+        return False
+    try:
+        int(commit_hash, 16)
+    except ValueError:
+        return False
+    return True
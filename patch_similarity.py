@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+补丁近似重复检测（MinHash + LSH）
+
+以补丁中新增/删除的行作为特征（不含上下文行），对每个补丁计算MinHash签名，
+并通过分段LSH把签名相近的补丁放进同一个桶里。查询只需比较同桶候选，
+整体开销与提交数量近似线性，不必两两比较全部diff。
+"""
+
+import re
+import zlib
+
+import numpy as np
+
+DEFAULT_NUM_PERM = 64
+DEFAULT_BANDS = 16
+# 大于2^32的素数，配合32位特征哈希使用int64运算不会溢出
+_MERSENNE_PRIME = 4294967311
+
+_WHITESPACE = re.compile(r'\s+')
+
+def changed_line_shingles(lines):
+    """把diff中的 +/- 行归一化为特征集合（忽略空白差异和过短的行）"""
+    shingles = set()
+    for line in lines:
+        sign, content = line[0], _WHITESPACE.sub(' ', line[1:]).strip()
+        # 只有括号、空行之类的改动在几乎所有补丁里都会出现，不具区分度
+        if len(content) < 3:
+            continue
+        shingles.add(zlib.crc32(f'{sign}{content}'.encode('utf-8', errors='replace')))
+    return shingles
+
+class MinHashLSH:
+    """MinHash签名计算与分段LSH索引"""
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, bands=DEFAULT_BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError('num_perm 必须能被 bands 整除')
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.int64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.int64)
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+
+    def signature(self, shingles):
+        """计算特征集合的MinHash签名，空集合返回None"""
+        if not shingles:
+            return None
+        values = np.fromiter(shingles, dtype=np.int64, count=len(shingles))
+        hashed = (np.outer(self._a, values) + self._b[:, None]) % _MERSENNE_PRIME
+        return hashed.min(axis=1)
+
+    def add(self, key, signature):
+        """把签名加入索引"""
+        if signature is None:
+            return
+        self._signatures[key] = signature
+        for band, bucket in enumerate(self._buckets):
+            band_key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            bucket.setdefault(band_key, []).append(key)
+
+    def query(self, signature, threshold):
+        """返回估计相似度不低于阈值的 [(键, 相似度)]，按相似度降序"""
+        if signature is None:
+            return []
+        candidates = set()
+        for band, bucket in enumerate(self._buckets):
+            band_key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            candidates.update(bucket.get(band_key, ()))
+
+        results = []
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= threshold:
+                results.append((key, similarity))
+        results.sort(key=lambda item: -item[1])
+        return results
+
+    def __len__(self):
+        return len(self._signatures)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Excel之外的报告格式：Parquet、JSONL和SQLite
+
+每种格式都包含与“独有补丁详情”工作表相同的列，并在每行前加上
+源分支、目标分支和公共祖先三列，方便把多次比较的结果直接合并查询。
+"""
+
+import json
+import os
+import sqlite3
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+OUTPUT_FORMATS = ('xlsx', 'parquet', 'jsonl', 'sqlite')
+METADATA_COLUMNS = ('源分支', '目标分支', '公共祖先')
+SQLITE_TABLE = 'unique_patches'
+
+def parse_formats(value):
+    """解析逗号分隔的格式列表，保持顺序并去重"""
+    formats = []
+    for fmt in value.split(','):
+        fmt = fmt.strip().lower()
+        if not fmt:
+            continue
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {fmt}（可选: {', '.join(OUTPUT_FORMATS)}）")
+        if fmt not in formats:
+            formats.append(fmt)
+    if not formats:
+        raise ValueError("至少需要指定一种输出格式")
+    if 'parquet' in formats and pyarrow is None:
+        raise ValueError("输出Parquet需要安装pyarrow")
+    return formats
+
+def output_path(output, fmt):
+    """根据主输出文件名得到指定格式的文件名（替换已知的报告扩展名）"""
+    base, ext = os.path.splitext(output)
+    if ext.lower().lstrip('.') not in OUTPUT_FORMATS:
+        base = output
+    return f'{base}.{fmt}'
+
+def comparison_metadata(source, target, merge_base):
+    """每行附带的比较元数据"""
+    return dict(zip(METADATA_COLUMNS, (source, target, merge_base or '')))
+
+class JsonlWriter:
+    """逐行写入JSONL，每产生一条记录立即写出"""
+
+    def __init__(self, path, metadata):
+        self.path = path
+        self.metadata = metadata
+        self.count = 0
+        self._temp_path = f'{path}.{os.getpid()}.tmp'
+        self._file = open(self._temp_path, 'w', encoding='utf-8')
+
+    def write_row(self, row):
+        record = dict(self.metadata)
+        record.update(row)
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str))
+        self._file.write('\n')
+        self.count += 1
+
+    def close(self):
+        """写完后原子替换目标文件，中途失败不会留下半个文件"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        os.remove(self._temp_path)
+
+def _with_metadata(df, metadata):
+    table = df.copy()
+    for position, (column, value) in enumerate(metadata.items()):
+        table.insert(position, column, value)
+    return table
+
+def write_parquet(path, df, metadata, summary=None):
+    """写出Parquet文件，比较的统计摘要保存在文件的schema元数据中"""
+    if pyarrow is None:
+        raise RuntimeError("输出Parquet需要安装pyarrow")
+    table = pyarrow.Table.from_pandas(_with_metadata(df, metadata), preserve_index=False)
+    if summary:
+        schema_metadata = dict(table.schema.metadata or {})
+        schema_metadata[b'patch_analysis'] = json.dumps(summary, ensure_ascii=False).encode('utf-8')
+        table = table.replace_schema_metadata(schema_metadata)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    pyarrow.parquet.write_table(table, temp_path, compression='zstd')
+    os.replace(temp_path, path)
+
+def write_parquet_rows(path, columns, rows, metadata, summary=None, batch_size=2000):
+    """逐批写出Parquet文件，rows 为按 columns 顺序排列的值序列（内存受限模式使用，各列均为字符串）"""
+    if pyarrow is None:
+        raise RuntimeError("输出Parquet需要安装pyarrow")
+    columns = list(metadata) + list(columns)
+    schema = pyarrow.schema([(column, pyarrow.string()) for column in columns])
+    if summary:
+        schema = schema.with_metadata({'patch_analysis': json.dumps(summary, ensure_ascii=False)})
+    prefix = tuple(metadata.values())
+
+    def write_batch(writer, batch):
+        table = pyarrow.Table.from_pydict(
+            {column: [row[i] for row in batch] for i, column in enumerate(columns)}, schema=schema
+        )
+        writer.write_table(table)
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    writer = pyarrow.parquet.ParquetWriter(temp_path, schema, compression='zstd')
+    try:
+        batch = []
+        for row in rows:
+            batch.append(prefix + tuple(row))
+            if len(batch) >= batch_size:
+                write_batch(writer, batch)
+                batch = []
+        if batch:
+            write_batch(writer, batch)
+    finally:
+        writer.close()
+    os.replace(temp_path, path)
+
+def write_sqlite(path, df, metadata, summary=None):
+    """写出SQLite数据库：unique_patches 表保存详情，comparison 表保存比较的统计摘要"""
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    write_sqlite_rows(path, list(df.columns), rows, metadata, summary)
+
+def write_sqlite_rows(path, columns, rows, metadata, summary=None):
+    """与 write_sqlite 相同，行以按 columns 顺序排列的值序列逐行给出"""
+    columns = list(metadata) + list(columns)
+    quoted = ', '.join(f'"{column}"' for column in columns)
+    prefix = tuple(metadata.values())
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    conn = sqlite3.connect(temp_path)
+    try:
+        conn.execute(f'CREATE TABLE {SQLITE_TABLE} ({quoted})')
+        conn.executemany(
+            f'INSERT INTO {SQLITE_TABLE} ({quoted}) VALUES ({", ".join("?" * len(columns))})',
+            (prefix + tuple(row) for row in rows)
+        )
+        conn.execute(f'CREATE INDEX idx_{SQLITE_TABLE}_hash ON {SQLITE_TABLE} ("提交哈希")')
+        conn.execute('CREATE TABLE comparison (key TEXT PRIMARY KEY, value TEXT)')
+        conn.executemany(
+            'INSERT INTO comparison (key, value) VALUES (?, ?)',
+            [(key, str(value)) for key, value in dict(metadata, **(summary or {})).items()]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(temp_path, path)
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史比较报告的统一查询索引
+
+把输出目录中所有 *-to-*-diff 报告（xlsx/jsonl/sqlite/parquet）导入一个SQLite索引，
+按提交哈希、分类、文件路径、作者和版本对建立索引，之后的查询不必再逐个打开xlsx。
+
+导入是增量的：按文件大小和修改时间判断，只重新导入新增或变化的报告，
+已删除的报告会从索引中移除。
+
+使用示例:
+  python3 report_index.py ingest
+  python3 report_index.py query --path kernel/sched/ --series 6.10
+  python3 report_index.py query --category 调度 --from v6.6.20 --to v6.6.40
+  python3 report_index.py query --author "Peter Zijlstra" --json
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from compare_adjacent_versions import MANIFEST_FILE, parse_version_tag
+import report_formats
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_REPORT_DIR = 'version_comparisons'
+INDEX_FILE_NAME = 'report_index.sqlite'
+DETAIL_SHEET_NAME = '独有补丁详情'
+REPORT_NAME_PATTERN = re.compile(r'^(?P<target>.+)-to-(?P<source>.+)-diff$')
+# 同一报告有多种格式时优先导入解析最快的格式
+FORMAT_PREFERENCE = ('jsonl', 'sqlite', 'parquet', 'xlsx')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    commit_count INTEGER NOT NULL,
+    ingested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS commits (
+    id INTEGER PRIMARY KEY,
+    report_id INTEGER NOT NULL,
+    commit_hash TEXT NOT NULL,
+    author TEXT,
+    date TEXT,
+    subject TEXT,
+    patch_type TEXT,
+    categories TEXT,
+    subsystems TEXT,
+    maintainers TEXT,
+    files TEXT,
+    file_details TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_commits_report ON commits (report_id);
+CREATE INDEX IF NOT EXISTS idx_commits_hash ON commits (commit_hash);
+CREATE INDEX IF NOT EXISTS idx_commits_author ON commits (author COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS commit_files (
+    path TEXT NOT NULL,
+    commit_id INTEGER NOT NULL,
+    PRIMARY KEY (path, commit_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_commit_files_commit ON commit_files (commit_id);
+CREATE TABLE IF NOT EXISTS commit_categories (
+    category TEXT NOT NULL,
+    commit_id INTEGER NOT NULL,
+    PRIMARY KEY (category, commit_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_commit_categories_commit ON commit_categories (commit_id);
+'''
+
+def open_index(report_dir, index_path=None):
+    """打开（必要时创建）报告索引数据库"""
+    index_path = index_path or os.path.join(report_dir, INDEX_FILE_NAME)
+    conn = sqlite3.connect(index_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+def _split(value, separator):
+    if value is None:
+        return []
+    return [item for item in str(value).split(separator) if item]
+
+def _read_xlsx_rows(path):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True)
+    try:
+        if DETAIL_SHEET_NAME not in workbook.sheetnames:
+            return
+        rows = workbook[DETAIL_SHEET_NAME].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+def _read_jsonl_rows(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _read_sqlite_rows(path):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        for row in conn.execute(f'SELECT * FROM {report_formats.SQLITE_TABLE}'):
+            yield dict(row)
+    finally:
+        conn.close()
+
+def _read_parquet_rows(path):
+    if pyarrow is None:
+        raise RuntimeError("读取Parquet需要安装pyarrow")
+    for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+        yield from batch.to_pylist()
+
+ROW_READERS = {
+    'xlsx': _read_xlsx_rows,
+    'jsonl': _read_jsonl_rows,
+    'sqlite': _read_sqlite_rows,
+    'parquet': _read_parquet_rows,
+}
+
+def discover_reports(report_dir):
+    """找出目录中的所有报告，同一版本对只取一种格式，返回 {报告名: (路径, 格式)}"""
+    candidates = {}
+    for name in os.listdir(report_dir):
+        base, ext = os.path.splitext(name)
+        fmt = ext.lstrip('.').lower()
+        if fmt not in ROW_READERS or name.startswith('~$') or not REPORT_NAME_PATTERN.match(base):
+            continue
+        if fmt == 'parquet' and pyarrow is None:
+            continue
+        current = candidates.get(base)
+        if current is None or FORMAT_PREFERENCE.index(fmt) < FORMAT_PREFERENCE.index(current[1]):
+            candidates[base] = (os.path.join(report_dir, name), fmt)
+    return candidates
+
+def _load_pair_names(report_dir):
+    """从清单中读取输出文件对应的版本对，文件名无法可靠拆分时使用"""
+    manifest_path = os.path.join(report_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    pairs = {}
+    for entry in manifest.values():
+        for output_file in entry.get('output_files', [entry.get('output_file')]):
+            if output_file:
+                pairs[os.path.splitext(output_file)[0]] = (entry['source'], entry['target'])
+    return pairs
+
+def _collect_commits(rows):
+    """把报告行合并为每个提交一条记录
+
+    旧版报告中一个提交属于几个分类就有几行，这里按哈希合并分类。
+    """
+    commits = {}
+    for row in rows:
+        commit_hash = row.get('提交哈希')
+        if not commit_hash:
+            continue
+        commit_hash = str(commit_hash)
+        categories = _split(row.get('分类'), ', ')
+        existing = commits.get(commit_hash)
+        if existing is not None:
+            for category in categories:
+                if category not in existing['categories']:
+                    existing['categories'].append(category)
+            continue
+        commits[commit_hash] = {
+            'row': row,
+            'categories': categories,
+            'source': row.get(report_formats.METADATA_COLUMNS[0]),
+            'target': row.get(report_formats.METADATA_COLUMNS[1]),
+        }
+    return commits
+
+def ingest_report(conn, path, fmt, pair, stat):
+    """导入单个报告（调用方负责事务），返回导入的提交数"""
+    commits = _collect_commits(ROW_READERS[fmt](path))
+
+    # 新格式的报告每行都带有版本对，优先使用
+    source, target = pair
+    for commit in commits.values():
+        if commit['source'] and commit['target']:
+            source, target = commit['source'], commit['target']
+        break
+
+    cursor = conn.execute(
+        'INSERT INTO reports (path, size, mtime_ns, source, target, commit_count, ingested_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (path, stat.st_size, stat.st_mtime_ns, source, target, len(commits),
+         datetime.now().isoformat(timespec='seconds'))
+    )
+    report_id = cursor.lastrowid
+
+    for commit_hash, commit in commits.items():
+        row = commit['row']
+        files = _split(row.get('修改文件'), ', ')
+        cursor = conn.execute(
+            'INSERT INTO commits (report_id, commit_hash, author, date, subject, patch_type, categories, '
+            'subsystems, maintainers, files, file_details, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (report_id, commit_hash, row.get('作者'), str(row.get('日期') or ''), row.get('提交标题'),
+             row.get('类型'), ', '.join(commit['categories']), row.get('子系统'), row.get('维护者'),
+             row.get('修改文件'), row.get('文件变更详情'), row.get('完整提交信息'))
+        )
+        commit_id = cursor.lastrowid
+        conn.executemany('INSERT OR IGNORE INTO commit_files (path, commit_id) VALUES (?, ?)',
+                         ((f, commit_id) for f in files))
+        conn.executemany('INSERT OR IGNORE INTO commit_categories (category, commit_id) VALUES (?, ?)',
+                         ((c, commit_id) for c in commit['categories']))
+    return len(commits)
+
+def remove_report(conn, report_id):
+    """删除报告及其所有提交记录"""
+    commit_ids = '(SELECT id FROM commits WHERE report_id = ?)'
+    conn.execute(f'DELETE FROM commit_files WHERE commit_id IN {commit_ids}', (report_id,))
+    conn.execute(f'DELETE FROM commit_categories WHERE commit_id IN {commit_ids}', (report_id,))
+    conn.execute('DELETE FROM commits WHERE report_id = ?', (report_id,))
+    conn.execute('DELETE FROM reports WHERE id = ?', (report_id,))
+
+def ingest(report_dir=DEFAULT_REPORT_DIR, index_path=None, force=False):
+    """增量导入目录中的报告，返回 (新增或更新数, 未变化数, 删除数)"""
+    conn = open_index(report_dir, index_path)
+    known = {
+        path: (report_id, size, mtime_ns)
+        for report_id, path, size, mtime_ns in conn.execute('SELECT id, path, size, mtime_ns FROM reports')
+    }
+    reports = discover_reports(report_dir)
+    pair_names = _load_pair_names(report_dir)
+
+    ingested = unchanged = removed = 0
+    current_paths = set()
+    try:
+        for base, (path, fmt) in sorted(reports.items()):
+            current_paths.add(path)
+            stat = os.stat(path)
+            previous = known.get(path)
+            if not force and previous and previous[1:] == (stat.st_size, stat.st_mtime_ns):
+                unchanged += 1
+                continue
+
+            pair = pair_names.get(base)
+            if pair is None:
+                match = REPORT_NAME_PATTERN.match(base)
+                pair = (match.group('source'), match.group('target'))
+
+            try:
+                with conn:
+                    if previous:
+                        remove_report(conn, previous[0])
+                    count = ingest_report(conn, path, fmt, pair, stat)
+            except Exception as e:
+                print(f"❌ 导入失败 {path}: {e}")
+                continue
+            ingested += 1
+            print(f"📥 {os.path.basename(path)}: {count} 个提交")
+
+        # 报告文件已删除或换成了其他格式
+        with conn:
+            for path, (report_id, _, _) in known.items():
+                if path not in current_paths:
+                    remove_report(conn, report_id)
+                    removed += 1
+    finally:
+        conn.close()
+    return ingested, unchanged, removed
+
+def _version_in_range(tag, lower, upper, series):
+    parsed = parse_version_tag(tag)
+    if parsed is None:
+        return False
+    if lower is not None and parsed < lower:
+        return False
+    if upper is not None and parsed > upper:
+        return False
+    if series is not None and parsed.release[:len(series)] != series:
+        return False
+    return True
+
+def query(conn, path=None, category=None, author=None, commit_hash=None, subject=None,
+          version_from=None, version_to=None, series=None, limit=None):
+    """按条件查询提交，返回字典列表；版本范围作用于版本对的源版本（较新的一侧）"""
+    conditions = []
+    params = []
+
+    if version_from or version_to or series:
+        lower = parse_version_tag(version_from) if version_from else None
+        upper = parse_version_tag(version_to) if version_to else None
+        series_release = tuple(int(part) for part in series.lstrip('v').split('.')) if series else None
+        report_ids = [
+            report_id for report_id, source in conn.execute('SELECT id, source FROM reports')
+            if _version_in_range(source, lower, upper, series_release)
+        ]
+        if not report_ids:
+            return []
+        conditions.append(f'c.report_id IN ({",".join("?" * len(report_ids))})')
+        params.extend(report_ids)
+
+    if path:
+        # 以/结尾按目录前缀匹配，否则匹配该文件或以其为目录的路径，都走主键索引的范围查询
+        prefixes = [path] if path.endswith('/') else [path + '/']
+        clauses = ['(f.path >= ? AND f.path < ?)'] * len(prefixes)
+        range_params = [bound for prefix in prefixes for bound in (prefix, prefix + '\U0010ffff')]
+        if not path.endswith('/'):
+            clauses.append('f.path = ?')
+            range_params.append(path)
+        conditions.append(
+            f'c.id IN (SELECT f.commit_id FROM commit_files f WHERE {" OR ".join(clauses)})'
+        )
+        params.extend(range_params)
+
+    if category:
+        conditions.append('c.id IN (SELECT commit_id FROM commit_categories WHERE category = ?)')
+        params.append(category)
+
+    if author:
+        conditions.append('c.author LIKE ?')
+        params.append(f'%{author}%')
+
+    if commit_hash:
+        # 报告中的哈希是缩写，查询时两边都可能更长
+        conditions.append('(c.commit_hash = substr(?, 1, length(c.commit_hash)) OR c.commit_hash LIKE ?)')
+        params.extend([commit_hash, f'{commit_hash}%'])
+
+    if subject:
+        conditions.append('c.subject LIKE ?')
+        params.append(f'%{subject}%')
+
+    sql = (
+        'SELECT r.source, r.target, c.commit_hash, c.date, c.author, c.subject, c.categories, c.patch_type, '
+        'c.subsystems, c.files FROM commits c JOIN reports r ON r.id = c.report_id'
+    )
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY c.date, c.commit_hash'
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+
+    columns = ['source', 'target', 'commit_hash', 'date', 'author', 'subject', 'categories', 'patch_type',
+               'subsystems', 'files']
+    return [dict(zip(columns, row)) for row in conn.execute(sql, params)]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='历史比较报告的统一查询索引',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""使用示例:
+  %(prog)s ingest
+  %(prog)s ingest --report-dir my_comparisons
+  %(prog)s query --path kernel/sched/ --series 6.10
+  %(prog)s query --category 调度 --from v6.6.20 --to v6.6.40
+  %(prog)s query --author "Peter Zijlstra" --json
+        """
+    )
+    parser.add_argument('--report-dir', default=DEFAULT_REPORT_DIR,
+                        help=f'报告所在目录（默认: {DEFAULT_REPORT_DIR}）')
+    parser.add_argument('--index', help=f'索引数据库路径（默认: <报告目录>/{INDEX_FILE_NAME}）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help='增量导入报告')
+    ingest_parser.add_argument('--force', action='store_true', help='重新导入所有报告')
+
+    query_parser = subparsers.add_parser('query', help='查询提交')
+    query_parser.add_argument('--path', help='文件路径或目录前缀（如 kernel/sched/）')
+    query_parser.add_argument('--category', help='分类（如 调度）')
+    query_parser.add_argument('--author', help='作者（部分匹配，不区分大小写）')
+    query_parser.add_argument('--hash', dest='commit_hash', help='提交哈希（可为缩写）')
+    query_parser.add_argument('--subject', help='提交标题关键词')
+    query_parser.add_argument('--from', dest='version_from', help='源版本下限（含）')
+    query_parser.add_argument('--to', dest='version_to', help='源版本上限（含）')
+    query_parser.add_argument('--series', help='只查询某个版本系列的源版本（如 6.10）')
+    query_parser.add_argument('--limit', type=int, help='最多返回的记录数')
+    query_parser.add_argument('--json', action='store_true', help='以JSONL格式输出')
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.report_dir):
+        print(f"❌ 错误: 报告目录 '{args.report_dir}' 不存在")
+        sys.exit(1)
+
+    if args.command == 'ingest':
+        start_time = time.time()
+        ingested, unchanged, removed = ingest(args.report_dir, args.index, args.force)
+        print(f"✅ 导入完成: 新增/更新 {ingested} 个，未变化 {unchanged} 个，移除 {removed} 个"
+              f"（{time.time() - start_time:.1f} 秒）")
+        return
+
+    conn = open_index(args.report_dir, args.index)
+    start_time = time.time()
+    results = query(conn, args.path, args.category, args.author, args.commit_hash, args.subject,
+                    args.version_from, args.version_to, args.series, args.limit)
+    elapsed = time.time() - start_time
+    conn.close()
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result, ensure_ascii=False))
+        return
+
+    for result in results:
+        print(f"{result['target']}..{result['source']}  {result['commit_hash']}  {result['date']}  "
+              f"{result['author']}  {result['subject']}  [{result['categories']}]")
+    print(f"\n📊 共 {len(results)} 个提交（查询耗时 {elapsed * 1000:.1f} 毫秒）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析过程的性能指标
+
+记录各阶段的耗时（墙钟和CPU）与处理的提交数、git子进程数和读写字节数、
+各级缓存的命中情况以及峰值内存，用于估算分析机器的规格。
+
+指标是进程级的全局状态：begin() 开始一次新的记录，各模块通过 stage()/add()/
+observe_max() 上报，snapshot() 得到结果，可以打印摘要或写成JSON/Prometheus textfile
+（供 node_exporter 的 textfile collector 采集）。流水线中的阶段相互重叠，各阶段的
+耗时之和会大于总耗时；阶段的CPU时间是该阶段期间整个进程（含已结束的git子进程）的CPU时间。
+
+Profiler 在分析期间采集调用栈：cProfile格式（.prof，可用 pstats/snakeviz 查看），
+或对所有线程定时采样的折叠栈格式（.folded，与 py-spy record --format raw 相同，
+可直接交给 flamegraph.pl / speedscope）。
+"""
+
+import cProfile
+import json
+import os
+import re
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# 折叠栈的采样间隔（秒）
+DEFAULT_SAMPLE_INTERVAL = 0.005
+PROMETHEUS_PREFIX = 'patch_analysis'
+
+def _cpu_times():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime, own.ru_stime, children.ru_utime, children.ru_stime
+
+class StageTimer:
+    """一个阶段的一次计时，stop() 时把耗时累加到所属的 RunMetrics"""
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.items = None
+        metrics._register_stage(name)
+        self._wall = time.perf_counter()
+        self._cpu = sum(_cpu_times())
+
+    def stop(self, items=None):
+        if items is not None:
+            self.items = items
+        self.metrics._record_stage(self.name, time.perf_counter() - self._wall,
+                                   sum(_cpu_times()) - self._cpu, self.items)
+
+class RunMetrics:
+    """一次分析的指标：阶段计时、计数器和最大值"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = _cpu_times()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.maxima = {}
+
+    def start_stage(self, name):
+        return StageTimer(self, name)
+
+    @contextmanager
+    def stage(self, name):
+        """计时一个阶段，可在with块内设置 timer.items 为处理的提交数"""
+        timer = StageTimer(self, name)
+        try:
+            yield timer
+        finally:
+            timer.stop()
+
+    def _register_stage(self, name):
+        # 按阶段开始的顺序排列
+        with self._lock:
+            self.stages.setdefault(name, {'seconds': 0.0, 'cpu_seconds': 0.0, 'items': None, 'runs': 0})
+
+    def _record_stage(self, name, seconds, cpu_seconds, items):
+        with self._lock:
+            # 同名阶段多次执行时累加（如增量分析中目标侧和源侧的新提交）
+            entry = self.stages[name]
+            entry['seconds'] += seconds
+            entry['cpu_seconds'] += cpu_seconds
+            entry['runs'] += 1
+            if items is not None:
+                entry['items'] = (entry['items'] or 0) + items
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe_max(self, name, value):
+        with self._lock:
+            if value > self.maxima.get(name, value - 1):
+                self.maxima[name] = value
+
+    def snapshot(self):
+        """返回当前的全部指标（可JSON序列化的字典）"""
+        wall = time.perf_counter() - self._wall
+        user, system, children_user, children_system = (now - start for now, start in zip(_cpu_times(), self._cpu))
+        with self._lock:
+            stages = {}
+            for name, entry in self.stages.items():
+                items = entry['items']
+                stages[name] = dict(entry, items_per_second=items / entry['seconds']
+                                    if items and entry['seconds'] > 0 else None)
+            counters = dict(self.counters)
+            maxima = dict(self.maxima)
+        return {
+            'started_at': self.started_at,
+            'wall_seconds': wall,
+            'cpu_seconds': {'user': user, 'system': system,
+                            'children_user': children_user, 'children_system': children_system},
+            # Linux上 ru_maxrss 的单位是KiB；子进程取其中最大的一个
+            'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'peak_rss_children_kib': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            'stages': stages,
+            'counters': counters,
+            'maxima': maxima
+        }
+
+_current = RunMetrics()
+
+def begin():
+    """开始一次新的记录并返回它"""
+    global _current
+    _current = RunMetrics()
+    return _current
+
+def current():
+    return _current
+
+def start_stage(name):
+    return _current.start_stage(name)
+
+def stage(name):
+    return _current.stage(name)
+
+def add(name, value=1):
+    _current.add(name, value)
+
+def observe_max(name, value):
+    _current.observe_max(name, value)
+
+def snapshot():
+    return _current.snapshot()
+
+def _format_bytes(count):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if count < 1024 or unit == 'GiB':
+            return f"{count:.1f} {unit}" if unit != 'B' else f"{count} B"
+        count /= 1024
+
+def _hit_rate(counters, prefix, hit_names, miss_name):
+    hits = sum(counters.get(f'{prefix}.{name}', 0) for name in hit_names)
+    misses = counters.get(f'{prefix}.{miss_name}', 0)
+    total = hits + misses
+    return f"{hits}/{total}（{hits / total:.0%}）" if total else "0/0"
+
+def print_summary(metrics):
+    """打印 snapshot() 结果的摘要"""
+    cpu = metrics['cpu_seconds']
+    counters = metrics['counters']
+    print("\n⏱️  性能指标:")
+    print(f"  总耗时 {metrics['wall_seconds']:.2f}s，CPU 本进程 {cpu['user'] + cpu['system']:.2f}s"
+          f" / git子进程 {cpu['children_user'] + cpu['children_system']:.2f}s，"
+          f"峰值内存 {_format_bytes(metrics['peak_rss_kib'] * 1024)}")
+    for name, entry in metrics['stages'].items():
+        rate = f"  {entry['items_per_second']:.0f} 提交/秒" if entry['items_per_second'] else ''
+        items = f"  {entry['items']} 个" if entry['items'] is not None else ''
+        print(f"  {name:<16} {entry['seconds']:8.2f}s  CPU {entry['cpu_seconds']:8.2f}s{items}{rate}")
+    print(f"  git子进程: {counters.get('git.processes', 0)} 个（最多同时 {metrics['maxima'].get('git.concurrent', 0)} 个），"
+          f"读取 {_format_bytes(counters.get('git.bytes_read', 0))}，写入 {_format_bytes(counters.get('git.bytes_written', 0))}")
+    print(f"  patch-id缓存命中: {_hit_rate(counters, 'patch_id', ('memory_hits', 'store_hits'), 'computed')}"
+          f"（内存 {counters.get('patch_id.memory_hits', 0)}，持久化 {counters.get('patch_id.store_hits', 0)}）")
+    print(f"  上游引用缓存命中: {_hit_rate(counters, 'upstream_refs', ('memory_hits',), 'read')}")
+    print(f"  提交详情复用: {_hit_rate(counters, 'details', ('reused',), 'read')}")
+
+def _atomic_write(path, text):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+def write_json(path, metrics, labels=None):
+    """把指标写成JSON，labels（如分支对）一并写入"""
+    _atomic_write(path, json.dumps(dict(metrics, labels=labels or {}), ensure_ascii=False, indent=2) + '\n')
+
+def _metric_name(name):
+    return f"{PROMETHEUS_PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+def _label_text(labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{key}="{escape(value)}"' for key, value in sorted(labels.items()))
+
+def format_prometheus(metrics, labels=None):
+    """把指标格式化为Prometheus文本格式"""
+    labels = labels or {}
+    lines = []
+
+    def emit(name, metric_type, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for extra, value in samples:
+            label_text = _label_text(dict(labels, **extra))
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    cpu = metrics['cpu_seconds']
+    emit(_metric_name('wall_seconds'), 'gauge', 'Wall time of the analysis run.', [({}, metrics['wall_seconds'])])
+    emit(_metric_name('cpu_seconds'), 'gauge', 'CPU time of the analysis run.',
+         [({'process': 'self', 'mode': 'user'}, cpu['user']), ({'process': 'self', 'mode': 'system'}, cpu['system']),
+          ({'process': 'git', 'mode': 'user'}, cpu['children_user']),
+          ({'process': 'git', 'mode': 'system'}, cpu['children_system'])])
+    emit(_metric_name('peak_rss_bytes'), 'gauge', 'Peak resident set size.',
+         [({'process': 'self'}, metrics['peak_rss_kib'] * 1024),
+          ({'process': 'git'}, metrics['peak_rss_children_kib'] * 1024)])
+    stages = metrics['stages'].items()
+    emit(_metric_name('stage_seconds'), 'gauge', 'Wall time per analysis stage.',
+         [({'stage': name}, entry['seconds']) for name, entry in stages])
+    emit(_metric_name('stage_cpu_seconds'), 'gauge', 'Process CPU time while the stage was running.',
+         [({'stage': name}, entry['cpu_seconds']) for name, entry in stages])
+    emit(_metric_name('stage_commits'), 'gauge', 'Commits processed per analysis stage.',
+         [({'stage': name}, entry['items']) for name, entry in stages if entry['items'] is not None])
+    emit(_metric_name('stage_commits_per_second'), 'gauge', 'Throughput per analysis stage.',
+         [({'stage': name}, entry['items_per_second']) for name, entry in stages if entry['items_per_second']])
+    for name, value in sorted(metrics['counters'].items()):
+        emit(_metric_name(f'{name}_total'), 'counter', f'Counter {name}.', [({}, value)])
+    for name, value in sorted(metrics['maxima'].items()):
+        emit(_metric_name(f'{name}_max'), 'gauge', f'Maximum of {name}.', [({}, value)])
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus(path, metrics, labels=None):
+    """把指标写成Prometheus textfile（原子替换，采集时不会读到写了一半的文件）"""
+    _atomic_write(path, format_prometheus(metrics, labels))
+
+class Profiler:
+    """在分析期间采集调用栈，stop() 时写出到 path
+
+    fmt 为 'cprofile' 或 'folded'，为空时按扩展名判断（.folded/.collapsed/.txt 为折叠栈）。
+    cProfile 只记录调用 start() 的线程；流水线的大部分工作在后台线程中，
+    需要完整的视图时使用折叠栈格式，它对所有线程采样。
+    """
+
+    def __init__(self, path, fmt=None, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.path = path
+        if fmt is None:
+            fmt = 'folded' if os.path.splitext(path)[1] in ('.folded', '.collapsed', '.txt') else 'cprofile'
+        self.fmt = fmt
+        self.interval = interval
+        self._profile = None
+        self._samples = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.fmt == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(f"thread {names.get(ident, ident)}")
+                key = ';'.join(reversed(stack))
+                self._samples[key] = self._samples.get(key, 0) + 1
+
+    def stop(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.path)
+        else:
+            self._stop.set()
+            self._thread.join()
+            _atomic_write(self.path, ''.join(f"{stack} {count}\n" for stack, count in sorted(self._samples.items())))
+        print(f"🔬 性能剖析结果: {self.path}")
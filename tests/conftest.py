@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""测试共用的夹具：在临时目录中建立小型git仓库，各模块按当前目录操作仓库"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'Test',
+    'GIT_AUTHOR_EMAIL': 'test@example.com',
+    'GIT_COMMITTER_NAME': 'Test',
+    'GIT_COMMITTER_EMAIL': 'test@example.com',
+    'GIT_CONFIG_NOSYSTEM': '1',
+}
+
+class GitRepo:
+    def __init__(self, path):
+        self.path = path
+
+    def git(self, *args):
+        result = subprocess.run(['git', *args], cwd=self.path, capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+
+    def commit(self, filename, content, message):
+        """写入文件并提交，返回完整SHA"""
+        full_path = os.path.join(self.path, filename)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(content)
+        self.git('add', filename)
+        self.git('commit', '-q', '-m', message)
+        return self.git('rev-parse', 'HEAD')
+
+@pytest.fixture
+def git_repo(tmp_path, monkeypatch):
+    for name, value in GIT_ENV.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv('HOME', str(tmp_path))
+    path = tmp_path / 'repo'
+    path.mkdir()
+    repo = GitRepo(str(path))
+    repo.git('init', '-q', '-b', 'master')
+    monkeypatch.chdir(path)
+    yield repo
+    # 常驻的cat-file进程属于本仓库，不能留给下一个测试
+    import git_backend
+    git_backend.close_all()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+import analysis_server
+import generate_patch_analysis as analysis
+
+@pytest.fixture
+def repo(git_repo, monkeypatch):
+    monkeypatch.setattr(analysis, 'patch_id_cache', {})
+    git_repo.commit('base.c', 'int base;\n', 'base')
+    git_repo.git('checkout', '-q', '-b', 'source')
+    git_repo.commit('a.c', 'int a;\n', 'add a')
+    return git_repo
+
+def _service(output_dir):
+    return analysis_server.AnalysisService(jobs=2, use_cache=False, output_dir=output_dir)
+
+def _payload(output, **extra):
+    return dict({'source': 'source', 'targets': ['master'], 'output': output, 'formats': ['jsonl'],
+                 'use_maintainers': False}, **extra)
+
+def test_analyze_writes_inside_output_dir(repo, tmp_path):
+    output_dir = tmp_path / 'reports'
+    output_dir.mkdir()
+    result = _service(str(output_dir)).analyze(_payload('pair.xlsx'))
+    assert result['summary']['unique_count'] == 1
+    assert os.listdir(output_dir) == ['pair.jsonl']
+
+@pytest.mark.parametrize('field', ['output', 'state_file'])
+def test_analyze_rejects_paths_outside_output_dir(repo, tmp_path, field):
+    output_dir = tmp_path / 'reports'
+    output_dir.mkdir()
+    (output_dir / 'escape').symlink_to(tmp_path)
+    service = _service(str(output_dir))
+
+    for path in ['../pair.xlsx', str(tmp_path / 'pair.xlsx'), 'escape/pair.xlsx']:
+        payload = dict(_payload('pair.xlsx'), **{field: path})
+        with pytest.raises(analysis_server.RequestError) as error:
+            service.analyze(payload)
+        assert error.value.status == 403
+    assert sorted(os.listdir(tmp_path)) == ['repo', 'reports']
+
+def test_analyze_disabled_without_output_dir(repo, tmp_path):
+    with pytest.raises(analysis_server.RequestError) as error:
+        _service(None).analyze(_payload(str(tmp_path / 'pair.xlsx')))
+    assert error.value.status == 403
+
+def test_is_loopback():
+    assert analysis_server._is_loopback('127.0.0.1')
+    assert analysis_server._is_loopback('::1')
+    assert analysis_server._is_loopback('localhost')
+    assert not analysis_server._is_loopback('0.0.0.0')
+    assert not analysis_server._is_loopback('192.168.1.10')
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+import analysis_state
+import generate_patch_analysis as analysis
+
+@pytest.fixture
+def branches(git_repo, monkeypatch):
+    """source 和 target 从同一个公共祖先分出，target 中有 source 第一个补丁的等价提交"""
+    monkeypatch.setattr(analysis, 'patch_id_cache', {})
+    monkeypatch.setattr(analysis, 'upstream_ref_cache', {})
+    git_repo.commit('base.c', 'int base;\n', 'base')
+    git_repo.git('checkout', '-q', '-b', 'source')
+    git_repo.commit('a.c', 'int a;\n', 'add a')
+    git_repo.commit('b.c', 'int b;\n', 'add b')
+    git_repo.git('checkout', '-q', '-b', 'target', 'master')
+    git_repo.commit('a.c', 'int a;\n', 'backport a')
+    return git_repo
+
+def _analyze(tmp_path, state_file):
+    return analysis.run_analysis('source', 'target', str(tmp_path / 'report.xlsx'), jobs=2,
+                                 use_maintainers=False, formats=('jsonl',), state_file=str(state_file))
+
+def _unique_subjects(tmp_path):
+    with open(tmp_path / 'report.jsonl', encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f]
+    return sorted(row['提交标题'] for row in rows if '提交标题' in row)
+
+def test_save_and_load(tmp_path):
+    path = tmp_path / 'state' / 'pair.json'
+    analysis_state.save_state(str(path), {'source': 'a', 'target': 'b'})
+    assert analysis_state.load_state(str(path)) == {'source': 'a', 'target': 'b',
+                                                     'version': analysis_state.STATE_FORMAT_VERSION}
+    assert [p.name for p in path.parent.iterdir()] == ['pair.json']
+
+def test_load_rejects_missing_corrupt_and_old_state(tmp_path, capsys):
+    path = tmp_path / 'pair.json'
+    assert analysis_state.load_state(str(path)) is None
+    path.write_text('{not json')
+    assert analysis_state.load_state(str(path)) is None
+    assert '无法读取增量状态' in capsys.readouterr().out
+    path.write_text(json.dumps({'version': analysis_state.STATE_FORMAT_VERSION + 1}))
+    assert analysis_state.load_state(str(path)) is None
+
+def test_default_state_path_sanitizes_branch_names():
+    path = analysis_state.default_state_path('/cache', 'v6.6', 'vendor/next')
+    assert path == '/cache/analysis-state/v6.6-to-vendor_next.json'
+
+def test_check_resumable(branches):
+    source_tip = branches.git('rev-parse', 'source')
+    target_tip = branches.git('rev-parse', 'target')
+    base = branches.git('rev-parse', 'master')
+    state = {'source': 'source', 'target': 'target', 'source_tip': source_tip, 'target_tip': target_tip,
+             'merge_base': base, 'use_upstream_match': True, 'scope': None}
+
+    def check(**changes):
+        arguments = dict(source_branch='source', target_branch='target', source_tip=source_tip,
+                         target_tip=target_tip, merge_base=base, use_upstream_match=True)
+        arguments.update(changes)
+        return analysis_state.check_resumable(state, **arguments)
+
+    assert check() == (True, "")
+    assert not check(target_branch='other')[0]
+    assert not check(use_upstream_match=False)[0]
+    assert not check(scope='path:kernel')[0]
+    assert not check(merge_base=source_tip)[0]
+    # tip回到上次位置之前说明分支被改写
+    assert check(source_tip=base) == (False, "source 被变基或强制推送")
+    assert check(target_tip=base) == (False, "target 被变基或强制推送")
+    assert analysis_state.check_resumable(None, 'source', 'target', source_tip, target_tip, base, True)[0] is False
+
+def test_incremental_run_processes_only_new_commits(branches, tmp_path, capsys):
+    state_file = tmp_path / 'state.json'
+    summary = _analyze(tmp_path, state_file)
+    assert (summary['equivalent_count'], summary['unique_count']) == (1, 1)
+    assert _unique_subjects(tmp_path) == ['add b']
+
+    branches.git('checkout', '-q', 'source')
+    branches.commit('c.c', 'int c;\n', 'add c')
+    branches.git('checkout', '-q', 'target')
+    branches.commit('b.c', 'int b;\n', 'backport b')
+    capsys.readouterr()
+
+    summary = _analyze(tmp_path, state_file)
+    assert '增量分析: source 新增 1 个提交，target 新增 1 个提交' in capsys.readouterr().out
+    assert (summary['equivalent_count'], summary['unique_count']) == (2, 1)
+    assert _unique_subjects(tmp_path) == ['add c']
+
+def test_rewritten_branch_falls_back_to_full_analysis(branches, tmp_path, capsys):
+    state_file = tmp_path / 'state.json'
+    _analyze(tmp_path, state_file)
+
+    branches.git('checkout', '-q', 'source')
+    branches.git('reset', '-q', '--hard', 'HEAD~1')
+    branches.commit('d.c', 'int d;\n', 'add d')
+    capsys.readouterr()
+
+    summary = _analyze(tmp_path, state_file)
+    assert '无法增量分析（source 被变基或强制推送）' in capsys.readouterr().out
+    assert summary['unique_count'] == 1
+    assert _unique_subjects(tmp_path) == ['add d']
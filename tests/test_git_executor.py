@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import git_executor
+from generate_patch_analysis import PATCH_ID_PIPELINE
+
+def test_pipeline_output(git_repo):
+    commit = git_repo.commit('a.c', 'int a;\n', 'add a')
+    output = git_executor.GitExecutor(2).run(PATCH_ID_PIPELINE, f'{commit}\n'.encode())
+    assert output.decode().split()[1] == commit
+
+def test_missing_object_raises(git_repo):
+    git_repo.commit('a.c', 'int a;\n', 'add a')
+    executor = git_executor.GitExecutor(2)
+    with pytest.raises(git_executor.GitCommandError) as error:
+        executor.run(PATCH_ID_PIPELINE, b'0123456789abcdef0123456789abcdef01234567\n')
+    # 报告真正失败的 git log，而不是下游进程
+    assert error.value.cmd[0] == 'log'
+    assert error.value.returncode != 0
+    assert error.value.stderr
+
+def test_failing_command_raises(git_repo):
+    with pytest.raises(git_executor.GitCommandError):
+        git_executor.GitExecutor(1).run([['rev-parse', '--verify', 'no-such-ref']])
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+import pytest
+
+import generate_patch_analysis as analysis
+from patch_id_store import PatchIdStore
+
+MISSING = '0123456789abcdef0123456789abcdef01234567'
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = PatchIdStore(str(tmp_path / 'cache'))
+    monkeypatch.setattr(analysis, 'patch_id_store', store)
+    monkeypatch.setattr(analysis, 'patch_id_cache', {})
+    yield store
+    store.close()
+
+def _sha(i):
+    return hashlib.sha1(str(i).encode()).hexdigest()
+
+def test_put_and_get(tmp_path):
+    store = PatchIdStore(str(tmp_path))
+    store.put_many({_sha(1): _sha(2), _sha(3): None, 'short': _sha(4)})
+    assert store.get_many([_sha(1), _sha(3), _sha(5)]) == {_sha(1): _sha(2), _sha(3): None}
+    assert store.get(_sha(5)) == (False, None)
+    store.close()
+
+def test_flush_enforces_capacity(tmp_path):
+    store = PatchIdStore(str(tmp_path), max_entries=10)
+    store.put_many({_sha(i): _sha(-i) for i in range(15)})
+    store.get_many([_sha(0)])
+    store.flush()
+    assert store._hits == set()
+    assert store._conn.execute('SELECT COUNT(*) FROM patch_ids').fetchone()[0] == 10
+    store.close()
+
+def test_patch_ids_are_cached(git_repo, store):
+    first = git_repo.commit('a.c', 'int a;\n', 'add a')
+    git_repo.git('commit', '-q', '--allow-empty', '-m', 'empty')
+    empty = git_repo.git('rev-parse', 'HEAD')
+
+    patch_ids = analysis.get_patch_ids_batch([first, empty])
+    assert patch_ids[first] and patch_ids[empty] is None
+    # 空提交被git处理过、确实没有补丁内容，可以持久化为None
+    assert store.get_many([first, empty]) == patch_ids
+
+def test_failed_pipeline_writes_nothing(git_repo, store):
+    commits = [git_repo.commit(f'f{i}.c', f'int f{i};\n', f'add f{i}') for i in range(5)]
+
+    with pytest.raises(RuntimeError):
+        analysis.get_patch_ids_batch(commits + [MISSING])
+    assert store.get_many(commits + [MISSING]) == {}
+    assert not set(commits) & set(analysis.patch_id_cache)
+
+    # 之后正常计算不受影响
+    assert all(analysis.get_patch_ids_batch(commits).values())
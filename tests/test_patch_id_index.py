@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import generate_patch_analysis as analysis
+import patch_id_index
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis, 'patch_id_cache', {})
+    return str(tmp_path / 'index')
+
+def _update(index_dir, refs=()):
+    return patch_id_index.update_index(index_dir, refs, jobs=2, no_cache=True)
+
+def _labels(index_dir, commit):
+    index = patch_id_index.PatchIdIndex(index_dir)
+    try:
+        return [label for _, label in index.lookup(patch_id_index.patch_ids_for_input(commit)[0])]
+    finally:
+        index.close()
+
+def test_lookup_returns_earliest_tag(git_repo, index_dir):
+    first = git_repo.commit('a.c', 'int a;\n', 'add a')
+    git_repo.git('tag', 'v1.0')
+    second = git_repo.commit('b.c', 'int b;\n', 'add b')
+    git_repo.git('tag', 'v1.1')
+
+    assert _update(index_dir) == 2
+    assert _labels(index_dir, first) == ['v1.0']
+    assert _labels(index_dir, second) == ['v1.1']
+    assert _update(index_dir) == 0
+
+def test_older_tag_fetched_later_rebuilds(git_repo, index_dir, capsys):
+    first = git_repo.commit('a.c', 'int a;\n', 'add a')
+    git_repo.commit('b.c', 'int b;\n', 'add b')
+    git_repo.git('tag', 'v1.1')
+    _update(index_dir)
+    assert _labels(index_dir, first) == ['v1.1']
+
+    git_repo.git('tag', 'v1.0', first)
+    _update(index_dir)
+    assert '重新构建索引' in capsys.readouterr().out
+    assert _labels(index_dir, first) == ['v1.0']
+
+def test_older_tag_with_new_commits_updates_incrementally(git_repo, index_dir, capsys):
+    base = git_repo.commit('a.c', 'int a;\n', 'add a')
+    git_repo.git('tag', 'v1.0')
+    git_repo.commit('b.c', 'int b;\n', 'add b')
+    git_repo.git('tag', 'v1.1')
+    _update(index_dir)
+
+    # 稳定分支上的新标签排在v1.1之前，但它的提交都不能从v1.1到达
+    git_repo.git('checkout', '-q', '-b', 'stable', base)
+    backport = git_repo.commit('c.c', 'int c;\n', 'backport c')
+    git_repo.git('tag', 'v1.0.1')
+    assert _update(index_dir) == 1
+    assert '重新构建索引' not in capsys.readouterr().out
+    assert _labels(index_dir, backport) == ['v1.0.1']
+
+def test_extra_ref_fast_forward_updates_incrementally(git_repo, index_dir, capsys):
+    git_repo.commit('a.c', 'int a;\n', 'add a')
+    git_repo.git('tag', 'v1.0')
+    git_repo.git('checkout', '-q', '-b', 'vendor')
+    git_repo.commit('x.c', 'int x;\n', 'vendor x')
+    _update(index_dir, ['vendor'])
+
+    added = git_repo.commit('y.c', 'int y;\n', 'vendor y')
+    assert _update(index_dir, ['vendor']) == 1
+    assert '重新构建索引' not in capsys.readouterr().out
+    assert _labels(index_dir, added) == ['vendor']
+
+def test_extra_ref_rewrite_rebuilds(git_repo, index_dir):
+    git_repo.commit('a.c', 'int a;\n', 'add a')
+    git_repo.git('tag', 'v1.0')
+    git_repo.git('checkout', '-q', '-b', 'vendor')
+    dropped = git_repo.commit('x.c', 'int x;\n', 'vendor x')
+    _update(index_dir, ['vendor'])
+    dropped_patch_id = patch_id_index.patch_ids_for_input(dropped)[0]
+
+    git_repo.git('reset', '-q', '--hard', 'v1.0')
+    replacement = git_repo.commit('y.c', 'int y;\n', 'vendor y')
+    _update(index_dir, ['vendor'])
+
+    index = patch_id_index.PatchIdIndex(index_dir)
+    assert index.lookup(dropped_patch_id) == []
+    index.close()
+    assert _labels(index_dir, replacement) == ['vendor']
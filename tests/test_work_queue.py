@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+
+import pytest
+
+import compare_adjacent_versions
+import work_queue
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = work_queue.WorkQueue(str(tmp_path / 'queue'))
+    queue.init({'lease_seconds': 600})
+    return queue
+
+def _age(path, seconds):
+    """把文件修改时间改到 seconds 秒之前，模拟长时间没有心跳"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def test_each_job_is_claimed_once(queue):
+    for i in range(20):
+        queue.add(f'job{i}', {'index': i})
+    claimed = []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        while True:
+            claim = queue.claim(worker_id)
+            if claim is None:
+                return
+            with lock:
+                claimed.append(claim.name)
+
+    threads = [threading.Thread(target=worker, args=(f'w{i}',)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(f'job{i}' for i in range(20))
+    assert queue.counts() == {'pending': 0, 'claimed': 20, 'done': 0, 'failed': 0}
+
+def test_claim_refreshes_lease(queue, monkeypatch):
+    queue.add('old', {})
+    _age(queue._path('pending', 'old'), 3600)
+    read_json = work_queue._read_json
+
+    def read_claimed(path):
+        # 读取任务记录之前租约就必须已经刷新，否则这段时间内可能被当作停滞任务放回
+        assert queue.stalled(600) == []
+        return read_json(path)
+
+    monkeypatch.setattr(work_queue, '_read_json', read_claimed)
+    claim = queue.claim('w1')
+    assert claim.job['worker'] == 'w1' and claim.job['attempts'] == 1
+    assert queue.stalled(600) == []
+
+def test_complete(queue):
+    queue.add('job', {'source': 'v1'})
+    claim = queue.claim('w1')
+    assert claim.complete({'ok': True})
+    [(name, job, _)] = queue.jobs('done')
+    assert name == 'job' and job['result'] == {'ok': True} and job['source'] == 'v1'
+
+def test_fail_retries_until_max_attempts(queue):
+    queue.add('job', {})
+    for attempt in range(1, 3):
+        claim = queue.claim('w1')
+        assert claim.job['attempts'] == attempt
+        assert claim.fail(f'error {attempt}', max_attempts=2)
+    assert queue.states() == {'job': 'failed'}
+    [(_, job, _)] = queue.jobs('failed')
+    assert [e['error'] for e in job['errors']] == ['error 1', 'error 2']
+    assert 'worker' not in job
+
+def test_requeue_stalled(queue):
+    queue.add('job', {})
+    claim = queue.claim('w1')
+    assert queue.requeue_stalled(600) == []
+
+    _age(claim.path, 3600)
+    [(name, worker, age, state)] = queue.requeue_stalled(600, max_attempts=2)
+    assert (name, worker, state) == ('job', 'w1', 'pending') and age > 600
+    # 原工作进程发现租约丢失，结果不计入
+    assert not claim.heartbeat()
+    assert not claim.complete()
+
+    claim = queue.claim('w2')
+    assert claim.job['attempts'] == 2
+    _age(claim.path, 3600)
+    assert queue.requeue_stalled(600, max_attempts=2)[0][3] == 'failed'
+    [(_, job, _)] = queue.jobs('failed')
+    assert job['errors'][0]['worker'] == 'w2'
+    assert queue.claim('w3') is None
+
+def test_lease_keeper_detects_lost_lease(queue):
+    queue.add('job', {})
+    claim = queue.claim('w1')
+    with work_queue.LeaseKeeper(claim, 0.01) as keeper:
+        time.sleep(0.05)
+        assert not keeper.lost
+        queue.remove('job')
+        deadline = time.time() + 5
+        while not keeper.lost and time.time() < deadline:
+            time.sleep(0.01)
+    assert keeper.lost
+
+def test_worker_refuses_job_missing_merge_base(git_repo, queue, tmp_path, monkeypatch):
+    git_repo.commit('a.c', 'int a;\n', 'add a')
+    git_repo.git('tag', 'v1.0')
+    git_repo.commit('b.c', 'int b;\n', 'add b')
+    git_repo.git('tag', 'v1.1')
+    monkeypatch.setattr(compare_adjacent_versions, 'run_patch_analysis',
+                        lambda *args: pytest.fail('缺少提交时不应运行分析'))
+
+    queue.add('job', {'source': 'v1.1', 'target': 'v1.0', 'source_sha': git_repo.git('rev-parse', 'v1.1'),
+                      'target_sha': git_repo.git('rev-parse', 'v1.0'), 'merge_base': '1' * 40})
+    claim = queue.claim('w1')
+    assert not compare_adjacent_versions.run_queue_job(claim, 'w1', str(tmp_path), 1, None, True, None, 600, 3)
+    [(_, job, _)] = queue.jobs('pending')
+    assert job['errors'][0]['error'] == f"本地仓库缺少提交 {'1' * 12}"
+
+def test_enqueue_records_merge_base(git_repo, queue):
+    git_repo.commit('a.c', 'int a;\n', 'add a')
+    git_repo.git('tag', 'v1.0')
+    git_repo.commit('b.c', 'int b;\n', 'add b')
+    git_repo.git('tag', 'v1.1')
+    tag_shas = {tag: git_repo.git('rev-parse', tag) for tag in ('v1.0', 'v1.1')}
+
+    assert compare_adjacent_versions.enqueue_pairs(queue, [('v1.1', 'v1.0')], tag_shas, ['xlsx'], [], [],
+                                                   None) == (1, 0)
+    [(_, job, _)] = queue.jobs('pending')
+    assert job['merge_base'] == tag_shas['v1.0']
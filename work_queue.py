@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于共享文件系统的任务队列
+
+分布式扫描时，多台主机上的工作进程只通过一个共享目录协作，不需要消息代理：
+
+    queue.json          队列配置（输出格式、分析范围、缓存设置、租约时长）
+    pending/<任务>.json  等待领取的任务
+    claimed/<任务>@<工作进程>.json  已被领取的任务
+    done/<任务>.json     已完成的任务（附带写入清单的记录）
+    failed/<任务>.json   超过重试次数仍失败的任务
+
+领取任务是把文件从 pending/ 重命名到 claimed/，目标文件名带有工作进程标识；
+同一个源文件只有一次重命名能成功（rename在POSIX和NFS上都是原子的），因此
+一个任务不会被两个进程同时领取。工作进程定期刷新领取文件的修改时间作为心跳，
+修改时间超过租约时长的任务视为停滞，由协调命令或空闲的工作进程放回 pending/，
+已达到尝试次数上限的移到 failed/。
+修改时间由文件服务器设置，判断是否超时也以在共享目录中新建的探测文件的时间为准，
+不受各主机时钟偏差的影响。
+"""
+
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+QUEUE_CONFIG_FILE = 'queue.json'
+QUEUE_STATES = ('pending', 'claimed', 'done', 'failed')
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 3
+
+def default_worker_id():
+    """工作进程标识：主机名和进程号"""
+    return safe_name(f"{socket.gethostname()}-{os.getpid()}")
+
+def safe_name(name):
+    """把任务名或工作进程标识转换为可以安全用作文件名的形式（不含@）"""
+    return re.sub(r'[^\w\-.]', '_', name)
+
+def _write_json(path, data):
+    """原子地写入JSON文件，临时文件以点开头，不会被当作任务列出"""
+    directory, name = os.path.split(path)
+    temp_path = os.path.join(directory, f".{name}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+
+def _read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+class Claim:
+    """一个已领取的任务"""
+
+    def __init__(self, queue, name, path, job):
+        self.queue = queue
+        self.name = name
+        self.path = path
+        self.job = job
+
+    def heartbeat(self):
+        """刷新租约，返回False表示任务已被放回队列（租约丢失）"""
+        try:
+            os.utime(self.path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, result=None):
+        """标记为完成，result 合并进任务记录；租约已丢失时返回False"""
+        done_path = self.queue._path('done', self.name)
+        try:
+            os.rename(self.path, done_path)
+        except FileNotFoundError:
+            return False
+        job = dict(self.job, finished_at=time.time(), result=result)
+        _write_json(done_path, job)
+        return True
+
+    def fail(self, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """记录失败：未超过重试次数时放回 pending/，否则移到 failed/；租约已丢失时返回False"""
+        state = 'pending' if self.job.get('attempts', 0) < max_attempts else 'failed'
+        errors = self.job.get('errors', []) + [{'worker': self.job.get('worker'), 'error': error}]
+        job = {k: v for k, v in self.job.items() if k not in ('worker', 'claimed_at')}
+        # 放回 pending/ 后可能立即被其他进程领取，因此先改写自己的领取文件再移动
+        if not self.heartbeat():
+            return False
+        _write_json(self.path, dict(job, errors=errors))
+        try:
+            os.rename(self.path, self.queue._path(state, self.name))
+        except FileNotFoundError:
+            return False
+        return True
+
+class LeaseKeeper:
+    """后台线程，在任务执行期间定期刷新租约"""
+
+    def __init__(self, claim, interval):
+        self.claim = claim
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.claim.heartbeat():
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+class WorkQueue:
+    """共享目录中的任务队列"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, state, name, worker=None):
+        file_name = f"{name}@{worker}.json" if worker else f"{name}.json"
+        return os.path.join(self.directory, state, file_name)
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.directory, QUEUE_CONFIG_FILE))
+
+    def init(self, config):
+        """创建队列目录并写入（或更新）队列配置"""
+        for state in QUEUE_STATES:
+            os.makedirs(os.path.join(self.directory, state), exist_ok=True)
+        _write_json(os.path.join(self.directory, QUEUE_CONFIG_FILE), config)
+
+    def load_config(self):
+        return _read_json(os.path.join(self.directory, QUEUE_CONFIG_FILE))
+
+    def _entries(self, state):
+        """列出某状态下的任务文件，返回 [(任务名, 工作进程或None, 路径)]"""
+        directory = os.path.join(self.directory, state)
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return []
+        entries = []
+        for file_name in names:
+            if file_name.startswith('.') or not file_name.endswith('.json'):
+                continue
+            name, _, worker = file_name[:-len('.json')].partition('@')
+            entries.append((name, worker or None, os.path.join(directory, file_name)))
+        return entries
+
+    def jobs(self, state):
+        """某状态下的任务，返回 [(任务名, 任务记录, 文件修改时间)]，读取时被移走的任务跳过"""
+        jobs = []
+        for name, _, path in self._entries(state):
+            try:
+                jobs.append((name, _read_json(path), os.stat(path).st_mtime))
+            except (FileNotFoundError, ValueError):
+                continue
+        return jobs
+
+    def states(self):
+        """{任务名: 状态}，同一任务同时出现在多处时（放回与完成竞争）以先列出的状态为准"""
+        states = {}
+        for state in QUEUE_STATES:
+            for name, _, _ in self._entries(state):
+                states.setdefault(name, state)
+        return states
+
+    def counts(self):
+        return {state: len(self._entries(state)) for state in QUEUE_STATES}
+
+    def add(self, name, job):
+        """加入一个待领取的任务，同名的已完成或失败记录一并清除"""
+        for state in ('done', 'failed'):
+            try:
+                os.remove(self._path(state, name))
+            except FileNotFoundError:
+                pass
+        _write_json(self._path('pending', name), dict(job, attempts=0))
+
+    def remove(self, name):
+        """从所有状态中删除一个任务（已领取的任务由其工作进程在完成时发现租约丢失）"""
+        for state in QUEUE_STATES:
+            for entry_name, _, path in self._entries(state):
+                if entry_name == name:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def claim(self, worker_id):
+        """领取一个待处理的任务，没有任务时返回None"""
+        for name, _, path in self._entries('pending'):
+            claimed_path = self._path('claimed', name, worker_id)
+            try:
+                os.rename(path, claimed_path)
+            except FileNotFoundError:
+                # 已被其他工作进程领取
+                continue
+            # rename保留文件在pending/中的修改时间，立即刷新，否则排队较久的任务刚领取就被视为停滞
+            os.utime(claimed_path)
+            job = _read_json(claimed_path)
+            job.update(worker=worker_id, claimed_at=time.time(), attempts=job.get('attempts', 0) + 1)
+            _write_json(claimed_path, job)
+            return Claim(self, name, claimed_path, job)
+        return None
+
+    def now(self):
+        """文件服务器的当前时间：新建一个探测文件并读取其修改时间"""
+        probe = os.path.join(self.directory, f".clock.{socket.gethostname()}.{os.getpid()}")
+        with open(probe, 'w'):
+            pass
+        try:
+            return os.stat(probe).st_mtime
+        finally:
+            os.remove(probe)
+
+    def stalled(self, lease_seconds):
+        """租约已过期的领取记录，返回 [(任务名, 工作进程, 距上次心跳的秒数)]"""
+        now = self.now()
+        stalled = []
+        for name, worker, path in self._entries('claimed'):
+            try:
+                age = now - os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            if age > lease_seconds:
+                stalled.append((name, worker, age))
+        return stalled
+
+    def requeue_stalled(self, lease_seconds, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """处理租约过期的任务：未达到尝试次数上限的放回 pending/，否则移到 failed/
+
+        工作进程被杀死（OOM、主机重启）或卡住时不会调用 Claim.fail，尝试次数在这里检查，
+        否则这类任务会被无限重试。返回 [(任务名, 工作进程, 距上次心跳的秒数, 新状态)]。
+        """
+        handled = []
+        for name, worker, age in self.stalled(lease_seconds):
+            claimed_path = self._path('claimed', name, worker)
+            try:
+                job = _read_json(claimed_path)
+            except (FileNotFoundError, ValueError):
+                continue
+            state = 'pending' if job.get('attempts', 0) < max_attempts else 'failed'
+            try:
+                os.rename(claimed_path, self._path(state, name))
+            except FileNotFoundError:
+                continue
+            if state == 'failed':
+                # failed/ 中的任务不会再被领取，移动后再补写错误记录
+                errors = job.get('errors', []) + [{'worker': worker, 'error': f"租约过期（{age:.0f} 秒没有心跳）"}]
+                job = {k: v for k, v in job.items() if k not in ('worker', 'claimed_at')}
+                _write_json(self._path('failed', name), dict(job, errors=errors))
+            handled.append((name, worker, age, state))
+        return handled